@@ -1,5 +1,5 @@
 #!/bin/sh
 
-WEAVE_SERVER_DEBUG=true \
+WEAVE_SERVER_DEBUG=true WEAVE_REQUEST_CAPTURE_SAMPLE_RATE=1 \
 DD_SERVICE="weave-python" DD_ENV="dev-$(whoami)" DD_LOGS_INJECTION=true \
 	WEAVE_SERVER_ENABLE_LOGGING=true FLASK_APP=weave.weave_server ddtrace-run flask run --port 9994
@@ -0,0 +1,140 @@
+# Streaming response format for /__weave/execute.
+#
+# Clients that send `Accept: application/vnd.weave.arrow-stream` get
+# ArrowWeaveList results as Arrow IPC, instead of having the server convert
+# columnar data to rows of python objects and JSON encode them. The response
+# is a sequence of frames, each:
+#
+#   uint32 big endian header length, JSON header,
+#   uint32 big endian body length, body
+#
+# Headers:
+#   {"node": i, "format": "json"}: body is the JSON encoded result of node i.
+#   {"node": i, "format": "arrow", "type": <weave type>, "last": bool}: body is
+#     the next chunk of an Arrow IPC stream with the result of node i, in a
+#     single "values" column. The stream is complete after the "last" chunk.
+#   {"format": "envelope"}: body is the JSON response envelope without data
+#     ("errors", "node_to_error", ...). Always the final frame.
+#
+# Results are written in node order, and arrow results a record batch at a
+# time, so clients can start reading before the whole response is encoded.
+
+import dataclasses
+import io
+import json
+import struct
+import typing
+
+import pyarrow as pa
+
+from . import storage
+from . import weave_types as types
+from .arrow import list_ as arrow_list
+from . import artifact_mem
+
+MIMETYPE = "application/vnd.weave.arrow-stream"
+
+ROWS_PER_BATCH = 10000
+
+
+@dataclasses.dataclass
+class ArrowResult:
+    # Untagged values, timestamps as epoch ms, like to_weavejs.
+    values: typing.Union[pa.Array, pa.ChunkedArray]
+    object_type: types.Type
+
+
+def accepts(accept_mimetypes: typing.Iterable[typing.Tuple[str, float]]) -> bool:
+    # Only when asked for explicitly, not through */*.
+    return any(mimetype == MIMETYPE and q > 0 for mimetype, q in accept_mimetypes)
+
+
+def make_serializer() -> typing.Callable[[typing.Any], typing.Any]:
+    """A serialize_fn for server.handle_request that keeps ArrowWeaveList
+    results as arrow data, and serializes everything else like
+    storage.make_js_serializer."""
+    artifact = artifact_mem.MemArtifact()
+
+    def serialize_arrow_stream(obj: typing.Any) -> typing.Any:
+        if isinstance(obj, arrow_list.ArrowWeaveList):
+            awl = arrow_list.convert_arrow_timestamp_to_epoch_ms(obj).without_tags()
+            return ArrowResult(awl._arrow_data, awl.object_type)
+        return storage.to_weavejs(obj, artifact=artifact)
+
+    return serialize_arrow_stream
+
+
+def _frame(header: dict, body: bytes) -> bytes:
+    header_bytes = json.dumps(header).encode()
+    return b"".join(
+        [
+            struct.pack(">I", len(header_bytes)),
+            header_bytes,
+            struct.pack(">I", len(body)),
+            body,
+        ]
+    )
+
+
+def _arrow_frames(node_ndx: int, result: ArrowResult) -> typing.Iterator[bytes]:
+    header = {
+        "node": node_ndx,
+        "format": "arrow",
+        "type": result.object_type.to_dict(),
+        "last": False,
+    }
+    table = pa.Table.from_arrays([result.values], names=["values"])
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        for batch in table.to_batches(max_chunksize=ROWS_PER_BATCH):
+            writer.write_batch(batch)
+            yield _frame(header, sink.getvalue())
+            sink.seek(0)
+            sink.truncate()
+    yield _frame({**header, "last": True}, sink.getvalue())
+
+
+def encode_response(
+    response: dict, fixup_fn: typing.Callable[[typing.Any], typing.Any]
+) -> typing.Iterator[bytes]:
+    """Encodes a response dict, as built for the JSON response, as frames.
+
+    fixup_fn is applied to non-arrow results before they are JSON encoded.
+    """
+    for node_ndx, val in enumerate(response["data"]):
+        if isinstance(val, ArrowResult):
+            yield from _arrow_frames(node_ndx, val)
+        else:
+            body = json.dumps(fixup_fn(val)).encode()
+            yield _frame({"node": node_ndx, "format": "json"}, body)
+    envelope = {k: v for k, v in response.items() if k != "data"}
+    yield _frame({"format": "envelope"}, json.dumps(envelope).encode())
+
+
+def decode_response(data: bytes) -> dict:
+    """Decodes a full response into the same dict as the JSON response, with
+    arrow results as python lists. Used by tests and python clients."""
+    results: dict[int, typing.Any] = {}
+    arrow_chunks: dict[int, list[bytes]] = {}
+    envelope: dict = {}
+    offset = 0
+    while offset < len(data):
+        (header_len,) = struct.unpack_from(">I", data, offset)
+        offset += 4
+        header = json.loads(data[offset : offset + header_len])
+        offset += header_len
+        (body_len,) = struct.unpack_from(">I", data, offset)
+        offset += 4
+        body = data[offset : offset + body_len]
+        offset += body_len
+        if header["format"] == "json":
+            results[header["node"]] = json.loads(body)
+        elif header["format"] == "arrow":
+            chunks = arrow_chunks.setdefault(header["node"], [])
+            chunks.append(body)
+            if header["last"]:
+                reader = pa.ipc.open_stream(b"".join(chunks))
+                results[header["node"]] = reader.read_all().column("values").to_pylist()
+        else:
+            envelope = json.loads(body)
+    return {"data": [results[i] for i in range(len(results))], **envelope}
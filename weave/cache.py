@@ -3,6 +3,7 @@ import contextlib
 import datetime
 import logging
 import shutil
+import threading
 import time
 import os
 
@@ -130,6 +131,12 @@ class LruTimeWindowCache(typing.Generic[CacheKeyType, CacheValueType]):
     """A cache that stores values for a fixed amount of time.
 
     Respects the user cache key, so that different users don't share the same cache.
+
+    If max_bytes is set, least recently used values are evicted to keep the
+    total size_fn of the cached values under it.
+
+    By default a hit restarts the value's time window. With
+    refresh_on_get=False, values expire max_age after they were set.
     """
 
     class NotFound:
@@ -141,15 +148,26 @@ class LruTimeWindowCache(typing.Generic[CacheKeyType, CacheValueType]):
         self,
         max_age: datetime.timedelta,
         now_fn: typing.Callable[[], datetime.datetime] = datetime.datetime.now,
+        max_bytes: typing.Optional[int] = None,
+        size_fn: typing.Callable[[CacheValueType], int] = lambda _: 0,
+        name: str = "cache",
+        refresh_on_get: bool = True,
     ) -> None:
         self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.nbytes = 0
         self._now_fn = now_fn
+        self._size_fn = size_fn
+        self._name = name
+        self._refresh_on_get = refresh_on_get
+        self._lock = threading.Lock()
 
         # Items are time ordered, with oldest at the front.
         self._cache: dict[
             typing.Tuple[typing.Optional[str], CacheKeyType],
             typing.Tuple[datetime.datetime, CacheValueType],
         ] = {}
+        self._sizes: dict[typing.Tuple[typing.Optional[str], CacheKeyType], int] = {}
 
     def _full_key(
         self, key: CacheKeyType
@@ -158,28 +176,50 @@ class LruTimeWindowCache(typing.Generic[CacheKeyType, CacheValueType]):
 
     def _prune(self, now: datetime.datetime) -> None:
         for key, val in list(self._cache.items()):
-            if now - val[0] > self.max_age:
+            if now - val[0] > self.max_age or (
+                self.max_bytes is not None and self.nbytes > self.max_bytes
+            ):
                 del self._cache[key]
+                self.nbytes -= self._sizes.pop(key, 0)
             else:
                 break
-        statsd.gauge("weave.cache.size", len(self._cache))
+        statsd.gauge(f"weave.{self._name}.size", len(self._cache))
 
     def get(self, key: CacheKeyType) -> typing.Union[NotFound, CacheValueType]:
         full_key = self._full_key(key)
-        val = self._cache.get(full_key)
-        if val is None:
-            statsd.increment("weave.cache.miss")
-            return self.NOT_FOUND
-        # Set the value again to move it to the end of the cache
-        self.set(key, val[1])
-        statsd.increment("weave.cache.hit")
+        with self._lock:
+            val = self._cache.get(full_key)
+            if val is not None and not self._refresh_on_get:
+                if self._now_fn() - val[0] > self.max_age:
+                    val = None
+            if val is None:
+                statsd.increment(f"weave.{self._name}.miss")
+                return self.NOT_FOUND
+            if self._refresh_on_get:
+                # Set the value again to move it to the end of the cache
+                self._set(full_key, val[1], self._sizes.get(full_key, 0))
+        statsd.increment(f"weave.{self._name}.hit")
         return val[1]
 
     def set(self, key: CacheKeyType, value: CacheValueType) -> None:
         full_key = self._full_key(key)
+        size = self._size_fn(value)
+        with self._lock:
+            self._set(full_key, value, size)
+
+    def _set(
+        self,
+        full_key: typing.Tuple[typing.Optional[str], CacheKeyType],
+        value: CacheValueType,
+        size: int,
+    ) -> None:
         now = self._now_fn()
         if full_key in self._cache:
             # Delete so we move to the end of the cache
             del self._cache[full_key]
+            self.nbytes -= self._sizes.pop(full_key, 0)
         self._cache[full_key] = (now, value)
+        if size:
+            self._sizes[full_key] = size
+            self.nbytes += size
         self._prune(now)
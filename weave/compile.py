@@ -1,5 +1,7 @@
+import dataclasses
 import re
 import random
+import time
 import typing
 
 import logging
@@ -14,6 +16,7 @@ from . import debug_compile
 from . import serialize
 from . import box
 from . import compile_domain
+from . import compile_cache
 from . import op_args
 from . import weave_types as types
 from . import graph
@@ -485,18 +488,7 @@ def compile_apply_column_pushdown(
 def compile_dedupe(
     leaf_nodes: list[graph.Node], on_error: graph.OnErrorFnType = None
 ) -> list[graph.Node]:
-    nodes: dict[str, graph.Node] = {}
-
-    def _dedupe(node: graph.Node) -> graph.Node:
-        from . import serialize
-
-        node_id = serialize.node_id(node)
-        if node_id in nodes:
-            return nodes[node_id]
-        nodes[node_id] = node
-        return node
-
-    return graph.map_nodes_full(leaf_nodes, _dedupe, on_error)
+    return graph.map_nodes_full(leaf_nodes, _compile_dedupe_map_fn(), on_error)
 
 
 def compile_fix_calls(
@@ -1057,104 +1049,240 @@ def _track_errors(fn):
     return final
 
 
-def _compile(
-    nodes: typing.List[graph.Node],
-) -> value_or_error.ValueOrErrors[graph.Node]:
-    tracer = engine_trace.tracer()
-    # logging.info("Starting compilation of graph with %s leaf nodes" % len(nodes))
+def _compile_dedupe_map_fn() -> typing.Callable[[graph.Node], graph.Node]:
+    from . import serialize
 
-    results = value_or_error.ValueOrErrors.from_values(nodes)
+    nodes: dict[str, graph.Node] = {}
 
+    def _dedupe(node: graph.Node) -> graph.Node:
+        node_id = serialize.node_id(node)
+        if node_id in nodes:
+            return nodes[node_id]
+        nodes[node_id] = node
+        return node
+
+    return _dedupe
+
+
+@dataclasses.dataclass
+class CompilePass:
+    name: str
+    run: typing.Callable[
+        [typing.List[graph.Node], graph.OnErrorFnType], typing.List[graph.Node]
+    ]
+    # Passes that must have run over the whole graph first.
+    after: typing.Tuple[str, ...] = ()
+    # For passes that are a single map_nodes_full walk whose rewrite of a node
+    # only looks at the node and its inputs, returns a fresh map fn for one
+    # run. Adjacent fusable passes run in one walk of the graph.
+    make_map_fn: typing.Optional[
+        typing.Callable[[], typing.Callable[[graph.Node], typing.Optional[graph.Node]]]
+    ] = None
+
+
+def _fixed_map_fn(
+    map_fn: typing.Callable[[graph.Node], typing.Optional[graph.Node]]
+) -> typing.Callable[[], typing.Callable[[graph.Node], typing.Optional[graph.Node]]]:
+    return lambda: map_fn
+
+
+COMPILE_PASSES: typing.List[CompilePass] = [
     # If we're being called from WeaveJS, we need to use dispatch to determine
     # which ops to use. Critically, this first phase does not actually refine
     # op output types, so after this, the types in the graph are not yet correct.
-    with tracer.trace("compile:fix_calls"):
-        results = results.batch_map(_track_errors(compile_fix_calls))
-
+    CompilePass("fix_calls", compile_fix_calls),
     # Auto-transforms, where we insert operations to convert between types
     # as needed.
     # TODO: is it ok to have this before final refine?
-    with tracer.trace("compile:await"):
-        results = results.batch_map(_track_errors(compile_await))
-    with tracer.trace("compile:execute"):
-        results = results.batch_map(_track_errors(compile_execute))
-    with tracer.trace("compile:function_calls"):
-        results = results.batch_map(_track_errors(compile_function_calls))
-    with tracer.trace("compile:quote"):
-        # Mission critical to call `compile:quote` before and node re-writing
-        # compilers such as compile:node_ops and compile:gql. Why?:
-        #
-        # It is useful to define a "static lambda". A "static lambda" is a const
-        # node of type function with no inputs. This is used in our system to
-        # represent a constant value which is a node. Useful for generating
-        # boards or any sort of op that operates on nodes themselves.
-        #
-        # Moreover, this compile step will automatically "quote" inputs to ops
-        # that expect node inputs - effectively making static lambdas when
-        # called for.
-        #
-        # Furthermore, it is important to know that stream table rows (and many
-        # other ops) now support expansion (meaning they get expanded into a
-        # chain of new nodes in the compile pass).
-        #
-        # Conceptually, this created an issue: Compile passes that mutate nodes
-        # (eg node expansion or gql compile) would modify the quoted node. But,
-        # these functions that consume nodes do not want modified nodes.
-        # Instead, we want the raw node that the caller intended. For this
-        # reason we should always call compile:quote before any node re-writing.
-        results = results.batch_map(_track_errors(compile_quote))
-
-    with tracer.trace("compile:static_function_types"):
-        results = results.batch_map(_track_errors(compile_static_function_types))
-
+    CompilePass(
+        "await",
+        compile_await,
+        after=("fix_calls",),
+        make_map_fn=_fixed_map_fn(_await_run_outputs_map_fn),
+    ),
+    CompilePass(
+        "execute",
+        compile_execute,
+        after=("fix_calls",),
+        make_map_fn=_fixed_map_fn(_execute_nodes_map_fn),
+    ),
+    CompilePass(
+        "function_calls",
+        compile_function_calls,
+        after=("fix_calls",),
+        make_map_fn=_fixed_map_fn(_resolve_function_calls),
+    ),
+    # Mission critical to call `compile:quote` before and node re-writing
+    # compilers such as compile:node_ops and compile:gql. Why?:
+    #
+    # It is useful to define a "static lambda". A "static lambda" is a const
+    # node of type function with no inputs. This is used in our system to
+    # represent a constant value which is a node. Useful for generating
+    # boards or any sort of op that operates on nodes themselves.
+    #
+    # Moreover, this compile step will automatically "quote" inputs to ops
+    # that expect node inputs - effectively making static lambdas when
+    # called for.
+    #
+    # Furthermore, it is important to know that stream table rows (and many
+    # other ops) now support expansion (meaning they get expanded into a
+    # chain of new nodes in the compile pass).
+    #
+    # Conceptually, this created an issue: Compile passes that mutate nodes
+    # (eg node expansion or gql compile) would modify the quoted node. But,
+    # these functions that consume nodes do not want modified nodes.
+    # Instead, we want the raw node that the caller intended. For this
+    # reason we should always call compile:quote before any node re-writing.
+    CompilePass(
+        "quote",
+        compile_quote,
+        after=("fix_calls",),
+        make_map_fn=_fixed_map_fn(_quote_nodes_map_fn),
+    ),
+    CompilePass(
+        "static_function_types",
+        compile_static_function_types,
+        after=("quote",),
+        make_map_fn=_fixed_map_fn(_static_function_types),
+    ),
     # Some ops require const input nodes. This pass executes any branches necessary
     # to ensure that requirement holds.
     # Only gql ops require this for now.
-    with tracer.trace("compile:resolve_required_consts"):
-        results = results.batch_map(_track_errors(compile_resolve_required_consts))
-
-    with tracer.trace("compile:node_ops"):
-        results = results.batch_map(_track_errors(compile_node_ops))
-
-    with tracer.trace("compile:simple_optimizations"):
-        # Simple Optimizations should happen after `node_ops` to ensure we operate on
-        # the expanded nodes.
-        results = results.batch_map(_track_errors(compile_simple_optimizations))
-
+    CompilePass(
+        "resolve_required_consts", compile_resolve_required_consts, after=("quote",)
+    ),
+    CompilePass("node_ops", compile_node_ops, after=("quote",)),
+    # Simple Optimizations should happen after `node_ops` to ensure we operate on
+    # the expanded nodes.
+    CompilePass(
+        "simple_optimizations",
+        compile_simple_optimizations,
+        after=("node_ops",),
+        make_map_fn=_fixed_map_fn(_simple_optimizations),
+    ),
     # The node ops phase above can expand nodes, leading to new nodes in the graph
     # that are potentially duplicates of others. dedupe will merge these nodes.
-    with tracer.trace("compile:dedupe"):
-        results = results.batch_map(_track_errors(compile_dedupe))
-
+    CompilePass(
+        "dedupe",
+        compile_dedupe,
+        after=("node_ops",),
+        make_map_fn=_compile_dedupe_map_fn,
+    ),
     # Stitch is used in stages following this one. Stitch requires that lambdas
     # are unique in memory if they are arguments to unique ops. We can receive
     # graphs that violate this requirement, and dedupe will happily merge lambdas
     # even if they are used in different ops. lambda_uniqueness pulls them back
     # apart.
-    with tracer.trace("compile:lambda_uniqueness"):
-        results = results.batch_map(_track_errors(compile_lambda_uniqueness))
-
+    CompilePass("lambda_uniqueness", compile_lambda_uniqueness, after=("dedupe",)),
     # Now that we have the correct calls, we can do our forward-looking pushdown
     # optimizations. These do not depend on having correct types in the graph.
-
-    with tracer.trace("compile:gql_query"):
-        results = results.batch_map(
-            _track_errors(compile_domain.apply_domain_op_gql_translation)
-        )
-
-    with tracer.trace("compile:initialize_gql_types"):
-        results = results.batch_map(_track_errors(compile_initialize_gql_types))
-
-    with tracer.trace("compile:column_pushdown"):
-        results = results.batch_map(_track_errors(compile_apply_column_pushdown))
-
+    CompilePass(
+        "gql_query",
+        compile_domain.apply_domain_op_gql_translation,
+        after=("quote", "lambda_uniqueness"),
+    ),
+    CompilePass(
+        "initialize_gql_types", compile_initialize_gql_types, after=("gql_query",)
+    ),
+    CompilePass("column_pushdown", compile_apply_column_pushdown, after=("gql_query",)),
     # Final refine, to ensure the graph types are exactly what Weave python
     # produces. This phase can execute parts of the graph. It's very important
     # that this is the final phase, so that when we execute the rest of the
     # graph, we reuse any results produced in this phase, instead of re-executing
     # those nodes.
-    with tracer.trace("compile:refine_and_propagate_gql"):
-        results = results.batch_map(_track_errors(compile_refine_and_propagate_gql))
+    CompilePass(
+        "refine_and_propagate_gql",
+        compile_refine_and_propagate_gql,
+        after=("initialize_gql_types", "column_pushdown"),
+    ),
+]
+
+
+def _check_pass_order(passes: typing.List[CompilePass]) -> None:
+    seen: set[str] = set()
+    for compile_pass in passes:
+        missing = [name for name in compile_pass.after if name not in seen]
+        if missing:
+            raise errors.WeaveInternalError(
+                "Compile pass %s must run after %s" % (compile_pass.name, missing)
+            )
+        seen.add(compile_pass.name)
+
+
+_check_pass_order(COMPILE_PASSES)
+
+
+def _fused_passes_runner(
+    passes: typing.List[CompilePass], span: typing.Any
+) -> typing.Callable[
+    [typing.List[graph.Node], graph.OnErrorFnType], typing.List[graph.Node]
+]:
+    def run(
+        nodes: typing.List[graph.Node], on_error: graph.OnErrorFnType = None
+    ) -> typing.List[graph.Node]:
+        visits = [0] * len(passes)
+        seconds = [0.0] * len(passes)
+
+        def timed(
+            i: int, map_fn: typing.Callable[[graph.Node], typing.Optional[graph.Node]]
+        ) -> typing.Callable[[graph.Node], typing.Optional[graph.Node]]:
+            def timed_map_fn(node: graph.Node) -> typing.Optional[graph.Node]:
+                start_time = time.perf_counter()
+                try:
+                    return map_fn(node)
+                finally:
+                    visits[i] += 1
+                    seconds[i] += time.perf_counter() - start_time
+
+            return timed_map_fn
+
+        map_fns = [
+            timed(i, typing.cast(typing.Callable, p.make_map_fn)())
+            for i, p in enumerate(passes)
+        ]
+        try:
+            return graph.map_nodes_full_fused(nodes, map_fns, on_error)
+        finally:
+            for i, compile_pass in enumerate(passes):
+                span.set_metric("%s.visits" % compile_pass.name, visits[i])
+                span.set_metric("%s.seconds" % compile_pass.name, seconds[i])
+
+    return run
+
+
+def _run_passes(
+    passes: typing.List[CompilePass],
+    results: value_or_error.ValueOrErrors[graph.Node],
+) -> value_or_error.ValueOrErrors[graph.Node]:
+    tracer = engine_trace.tracer()
+    i = 0
+    while i < len(passes):
+        group = [passes[i]]
+        if passes[i].make_map_fn is not None:
+            while i + len(group) < len(passes) and (
+                passes[i + len(group)].make_map_fn is not None
+            ):
+                group.append(passes[i + len(group)])
+        i += len(group)
+        if len(group) == 1:
+            with tracer.trace("compile:%s" % group[0].name):
+                results = results.batch_map(_track_errors(group[0].run))
+        else:
+            name = "compile:" + "+".join(p.name for p in group)
+            with tracer.trace(name) as span:
+                results = results.batch_map(
+                    _track_errors(_fused_passes_runner(group, span))
+                )
+    return results
+
+
+def _compile(
+    nodes: typing.List[graph.Node],
+) -> value_or_error.ValueOrErrors[graph.Node]:
+    # logging.info("Starting compilation of graph with %s leaf nodes" % len(nodes))
+
+    results = value_or_error.ValueOrErrors.from_values(nodes)
+    results = _run_passes(COMPILE_PASSES, results)
 
     # This is very expensive!
     # loggable_nodes = graph_debug.combine_common_nodes(n)
@@ -1212,4 +1340,25 @@ def compile(
     if _is_compiling():
         return value_or_error.ValueOrErrors.from_values(nodes)
     with disable_compile():
+        return _compile_cached(nodes)
+
+
+def _compile_cached(
+    nodes: typing.List[graph.Node],
+) -> value_or_error.ValueOrErrors[graph.Node]:
+    plan_cache = compile_cache.plan_cache()
+    if plan_cache is None:
         return _compile(nodes)
+    tracer = engine_trace.tracer()
+    with tracer.trace("compile:plan_cache_get"):
+        key = compile_cache.PlanKey.from_nodes(nodes)
+        compiled = plan_cache.get(key)
+    if compiled is not None:
+        return value_or_error.ValueOrErrors.from_values(compiled)
+    with compile_cache.record_executions() as recorder:
+        results = _compile(nodes)
+    # Graphs that executed while compiling were refined with data that may
+    # change, and graphs with errors are recompiled to report them again.
+    if not recorder.executed and all(err is None for _, err in results.iter_items()):
+        plan_cache.set(key, [node for node, _ in results.iter_items()])
+    return results
@@ -0,0 +1,244 @@
+# Process level cache of compiled graphs.
+#
+# Dashboards re-send the same graphs every few seconds, often with nothing but
+# a number (a limit, a step, a timestamp) changed. Compiling only depends on
+# the structure of the graph, the types of its consts, and the values of
+# consts that compile bakes into the result (gql queries, for example). So we
+# key compiled graphs by structure and swap the current request's consts into
+# the cached result.
+#
+# Compile may also execute parts of the graph to refine types. Those results
+# depend on data rather than on the graph, so graphs that execute anything
+# while compiling are never cached.
+
+import collections
+import contextlib
+import contextvars
+import dataclasses
+import hashlib
+import json
+import threading
+import typing
+
+from . import context_state
+from . import engine_trace
+from . import environment
+from . import graph
+from . import registry_mem
+from . import serialize
+from . import weave_types as types
+
+statsd = engine_trace.statsd()  # type: ignore
+
+# Dispatch and output types don't depend on the values of these consts, so
+# their values are plan parameters unless compile bakes them into the plan.
+_PARAMETER_TYPES = (types.Number, types.Int, types.Float, types.Timestamp)
+
+# Plans with the same structure that bake in different const values.
+MAX_PLANS_PER_KEY = 4
+
+
+def _is_lambda(node: graph.ConstNode) -> bool:
+    return isinstance(node.type, types.Function) and isinstance(node.val, graph.Node)
+
+
+def _is_static_lambda(node: graph.ConstNode) -> bool:
+    # map_nodes_full does not walk into lambdas without inputs
+    return typing.cast(types.Function, node.type).input_types == {}
+
+
+@dataclasses.dataclass
+class PlanKey:
+    key: str
+    # The graph's consts, other than lambdas, in graph walk order.
+    consts: list[graph.ConstNode]
+
+    @classmethod
+    def from_nodes(cls, nodes: list[graph.Node]) -> "PlanKey":
+        consts: list[graph.ConstNode] = []
+        ids: dict[int, str] = {}
+        for node in graph.all_nodes_full(nodes):
+            hashable: typing.Any
+            if isinstance(node, graph.OutputNode):
+                hashable = {
+                    "op_name": node.from_op.name,
+                    "inputs": {
+                        name: ids[id(input_node)]
+                        for name, input_node in node.from_op.inputs.items()
+                    },
+                }
+            elif isinstance(node, graph.ConstNode) and _is_lambda(node):
+                if _is_static_lambda(node):
+                    ids[id(node)] = serialize.node_id(node)
+                    continue
+                hashable = {"lambda": ids[id(node.val)], "type": node.type.to_dict()}
+            elif isinstance(node, graph.ConstNode):
+                # The index tells apart a const used in two places from two
+                # consts that happen to be equal.
+                hashable = {"const": len(consts), "type": node.type.to_dict()}
+                if type(node.type) not in _PARAMETER_TYPES:
+                    hashable["val"] = serialize.node_id(node)
+                consts.append(node)
+            else:
+                ids[id(node)] = serialize.node_id(node)
+                continue
+            ids[id(node)] = hashlib.md5(json.dumps(hashable).encode()).hexdigest()
+        hashable = {
+            "nodes": [ids[id(node)] for node in nodes],
+            "client_cache_key": context_state.get_client_cache_key(),
+        }
+        return cls(hashlib.md5(json.dumps(hashable).encode()).hexdigest(), consts)
+
+
+@dataclasses.dataclass
+class _Plan:
+    compiled: list[graph.Node]
+    # For each of the key's consts, the same const in the compiled graph, or
+    # None if compile replaced it.
+    slots: list[typing.Optional[graph.ConstNode]]
+    # node_id of each parameter const that compile replaced, so its value is
+    # part of the plan. None for everything else.
+    baked: list[typing.Optional[str]]
+
+    @classmethod
+    def make(cls, key: PlanKey, compiled: list[graph.Node]) -> "_Plan":
+        compiled_consts = {
+            id(n)
+            for n in graph.all_nodes_full(compiled)
+            if isinstance(n, graph.ConstNode)
+        }
+        slots: list[typing.Optional[graph.ConstNode]] = []
+        baked: list[typing.Optional[str]] = []
+        for const in key.consts:
+            survived = id(const) in compiled_consts
+            slots.append(const if survived else None)
+            if not survived and type(const.type) in _PARAMETER_TYPES:
+                baked.append(serialize.node_id(const))
+            else:
+                baked.append(None)
+        return cls(compiled, slots, baked)
+
+    def matches(self, key: PlanKey) -> bool:
+        return all(
+            baked is None or serialize.node_id(const) == baked
+            for const, baked in zip(key.consts, self.baked)
+        )
+
+    def bind(self, key: PlanKey) -> list[graph.Node]:
+        # Swap in the request's consts. Even consts with the same value are
+        # swapped, their tags live in the current request's tag store.
+        replacements: dict[int, graph.Node] = {
+            id(slot): const
+            for slot, const in zip(self.slots, key.consts)
+            if slot is not None and slot is not const
+        }
+        if not replacements:
+            return list(self.compiled)
+        return graph.map_nodes_full(
+            self.compiled, lambda n: replacements.get(id(n))  # type: ignore
+        )
+
+
+class PlanCache:
+    """Compiled graphs by PlanKey, least recently used evicted first.
+
+    Cleared whenever the op registry changes, since dispatch may then resolve
+    ops differently.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._plans: collections.OrderedDict[
+            str, list[_Plan]
+        ] = collections.OrderedDict()
+        self._registry_updated_at = registry_mem.memory_registry.updated_at()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+    def _check_registry(self) -> None:
+        updated_at = registry_mem.memory_registry.updated_at()
+        if updated_at != self._registry_updated_at:
+            self._plans.clear()
+            self._registry_updated_at = updated_at
+
+    def get(self, key: PlanKey) -> typing.Optional[list[graph.Node]]:
+        with self._lock:
+            self._check_registry()
+            plans = self._plans.get(key.key)
+            plan = None
+            if plans is not None:
+                self._plans.move_to_end(key.key)
+                plan = next((p for p in plans if p.matches(key)), None)
+        if plan is None:
+            statsd.increment("weave.compile_plan_cache.miss")
+            return None
+        statsd.increment("weave.compile_plan_cache.hit")
+        return plan.bind(key)
+
+    def set(self, key: PlanKey, compiled: list[graph.Node]) -> None:
+        plan = _Plan.make(key, compiled)
+        with self._lock:
+            self._check_registry()
+            plans = self._plans.setdefault(key.key, [])
+            self._plans.move_to_end(key.key)
+            plans.insert(0, plan)
+            del plans[MAX_PLANS_PER_KEY:]
+            while len(self._plans) > self.max_size:
+                self._plans.popitem(last=False)
+            statsd.gauge("weave.compile_plan_cache.size", len(self._plans))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._plans.clear()
+
+
+_PLAN_CACHE: typing.Optional[PlanCache] = None
+_PLAN_CACHE_LOCK = threading.Lock()
+
+
+def plan_cache() -> typing.Optional[PlanCache]:
+    global _PLAN_CACHE
+    max_size = environment.compile_plan_cache_size()
+    if max_size <= 0:
+        return None
+    with _PLAN_CACHE_LOCK:
+        if _PLAN_CACHE is None or _PLAN_CACHE.max_size != max_size:
+            _PLAN_CACHE = PlanCache(max_size)
+        return _PLAN_CACHE
+
+
+def clear_plan_cache() -> None:
+    with _PLAN_CACHE_LOCK:
+        cache = _PLAN_CACHE
+    if cache is not None:
+        cache.clear()
+
+
+class ExecutionRecorder:
+    def __init__(self) -> None:
+        self.executed = False
+
+
+_execution_recorder: contextvars.ContextVar[
+    typing.Optional[ExecutionRecorder]
+] = contextvars.ContextVar("_execution_recorder", default=None)
+
+
+@contextlib.contextmanager
+def record_executions() -> typing.Iterator[ExecutionRecorder]:
+    recorder = ExecutionRecorder()
+    token = _execution_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _execution_recorder.reset(token)
+
+
+def note_execution() -> None:
+    # Called by execute_nodes. Anything executed while compiling makes the
+    # compiled graph depend on data.
+    recorder = _execution_recorder.get()
+    if recorder is not None:
+        recorder.executed = True
@@ -19,6 +19,7 @@ from . import logs
 from . import io_service
 from . import logs
 from . import environment
+from . import trace_local
 import logging
 
 from flask.testing import FlaskClient
@@ -118,6 +119,7 @@ def pre_post_each_test(test_artifact_dir, caplog):
     except (FileNotFoundError, OSError):
         pass
     os.environ["WEAVE_LOCAL_ARTIFACT_DIR"] = test_artifact_dir
+    trace_local.clear_run_output_cache()
     with isolated_tagging_context():
         yield
     del os.environ["WEAVE_LOCAL_ARTIFACT_DIR"]
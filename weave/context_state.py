@@ -240,7 +240,7 @@ def set_client_cache_key(key: typing.Optional[str] = None):
         _client_cache_key.reset(token)
 
 
-def get_client_cache_key():
+def get_client_cache_key() -> typing.Optional[str]:
     return _client_cache_key.get()
 
 
@@ -131,6 +131,7 @@ def arrow_op(
     pure=True,
     all_args_nullable: bool = True,
     plugins=None,
+    resolve_batch=None,
 ) -> typing.Callable[[typing.Any], op_def.OpDef]:
     """An arrow op is an op that should obey element-based tag-flow map rules. An arrow op must
 
@@ -163,4 +164,5 @@ def arrow_op(
         pure=pure,
         _op_def_class=op_def.AutoTagHandlingArrowOpDef,
         plugins=plugins,
+        resolve_batch=resolve_batch,
     )  # type: ignore
@@ -59,6 +59,10 @@ def op(
     # op graph. The compile node_ops pass will expand the node to the weavified
     # version, instead of executing the original python resolver body.
     weavify: bool = False,
+    # Optional resolver for many calls at once. It receives a list of kwargs
+    # dicts, one per call, and must return a list of results in the same order.
+    # The executor uses it for same-op nodes that are ready at the same time.
+    resolve_batch: Optional[Callable[[list[dict[str, typing.Any]]], list]] = None,
 ) -> Callable[[Callable[P, R]], Callable[P, R]]:
     """Decorator for declaring an op.
 
@@ -108,6 +112,7 @@ def op(
             pure=pure,
             plugins=plugins,
             mutation=mutation,
+            resolve_batch_fn=resolve_batch,
         )
         if weavify:
             from .weavify import op_to_weave_fn
@@ -247,6 +247,31 @@ def num_gql_timeout_retries() -> int:
     return int(raw)
 
 
+# Seconds that wbgqlquery results are shared across requests. 0 (the default)
+# disables the shared cache.
+def gql_response_cache_ttl_sec() -> float:
+    raw = util.parse_number_env_var("WEAVE_GQL_RESPONSE_CACHE_TTL_SEC")
+    if raw is None:
+        return 0
+    return float(raw)
+
+
+def gql_response_cache_max_bytes() -> int:
+    raw = util.parse_number_env_var("WEAVE_GQL_RESPONSE_CACHE_MAX_BYTES")
+    if raw is None:
+        return 100 * 1024 * 1024
+    return int(raw)
+
+
+# Connections kept open to the W&B API, shared by all GQL queries in the
+# process.
+def wandb_api_max_connections() -> int:
+    raw = util.parse_number_env_var("WEAVE_WANDB_API_MAX_CONNECTIONS")
+    if raw is None:
+        return 50
+    return int(raw)
+
+
 def usage_analytics_enabled() -> bool:
     return _env_as_bool(WANDB_ERROR_REPORTING, default="True") and _env_as_bool(
         WEAVE_USAGE_ANALYTICS, default="True"
@@ -267,3 +292,91 @@ def env_is_ci() -> bool:
 
 def disable_weave_pii() -> bool:
     return os.getenv("DISABLE_WEAVE_PII", "false").strip().lower() == "true"
+
+
+# Number of worker threads in the process-wide pool used by parallelism.py.
+# Nested parallel work shares this pool, so it bounds the total number of
+# threads used for parallel execution in the process.
+def parallelism_pool_size() -> int:
+    raw = util.parse_number_env_var("WEAVE_PARALLELISM_POOL_SIZE")
+    if raw is None:
+        return 32
+    return max(int(raw), 1)
+
+
+# Upper bound on the size of the values memoized by memo.memo during one
+# request, least recently used values are evicted first.
+def memo_max_bytes() -> int:
+    raw = util.parse_number_env_var("WEAVE_MEMO_MAX_BYTES")
+    if raw is None:
+        return 512 * 1024 * 1024
+    return int(raw)
+
+
+# Upper bound on the size of the deserialized run outputs that trace_local keeps
+# in memory, shared across requests. 0 disables the cache.
+def run_output_cache_max_bytes() -> int:
+    raw = util.parse_number_env_var("WEAVE_RUN_OUTPUT_CACHE_MAX_BYTES")
+    if raw is None:
+        return 256 * 1024 * 1024
+    return int(raw)
+
+
+# Number of distinct graphs whose compiled form is kept in memory, shared across
+# requests. 0 disables the cache.
+def compile_plan_cache_size() -> int:
+    raw = util.parse_number_env_var("WEAVE_COMPILE_PLAN_CACHE_SIZE")
+    if raw is None:
+        return 1000
+    return int(raw)
+
+
+# Concurrent identical execute requests share one execution, see
+# request_coalescing.py.
+def request_coalescing_enabled() -> bool:
+    return not util.parse_boolean_env_var("WEAVE_DISABLE_REQUEST_COALESCING")
+
+
+# Seconds that a coalesced request's result is reused by identical requests
+# after it is done. 0 only shares results between concurrent requests.
+def request_result_ttl_sec() -> float:
+    raw = util.parse_number_env_var("WEAVE_REQUEST_RESULT_TTL_SEC")
+    if raw is None:
+        return 0
+    return float(raw)
+
+
+# Fraction of execute requests written to the request capture file, see
+# request_capture.py.
+def request_capture_sample_rate() -> float:
+    raw = util.parse_number_env_var("WEAVE_REQUEST_CAPTURE_SAMPLE_RATE")
+    if raw is None:
+        return 0
+    return float(raw)
+
+
+# Also capture execute requests sent with the x-weave-capture-request header.
+def request_capture_on_header() -> bool:
+    return util.parse_boolean_env_var("WEAVE_REQUEST_CAPTURE_ON_HEADER")
+
+
+# Defaults to a per process file in the weave log dir.
+def request_capture_path() -> typing.Optional[str]:
+    return os.getenv("WEAVE_REQUEST_CAPTURE_PATH")
+
+
+# The capture file is rotated once it reaches this size.
+def request_capture_max_bytes() -> int:
+    raw = util.parse_number_env_var("WEAVE_REQUEST_CAPTURE_MAX_BYTES")
+    if raw is None:
+        return 100 * 1024 * 1024
+    return int(raw)
+
+
+# Parallel ranged GETs used to download each artifact file. 1 downloads files
+# with a single GET.
+def download_range_workers() -> int:
+    raw = util.parse_number_env_var("WEAVE_DOWNLOAD_RANGE_WORKERS")
+    if raw is None:
+        return 1
+    return max(int(raw), 1)
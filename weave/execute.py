@@ -1,8 +1,10 @@
 import logging
+import collections
+import concurrent.futures
 import contextlib
+import dataclasses
 import contextvars
 from collections.abc import Mapping
-import itertools
 import pprint
 import time
 import threading
@@ -22,6 +24,7 @@ from . import value_or_error
 
 # Planner/Compiler
 from . import compile
+from . import compile_cache
 from . import forward_graph
 from . import graph
 from . import graph_debug
@@ -183,6 +186,7 @@ def get_top_level_stats() -> typing.Optional[ExecuteStats]:
 
 
 def execute_nodes(nodes, no_cache=False) -> value_or_error.ValueOrErrors[typing.Any]:
+    compile_cache.note_execution()
     tracer = engine_trace.tracer()
     with tracer.trace("execute-log-graph"):
         logging.info(
@@ -199,7 +203,7 @@ def execute_nodes(nodes, no_cache=False) -> value_or_error.ValueOrErrors[typing.
         )
 
     with wandb_api.from_environment():
-        with memo.memo_storage():
+        with memo.memo_storage(), trace_local.value_digests():
             with tag_store.isolated_tagging_context():
                 # Compile can recursively call execute_nodes during the final
                 # refine phase. We are careful in compile to ensure that the nodes that
@@ -258,155 +262,274 @@ def execute_nodes(nodes, no_cache=False) -> value_or_error.ValueOrErrors[typing.
     return res
 
 
-def execute_forward(fg: forward_graph.ForwardGraph, no_cache=False) -> ExecuteStats:
-    to_run = fg.roots
+_EMPTY_REPORT: "NodeExecutionReport" = {
+    "cache_used": False,
+    "already_executed": False,
+    "bytes_read_to_arrow": 0,
+}
 
-    stats = ExecuteStats()
-    tracer = engine_trace.tracer()
-    while len(to_run):
-        running_now = list(to_run)
-        to_run = {}
 
-        def _key(n):
-            return n.node.from_op.name
+def _node_tag_scope(
+    forward_node: forward_graph.ForwardNode,
+) -> typing.ContextManager[None]:
+    return tag_store.set_curr_node(
+        id(forward_node.node),
+        [id(input_node) for input_node in forward_node.node.from_op.inputs.values()],
+    )
 
-        groups = itertools.groupby(sorted(running_now, key=_key), key=_key)
 
-        parallel_budget = parallelism.get_parallel_budget()
+def _uses_object_context(
+    op_def: op_def.OpDef, forward_node: forward_graph.ForwardNode
+) -> bool:
+    # Lambdas and async functions do not use object_context (object caching
+    # and mutational transactions).
+    return not (
+        op_def.is_async
+        or (
+            any(
+                isinstance(input_node.type, types.Function)
+                for input_node in forward_node.node.from_op.inputs.values()
+            )
+            and not op_def.mutation
+        )
+    )
 
-        for op_name, group_iter in groups:
-            group = list(group_iter)
-            op_def = registry_mem.memory_registry.get_op(op_name)
-            if (
-                parallel_budget != 1
-                and len(group) > 1
-                and op_policy.should_run_in_parallel(op_name)
-            ):
-                # Parallel threaded case
-                num_threads = min(len(group), parallel_budget)
-                remaining_budget_per_thread = (
-                    parallelism.get_remaining_budget_per_thread(len(group))
-                )
 
-                def do_one(
-                    x,
-                ) -> typing.Tuple[
-                    forward_graph.ForwardNode,
-                    NodeExecutionReport,
-                    float,
-                ]:
-                    # TODO: I don't think this handles tags correctly.
-                    start_time = time.time()
-                    try:
-                        result_report = execute_forward_node(fg, x, no_cache)
-                    except Exception as e:
-                        x.set_result(forward_graph.ErrorResult(e))
-                        result_report = {
-                            "cache_used": False,
-                            "already_executed": False,
-                            "bytes_read_to_arrow": 0,
-                        }
-                    return (
-                        x,
-                        result_report,
-                        time.time() - start_time,
-                    )
+def _execute_forward_node_in_thread(
+    fg: forward_graph.ForwardGraph,
+    forward_node: forward_graph.ForwardNode,
+    no_cache: bool,
+) -> typing.Tuple["NodeExecutionReport", float]:
+    # The tag store is carried over from the scheduling thread by
+    # parallelism.ExecutionContextSnapshot, so we can scope tags to this node
+    # just like the in process case does.
+    start_time = time.time()
+    try:
+        with _node_tag_scope(forward_node):
+            result_report = execute_forward_node(fg, forward_node, no_cache)
+    except Exception as e:
+        forward_node.set_result(forward_graph.ErrorResult(e))
+        result_report = _EMPTY_REPORT
+    return result_report, time.time() - start_time
 
-                logging.info(
-                    "Running %s on %s threads with %s remaining parallel budget each"
-                    % (op_name, num_threads, remaining_budget_per_thread)
-                )
 
-                for (
-                    fn,
-                    report,
-                    duration,
-                ) in parallelism.do_in_parallel(do_one, group):
-                    stats.add_node(
-                        fn.node,
-                        duration,
-                        report["cache_used"],
-                        report.get("already_executed") or False,
-                        report["bytes_read_to_arrow"],
-                    )
+def _execute_forward_node_in_process(
+    fg: forward_graph.ForwardGraph,
+    forward_node: forward_graph.ForwardNode,
+    no_cache: bool,
+) -> typing.Tuple["NodeExecutionReport", float]:
+    tracer = engine_trace.tracer()
+    op_def = registry_mem.memory_registry.get_op(forward_node.node.from_op.name)
+    start_time = time.time()
+    span = None
+    if isinstance(forward_node.node, graph.OutputNode):
+        span = tracer.trace("op.%s" % graph.op_full_name(forward_node.node.from_op))
+    try:
+        with _node_tag_scope(forward_node):
+            if _uses_object_context(op_def, forward_node):
+                with object_context.object_context():
+                    report = execute_forward_node(fg, forward_node, no_cache=no_cache)
+            else:
+                report = execute_forward_node(fg, forward_node, no_cache=no_cache)
+
+    except Exception as e:
+        logging.info(
+            "Exception during execution of: %s\n%s"
+            % (
+                graph_debug.node_expr_str_full(forward_node.node),
+                traceback.format_exc(),
+            )
+        )
+        if value_or_error.DEBUG:
+            raise
+        forward_node.set_result(forward_graph.ErrorResult(e))
+        report = _EMPTY_REPORT
+    finally:
+        if span is not None:
+            span.finish()
+
+    if span is not None:
+        span.set_metric(
+            "bytes_read_to_arrow",
+            report["bytes_read_to_arrow"],
+            True,
+        )
+    return report, time.time() - start_time
+
 
+def _execute_forward_nodes_in_process_batch(
+    fg: forward_graph.ForwardGraph,
+    forward_nodes: list[forward_graph.ForwardNode],
+    no_cache: bool,
+) -> list[typing.Tuple["NodeExecutionReport", float]]:
+    tracer = engine_trace.tracer()
+    op_def = registry_mem.memory_registry.get_op(forward_nodes[0].node.from_op.name)
+    start_time = time.time()
+    span = tracer.trace("op.%s" % graph.op_full_name(forward_nodes[0].node.from_op))
+    reports: list[NodeExecutionReport]
+    try:
+        if any(_uses_object_context(op_def, fn) for fn in forward_nodes):
+            with object_context.object_context():
+                reports = execute_forward_nodes_batch(fg, forward_nodes, no_cache)
+        else:
+            reports = execute_forward_nodes_batch(fg, forward_nodes, no_cache)
+    except Exception as e:
+        logging.info(
+            "Exception during batch execution of %s nodes, first: %s\n%s"
+            % (
+                len(forward_nodes),
+                graph_debug.node_expr_str_full(forward_nodes[0].node),
+                traceback.format_exc(),
+            )
+        )
+        if value_or_error.DEBUG:
+            raise
+        reports = []
+        for forward_node in forward_nodes:
+            if not forward_node.has_result:
+                forward_node.set_result(forward_graph.ErrorResult(e))
+            reports.append(_EMPTY_REPORT)
+    finally:
+        span.finish()
+
+    span.set_metric(
+        "bytes_read_to_arrow",
+        sum(report["bytes_read_to_arrow"] for report in reports),
+        True,
+    )
+    # We don't know how long each node took, so split the time evenly.
+    duration = (time.time() - start_time) / len(forward_nodes)
+    return [(report, duration) for report in reports]
+
+
+def _pop_ready_group(
+    ready: collections.deque[forward_graph.ForwardNode], batch_by_op: bool
+) -> list[forward_graph.ForwardNode]:
+    # Grouping by op is only a batching hint: we take whatever is ready right
+    # now that shares an op with the head of the queue, we never wait for more.
+    head = ready.popleft()
+    if not batch_by_op:
+        return [head]
+    op_name = head.node.from_op.name
+    group = [head]
+    rest = []
+    while ready:
+        forward_node = ready.popleft()
+        if forward_node.node.from_op.name == op_name:
+            group.append(forward_node)
+        else:
+            rest.append(forward_node)
+    ready.extend(rest)
+    return group
+
+
+def execute_forward(
+    fg: forward_graph.ForwardGraph, no_cache=False, batch_by_op=True
+) -> ExecuteStats:
+    """Execute all nodes in fg, starting each node as soon as its inputs are ready.
+
+    Ops that op_policy allows to run in parallel are handed to worker threads
+    and do not block the rest of the graph; everything else runs in this
+    thread, interleaved with parallel work as it completes. When batch_by_op
+    is set, ready nodes that share an op are dispatched together.
+    """
+    stats = ExecuteStats()
+    parallel_budget = parallelism.get_parallel_budget()
+
+    ready: collections.deque[forward_graph.ForwardNode] = collections.deque(fg.roots)
+    scheduled: set[forward_graph.ForwardNode] = set(fg.roots)
+    in_flight: dict[
+        concurrent.futures.Future[typing.Tuple[NodeExecutionReport, float]],
+        forward_graph.ForwardNode,
+    ] = {}
+
+    def finish(
+        forward_node: forward_graph.ForwardNode,
+        report: NodeExecutionReport,
+        duration: float,
+    ) -> None:
+        stats.add_node(
+            forward_node.node,
+            duration,
+            report["cache_used"],
+            report.get("already_executed") or False,
+            report.get("bytes_read_to_arrow") or 0,
+        )
+        for downstream_forward_node in forward_node.input_to:
+            if downstream_forward_node in scheduled:
+                continue
+            if all(
+                fg.has_result(param_node)
+                for param_node in downstream_forward_node.node.from_op.inputs.values()
+            ):
+                scheduled.add(downstream_forward_node)
+                ready.append(downstream_forward_node)
+
+    def finish_done() -> None:
+        for future in [f for f in in_flight if f.done()]:
+            report, duration = future.result()
+            finish(in_flight.pop(future), report, duration)
+
+    batches: list[parallelism.ParallelBatch] = []
+    while ready or in_flight:
+        if not ready:
+            # Nothing else to do in this thread, so help out with parallel
+            # work that no pool thread has picked up yet. The pool is shared
+            # by the whole process, so this also keeps nested executions from
+            # waiting on each other.
+            for batch in batches:
+                if batch.run_one_inline():
+                    break
             else:
-                # Sequential in process case
-                for forward_node in group:
-                    start_time = time.time()
-                    span = None
-                    if isinstance(forward_node.node, graph.OutputNode):
-                        span = tracer.trace(
-                            "op.%s" % graph.op_full_name(forward_node.node.from_op)
-                        )
-                    try:
-                        with tag_store.set_curr_node(
-                            id(forward_node.node),
-                            [
-                                id(input_node)
-                                for input_node in forward_node.node.from_op.inputs.values()
-                            ],
-                        ):
-                            # Lambdas and async functions do not use object_context (object caching
-                            # and mutational transactions).
-                            if op_def.is_async or (
-                                any(
-                                    isinstance(input_node.type, types.Function)
-                                    for input_node in forward_node.node.from_op.inputs.values()
-                                )
-                                and not op_def.mutation
-                            ):
-                                report = execute_forward_node(
-                                    fg, forward_node, no_cache=no_cache
-                                )
-                            else:
-                                with object_context.object_context():
-                                    report = execute_forward_node(
-                                        fg, forward_node, no_cache=no_cache
-                                    )
-
-                    except Exception as e:
-                        logging.info(
-                            "Exception during execution of: %s\n%s"
-                            % (
-                                graph_debug.node_expr_str_full(forward_node.node),
-                                traceback.format_exc(),
-                            )
-                        )
-                        if value_or_error.DEBUG:
-                            raise
-                        forward_node.set_result(forward_graph.ErrorResult(e))
-                        report = {
-                            "cache_used": False,
-                            "already_executed": False,
-                            "bytes_read_to_arrow": 0,
-                        }
-                    finally:
-                        if span is not None:
-                            span.finish()
-
-                    if span is not None:
-                        span.set_metric(
-                            "bytes_read_to_arrow",
-                            report["bytes_read_to_arrow"],
-                            True,
-                        )
+                batches = []
+                concurrent.futures.wait(
+                    in_flight, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+            finish_done()
+            continue
+
+        group = _pop_ready_group(ready, batch_by_op)
+        op_name = group[0].node.from_op.name
+        if parallel_budget != 1 and op_policy.should_run_in_parallel(op_name):
+            # Parallel threaded case
+            logging.info(
+                "Running %s on %s threads with %s remaining parallel budget each"
+                % (
+                    op_name,
+                    min(len(group), parallel_budget),
+                    parallelism.get_remaining_budget_per_thread(len(group)),
+                )
+            )
+            batch = parallelism.ParallelBatch(
+                lambda forward_node: _execute_forward_node_in_thread(
+                    fg, forward_node, no_cache
+                ),
+                group,
+                parallel_budget,
+            )
+            batches.append(batch)
+            for future, forward_node in zip(batch.futures, group):
+                in_flight[future] = forward_node
+        else:
+            # Sequential in process case
+            op_def = registry_mem.memory_registry.get_op(op_name)
+            if (
+                len(group) > 1
+                and op_def.raw_resolve_batch_fn is not None
+                and not op_def.is_async
+            ):
+                results = _execute_forward_nodes_in_process_batch(fg, group, no_cache)
+            else:
+                results = [
+                    _execute_forward_node_in_process(fg, forward_node, no_cache)
+                    for forward_node in group
+                ]
+            for forward_node, (report, duration) in zip(group, results):
+                finish(forward_node, report, duration)
 
-                    stats.add_node(
-                        forward_node.node,
-                        time.time() - start_time,
-                        report["cache_used"],
-                        report.get("already_executed") or False,
-                        report.get("bytes_read_to_arrow") or 0,
-                    )
-        for forward_node in running_now:
-            for downstream_forward_node in forward_node.input_to:
-                ready_to_run = True
-                for param_node in downstream_forward_node.node.from_op.inputs.values():
-                    if not fg.has_result(param_node):
-                        ready_to_run = False
-                if ready_to_run:
-                    to_run[downstream_forward_node] = True
+        # Pick up parallel work that finished meanwhile, so its downstream
+        # nodes become ready as early as possible.
+        finish_done()
     return stats
 
 
@@ -500,11 +623,23 @@ def _tag_safe_deref(ref):
     return res
 
 
-def execute_forward_node(
+@dataclasses.dataclass
+class _PendingNodeExecution:
+    """A node whose cache lookup missed, with everything needed to resolve it."""
+
+    forward_node: forward_graph.ForwardNode
+    op_def: op_def.OpDef
+    use_cache: bool
+    run_key: typing.Optional[trace_local.RunKey]
+    input_refs: dict[str, typing.Any]
+    inputs: dict[str, typing.Any]
+
+
+def _execute_forward_node_read_cache(
     fg: forward_graph.ForwardGraph,
     forward_node: forward_graph.ForwardNode,
     no_cache=False,
-) -> NodeExecutionReport:
+) -> typing.Union[NodeExecutionReport, _PendingNodeExecution]:
     node = forward_node.node
     if fg.has_result(node):
         return {"cache_used": False, "already_executed": True, "bytes_read_to_arrow": 0}
@@ -556,6 +691,16 @@ def execute_forward_node(
                 op_def, input_refs, impure_cache_key=client_cache_key
             )
 
+        run_cache = None
+        if run_key and not op_def.is_async:
+            run_cache = trace_local.run_output_cache()
+        if run_cache is not None:
+            cached_ref = run_cache.get(run_key)  # type: ignore
+            if cached_ref is not None:
+                return _finish_cached_output(
+                    forward_node, op_def, input_refs, cached_ref
+                )
+
         if run_key:
             run = TRACE_LOCAL.get_run_val(run_key)
             if run is not None and run != None:  # stupid box none makes us check !=
@@ -571,33 +716,13 @@ def execute_forward_node(
                     if run.output is not None:
                         output_ref = run.output
                         # We must deref here to restore tags
-                        output = output_ref.get()
+                        output_ref.get()
                         logging.debug("Cache hit, returning")
-
-                        # Flowed tags are not cacheable(!),
-                        # because they may contain graph dependent information,
-                        # as in the case of gql tags that contain results for downstream
-                        # nodes. So we fix that up here, by flowing tags and overriding
-                        # the cached tags.
-                        # Note, this only works for outer tags, not tags that are inside
-                        # values. For those, we don't have a solution yet.
-                        if opdef_util.should_flow_tags(op_def):
-                            arg0_ref = next(iter(input_refs.values()))
-                            arg0 = ref_base.deref(arg0_ref)
-
-                            output = output_ref.get()
-
-                            process_opdef_resolve_fn.flow_tags(arg0, output)
-
-                        forward_node.set_result(output_ref)
-
-                        return {
-                            "cache_used": True,
-                            "already_executed": False,
-                            "bytes_read_to_arrow": get_bytes_read_to_arrow(
-                                node, output
-                            ),
-                        }
+                        if run_cache is not None:
+                            run_cache.set(run_key, output_ref)  # type: ignore
+                        return _finish_cached_output(
+                            forward_node, op_def, input_refs, output_ref
+                        )
                 # otherwise, the run's output was not saveable, so we need
                 # to recompute it.
         inputs = {
@@ -605,10 +730,124 @@ def execute_forward_node(
             for input_name, input in input_refs.items()
         }
 
+    return _PendingNodeExecution(
+        forward_node, op_def, use_cache, run_key, input_refs, inputs
+    )
+
+
+def _finish_cached_output(
+    forward_node: forward_graph.ForwardNode,
+    op_def: op_def.OpDef,
+    input_refs: dict[str, typing.Any],
+    output_ref: ref_base.Ref,
+) -> NodeExecutionReport:
+    output = output_ref.get()
+
+    # Flowed tags are not cacheable(!),
+    # because they may contain graph dependent information,
+    # as in the case of gql tags that contain results for downstream
+    # nodes. So we fix that up here, by flowing tags and overriding
+    # the cached tags.
+    # Note, this only works for outer tags, not tags that are inside
+    # values. For those, we don't have a solution yet.
+    if opdef_util.should_flow_tags(op_def):
+        arg0_ref = next(iter(input_refs.values()))
+        arg0 = ref_base.deref(arg0_ref)
+
+        process_opdef_resolve_fn.flow_tags(arg0, output)
+
+    forward_node.set_result(output_ref)
+
+    return {
+        "cache_used": True,
+        "already_executed": False,
+        "bytes_read_to_arrow": get_bytes_read_to_arrow(forward_node.node, output),
+    }
+
+
+def _should_force_none_result(pending: _PendingNodeExecution) -> bool:
+    return language_nullability.should_force_none_result(pending.inputs, pending.op_def)
+
+
+def _force_none_result(pending: _PendingNodeExecution) -> typing.Any:
+    # TODO: This logic should all move into resolve_fn of op_def...
+    op_def = pending.op_def
+    result: typing.Any
+    if isinstance(op_def.concrete_output_type, types.TypeType):
+        result = types.NoneType()
+    else:
+        result = None
+    # Still need to flow tags
+    if opdef_util.should_flow_tags(op_def):
+        result = process_opdef_resolve_fn.flow_tags(
+            next(iter(pending.inputs.values())), box.box(result)
+        )
+    return result
+
+
+def _execute_forward_node_write_cache(
+    pending: _PendingNodeExecution, result: typing.Any
+) -> NodeExecutionReport:
+    forward_node = pending.forward_node
+    node = forward_node.node
+    run_key = pending.run_key
+    use_cache = pending.use_cache
+    tracer = engine_trace.tracer()
+    with tracer.trace("execute-write-cache"):
+        ref = ref_base.get_ref(result)
+
+        if ref is not None:
+            logging.debug("Op resulted in ref")
+            # If the op produced an object which has a ref (as in the case of get())
+            # the result is the ref. This enables memoization after impure ops. E.g.
+            # if get('x:latest') produces version x:1, we use x:1 for our make_run_key
+            # calculation
+
+            # Add tags from the result to the ref
+            if tag_store.is_tagged(result):
+                tag_store.add_tags(ref, tag_store.get_tags(result))
+            result = ref
+        else:
+            if use_cache and run_key and not box.is_none(result):
+                result = TRACE_LOCAL.save_run_output(pending.op_def, run_key, result)
+
+        forward_node.set_result(result)
+
+        # Don't save run ops as runs themselves.
+        # TODO: This actually should work correctly, but mutation tracing
+        #    does not really work yet. (mutated objects set their run output
+        #    as the original ref rather than the new ref, which causes problems)
+        if (
+            use_cache
+            and run_key is not None
+            and not is_run_op(node.from_op)
+            and not box.is_none(result)
+        ):
+            logging.debug("Saving run")
+            TRACE_LOCAL.new_run(run_key, inputs=pending.input_refs, output=result)
+    return {
+        "cache_used": False,
+        "already_executed": False,
+        "bytes_read_to_arrow": get_bytes_read_to_arrow(node, result),
+    }
+
+
+def execute_forward_node(
+    fg: forward_graph.ForwardGraph,
+    forward_node: forward_graph.ForwardNode,
+    no_cache=False,
+) -> NodeExecutionReport:
+    pending = _execute_forward_node_read_cache(fg, forward_node, no_cache)
+    if not isinstance(pending, _PendingNodeExecution):
+        return pending
+
+    op_def = pending.op_def
+    run_key = pending.run_key
+    tracer = engine_trace.tracer()
     if op_def.is_async and run_key:
         with tracer.trace("execute-async"):
             input_refs = {}
-            for input_name, input in inputs.items():
+            for input_name, input in pending.inputs.items():
                 ref = ref_base.get_ref(input)
                 if ref is None:
                     ref = TRACE_LOCAL.save_object(input)
@@ -624,54 +863,85 @@ def execute_forward_node(
     else:
         result: typing.Any
         with tracer.trace("execute-sync"):
-            # TODO: This logic should all move into resolve_fn of op_def...
-            if language_nullability.should_force_none_result(inputs, op_def):
-                if isinstance(op_def.concrete_output_type, types.TypeType):
-                    result = types.NoneType()
-                else:
-                    result = None
-                # Still need to flow tags
-                if opdef_util.should_flow_tags(op_def):
-                    result = process_opdef_resolve_fn.flow_tags(
-                        next(iter(inputs.values())), box.box(result)
-                    )
+            if _should_force_none_result(pending):
+                result = _force_none_result(pending)
             else:
-                result = op_execute.execute_op(op_def, inputs)
-
-        with tracer.trace("execute-write-cache"):
-            ref = ref_base.get_ref(result)
-
-            if ref is not None:
-                logging.debug("Op resulted in ref")
-                # If the op produced an object which has a ref (as in the case of get())
-                # the result is the ref. This enables memoization after impure ops. E.g.
-                # if get('x:latest') produces version x:1, we use x:1 for our make_run_key
-                # calculation
-
-                # Add tags from the result to the ref
-                if tag_store.is_tagged(result):
-                    tag_store.add_tags(ref, tag_store.get_tags(result))
-                result = ref
-            else:
-                if use_cache and run_key and not box.is_none(result):
-                    result = TRACE_LOCAL.save_run_output(op_def, run_key, result)
+                result = op_execute.execute_op(op_def, pending.inputs)
 
-            forward_node.set_result(result)
+        return _execute_forward_node_write_cache(pending, result)
 
-            # Don't save run ops as runs themselves.
-            # TODO: This actually should work correctly, but mutation tracing
-            #    does not really work yet. (mutated objects set their run output
-            #    as the original ref rather than the new ref, which causes problems)
-            if (
-                use_cache
-                and run_key is not None
-                and not is_run_op(node.from_op)
-                and not box.is_none(result)
+
+def execute_forward_nodes_batch(
+    fg: forward_graph.ForwardGraph,
+    forward_nodes: list[forward_graph.ForwardNode],
+    no_cache=False,
+) -> list[NodeExecutionReport]:
+    """Execute nodes that call the same op with one call to its batch resolver.
+
+    The op must have a batch resolver (see the resolve_batch argument of the op
+    decorator). Caching works exactly as in execute_forward_node: each node
+    gets its own run key, cache hits are served individually and only the
+    misses are passed to the batch resolver. Each node is handled in its own
+    tag scope, except the raw batch resolver call itself, which runs in the
+    scope of the first node with the tags of every node's inputs available.
+    """
+    op_def = registry_mem.memory_registry.get_op(forward_nodes[0].node.from_op.name)
+    reports: list[typing.Optional[NodeExecutionReport]] = [None] * len(forward_nodes)
+    to_resolve: list[typing.Tuple[int, _PendingNodeExecution]] = []
+    for i, forward_node in enumerate(forward_nodes):
+        try:
+            with _node_tag_scope(forward_node):
+                pending = _execute_forward_node_read_cache(fg, forward_node, no_cache)
+                if not isinstance(pending, _PendingNodeExecution):
+                    reports[i] = pending
+                elif _should_force_none_result(pending):
+                    reports[i] = _execute_forward_node_write_cache(
+                        pending, _force_none_result(pending)
+                    )
+                else:
+                    to_resolve.append((i, pending))
+        except Exception as e:
+            reports[i] = _set_batch_node_error(forward_node, e)
+
+    if to_resolve:
+        tracer = engine_trace.tracer()
+        with tracer.trace("execute-sync-batch") as span:
+            span.set_tag("batch_size", len(to_resolve))
+            with tag_store.set_curr_node(
+                id(forward_nodes[0].node),
+                [
+                    id(input_node)
+                    for _, pending in to_resolve
+                    for input_node in pending.forward_node.node.from_op.inputs.values()
+                ],
             ):
-                logging.debug("Saving run")
-                TRACE_LOCAL.new_run(run_key, inputs=input_refs, output=result)
-        return {
-            "cache_used": False,
-            "already_executed": False,
-            "bytes_read_to_arrow": get_bytes_read_to_arrow(node, result),
-        }
+                results = op_execute.execute_op_batch(
+                    op_def,
+                    [pending.inputs for _, pending in to_resolve],
+                    lambda j: _node_tag_scope(to_resolve[j][1].forward_node),
+                )
+        for (i, pending), result in zip(to_resolve, results):
+            try:
+                with _node_tag_scope(pending.forward_node):
+                    reports[i] = _execute_forward_node_write_cache(pending, result)
+            except Exception as e:
+                reports[i] = _set_batch_node_error(pending.forward_node, e)
+    return typing.cast(list[NodeExecutionReport], reports)
+
+
+def _set_batch_node_error(
+    forward_node: forward_graph.ForwardNode, e: Exception
+) -> NodeExecutionReport:
+    # Errors reading or writing one node's cache only fail that node, like
+    # the sequential path. Only a failing batch resolver fails the group.
+    logging.info(
+        "Exception during execution of: %s\n%s"
+        % (
+            graph_debug.node_expr_str_full(forward_node.node),
+            traceback.format_exc(),
+        )
+    )
+    if value_or_error.DEBUG:
+        raise e
+    forward_node.set_result(forward_graph.ErrorResult(e))
+    return _EMPTY_REPORT
@@ -76,8 +76,12 @@ class Filesystem:
         path = self.path(path)
         os.makedirs(os.path.dirname(path), exist_ok=True)
         tmp_name = f"{path}.tmp-{util.rand_string_n(16)}"
-        with open(tmp_name, mode) as f:
-            yield f
+        try:
+            with open(tmp_name, mode) as f:
+                yield f
+        except:
+            os.remove(tmp_name)
+            raise
         with tracer.trace("rename"):
             os.rename(tmp_name, path)
 
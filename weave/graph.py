@@ -420,6 +420,76 @@ def map_nodes_full(
     return results
 
 
+class _MappedOrFinal(dict):
+    # Nodes that have been through every map fn map to themselves.
+    def __init__(self, final: dict[int, Node]) -> None:
+        super().__init__()
+        self._final = final
+
+    def __contains__(self, node: object) -> bool:
+        return dict.__contains__(self, node) or id(node) in self._final
+
+    def __getitem__(self, node: Node) -> Node:
+        try:
+            return dict.__getitem__(self, node)
+        except KeyError:
+            if id(node) in self._final:
+                return node
+            raise
+
+
+def map_nodes_full_fused(
+    leaf_nodes: list[Node],
+    map_fns: list[typing.Callable[[Node], typing.Optional[Node]]],
+    on_error: OnErrorFnType = None,
+) -> list[Node]:
+    """Same result as calling map_nodes_full with each map fn in turn, in one
+    walk of the dag.
+
+    Each node gets the map fns in order, once its inputs have been through all
+    of them. When a map fn returns new nodes, only the remaining map fns are
+    applied to them, as they would be by the following map_nodes_full calls.
+    This is only equivalent for map fns that don't depend on how later ones
+    rewrite a node's inputs.
+    """
+    # Outputs of the full pipeline, by id. Holding them keeps ids unique.
+    final: dict[int, Node] = {}
+
+    def apply(node: Node, start: int) -> Node:
+        for i in range(start, len(map_fns)):
+            res = map_fns[i](node)
+            if res is None or res is node:
+                continue
+            if id(res) not in final:
+                res = _map_nodes(
+                    res,
+                    functools.partial(apply, start=i + 1),
+                    _MappedOrFinal(final),
+                    True,
+                )
+            final[id(res)] = res
+            return res
+        final[id(node)] = node
+        return node
+
+    already_mapped = _MappedOrFinal(final)
+    results: list[Node] = []
+    for node_ndx, node in enumerate(leaf_nodes):
+        try:
+            results.append(
+                _map_nodes(
+                    node, functools.partial(apply, start=0), already_mapped, True
+                )
+            )
+        except Exception as e:
+            if on_error:
+                results.append(on_error(node_ndx, e))
+            else:
+                raise e
+
+    return results
+
+
 def all_nodes_full(leaf_nodes: list[Node]) -> list[Node]:
     result: list[Node] = []
     map_nodes_full(leaf_nodes, lambda n: result.append(n))
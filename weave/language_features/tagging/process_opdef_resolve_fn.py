@@ -1,10 +1,12 @@
 """
-This file contains a single exported function `process_opdef_resolve_fn`. Technically,
-this could have been implemented in `op_def.py`, but we want to keep all the tagging-related
-logic in one place. Therefore, in op_def.py we import this function and call it to post-process
-the result of the op_def's resolve_fn.
+This file contains the exported function `process_opdef_resolve_fn` (and its batch
+counterpart `process_opdef_resolve_batch_fn`). Technically, this could have been
+implemented in `op_def.py`, but we want to keep all the tagging-related logic in one
+place. Therefore, in op_def.py we import these functions and call them to post-process
+the results of the op_def's resolve_fn.
 """
 
+import contextlib
 import typing
 import typing_extensions
 import pyarrow as pa
@@ -12,6 +14,7 @@ from pyarrow import compute as pc
 
 from .tagged_value_type import TaggedValueType
 from ... import box
+from ... import errors
 from ... import weave_types as types
 from . import tag_store
 from ...arrow.arrow_tags import awl_add_arrow_tags
@@ -60,12 +63,13 @@ def _strip_tags(val: typing.Any) -> typing.Any:
 # new arrow weave list that contains just the untagged values. We then pass that
 # to the op resolver. On we get the result back, we re-apply the tags we stripped
 # previously
-def propagate_arrow_tags(
+def _strip_arrow_tags(
     op_def: "OpDef.OpDef",
-    resolve_fn: typing.Callable,
     args: list[typing.Any],
     kwargs: dict[str, typing.Any],
-) -> typing.Any:
+) -> typing.Tuple[
+    list[typing.Any], dict[str, typing.Any], typing.Callable[[typing.Any], typing.Any]
+]:
     tag_type: typing.Optional[types.Type]
 
     _, first_arg_val = get_first_arg(op_def, args, kwargs)
@@ -94,30 +98,49 @@ def propagate_arrow_tags(
     for key, val in kwargs.items():
         tag_stripped_kwargs[key] = _strip_tags(val)
 
-    res = resolve_fn(*tag_stripped_args, **tag_stripped_kwargs)
+    def rewrap_tags(res: typing.Any) -> typing.Any:
+        if first_arg_tags and tag_type:
+            res = awl_add_arrow_tags(
+                res,
+                first_arg_tags,
+                tag_type,
+            )
 
-    # rewrap tags
-    if first_arg_tags and tag_type:
-        res = awl_add_arrow_tags(
-            res,
-            first_arg_tags,
-            tag_type,
-        )
+            if is_optional_tagged:
+                mask = pc.invert(pc.is_valid(first_arg_val._arrow_data))
+                new_arrow_data = pa.StructArray.from_arrays(
+                    [res._arrow_data.field("_tag"), res._arrow_data.field("_value")],
+                    ["_tag", "_value"],
+                    mask=mask,
+                )
 
-        if is_optional_tagged:
-            mask = pc.invert(pc.is_valid(first_arg_val._arrow_data))
-            new_arrow_data = pa.StructArray.from_arrays(
-                [res._arrow_data.field("_tag"), res._arrow_data.field("_value")],
-                ["_tag", "_value"],
-                mask=mask,
-            )
+                res = ArrowWeaveList(
+                    new_arrow_data,
+                    types.optional(res.object_type),
+                    res._artifact,
+                )
+
+        return res
+
+    return tag_stripped_args, tag_stripped_kwargs, rewrap_tags
 
-            res = ArrowWeaveList(
-                new_arrow_data,
-                types.optional(res.object_type),
-                res._artifact,
-            )
 
+def propagate_arrow_tags(
+    op_def: "OpDef.OpDef",
+    resolve_fn: typing.Callable,
+    args: list[typing.Any],
+    kwargs: dict[str, typing.Any],
+) -> typing.Any:
+    tag_stripped_args, tag_stripped_kwargs, rewrap_tags = _strip_arrow_tags(
+        op_def, args, kwargs
+    )
+    return rewrap_tags(resolve_fn(*tag_stripped_args, **tag_stripped_kwargs))
+
+
+def _mark_arrow_result_optional(res: typing.Any) -> typing.Any:
+    # TODO(DG): implement this for Table, ChunkedArray, etc.
+    if isinstance(res._arrow_data, pa.Array) and res._arrow_data.null_count > 0:
+        res.object_type = types.optional(res.object_type)
     return res
 
 
@@ -154,15 +177,21 @@ def process_opdef_resolve_fn(
     kwargs: dict[str, typing.Any],
 ) -> typing.Any:
     if op_def.op_def_is_auto_tag_handling_arrow_op():
-        res = propagate_arrow_tags(op_def, resolve_fn, args, kwargs)
-
-        # TODO(DG): implement this for Table, ChunkedArray, etc.
-        if isinstance(res._arrow_data, pa.Array) and res._arrow_data.null_count > 0:
-            res.object_type = types.optional(res.object_type)
-
+        res = _mark_arrow_result_optional(
+            propagate_arrow_tags(op_def, resolve_fn, args, kwargs)
+        )
     else:
         res = resolve_fn(*args, **kwargs)
 
+    return _process_opdef_result(op_def, res, args, kwargs)
+
+
+def _process_opdef_result(
+    op_def: "OpDef.OpDef",
+    res: typing.Any,
+    args: list[typing.Any],
+    kwargs: dict[str, typing.Any],
+) -> typing.Any:
     res = box.box(res)
     if should_tag_op_def_outputs(op_def):
         key, val = get_first_arg(op_def, args, kwargs)
@@ -178,3 +207,40 @@ def process_opdef_resolve_fn(
         key, val = get_first_arg(op_def, args, kwargs)
         return flow_tags(val, res, give_precedence_to_existing_tags=True)
     return res
+
+
+# The batch version of `process_opdef_resolve_fn`. The batch resolver is called
+# once with the kwargs of every call, and each result is post-processed exactly
+# as if it had come from a call to the single resolver. If given, item_context(i)
+# is entered while post-processing the i-th result; the executor uses this to
+# tag each result in the tag scope of its own node.
+def process_opdef_resolve_batch_fn(
+    op_def: "OpDef.OpDef",
+    resolve_batch_fn: typing.Callable,
+    kwargs_list: list[dict[str, typing.Any]],
+    item_context: typing.Optional[typing.Callable[[int], typing.ContextManager]] = None,
+) -> list[typing.Any]:
+    if op_def.op_def_is_auto_tag_handling_arrow_op():
+        stripped = [_strip_arrow_tags(op_def, [], kwargs) for kwargs in kwargs_list]
+        results = resolve_batch_fn([kwargs for _, kwargs, _ in stripped])
+    else:
+        results = resolve_batch_fn(kwargs_list)
+
+    results = list(results)
+    if len(results) != len(kwargs_list):
+        raise errors.WeaveInternalError(
+            "Batch resolver for op %s returned %s results for %s calls"
+            % (op_def.name, len(results), len(kwargs_list))
+        )
+
+    if op_def.op_def_is_auto_tag_handling_arrow_op():
+        results = [
+            _mark_arrow_result_optional(rewrap_tags(res))
+            for (_, _, rewrap_tags), res in zip(stripped, results)
+        ]
+
+    processed = []
+    for i, (res, kwargs) in enumerate(zip(results, kwargs_list)):
+        with item_context(i) if item_context is not None else contextlib.nullcontext():
+            processed.append(_process_opdef_result(op_def, res, [], kwargs))
+    return processed
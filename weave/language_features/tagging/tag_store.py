@@ -2,8 +2,8 @@
 This file contains the data structures and methods used to manage the in-memory
 state of tagged objects. Crticailly, it relies on two private global objects:
 
-* `_OBJ_TAGS_MEM_MAP` - used to map the python id of an object to a dictionary of
-    tags. This is used to store the tags for an object.
+* `_OBJ_TAGS_MEM_MAP` - a `TagStore`, used to map the python id of an object to a
+    dictionary of tags, scoped by node. This is used to store the tags for an object.
 * `_VISITED_OBJ_IDS` - used to keep track of the python ids of objects that are
     currently being visited. This is used to prevent infinite recursion when
     determing the type of tagged objects.
@@ -28,17 +28,113 @@ from ... import errors
 
 from ... import engine_trace
 
-from collections import defaultdict
-
 statsd = engine_trace.statsd()  # type: ignore
 
-NodeTagStoreType = dict[int, dict[str, typing.Any]]
-TagStoreType = defaultdict[int, NodeTagStoreType]
+
+class _NodeTags:
+    __slots__ = ("tags", "parents")
+
+    def __init__(self) -> None:
+        # shape: {obj_id: {tag_key: tag_value}}
+        self.tags: dict[int, dict[str, typing.Any]] = {}
+        self.parents: list["_NodeTags"] = []
+
+
+class TagStore:
+    """Tags of objects, scoped by the node whose execution added them.
+
+    A node sees its own tags, then the tags seen by its parents, later
+    parents first, like a chain map. Tags are only stored on the node that
+    added them, rather than copied into every node downstream of it.
+    """
+
+    def __init__(self) -> None:
+        self._nodes: dict[int, _NodeTags] = {}
+        # Nodes that have tags for each object, so lookups for untagged
+        # objects and cleanup don't have to visit every node.
+        self._obj_nodes: dict[int, list[_NodeTags]] = {}
+
+    def _node(self, node_id: int) -> _NodeTags:
+        node = self._nodes.get(node_id)
+        if node is None:
+            node = self._nodes[node_id] = _NodeTags()
+        return node
+
+    def add_parents(self, node_id: int, parent_node_ids: list[int]) -> None:
+        node = self._node(node_id)
+        for parent_id in parent_node_ids:
+            parent = self._node(parent_id)
+            if parent is node:
+                continue
+            # Nodes are entered again when executed in batches, or when a
+            # new node reuses a freed node's id. The most recently given
+            # parents take precedence.
+            if parent in node.parents:
+                node.parents.remove(parent)
+            node.parents.append(parent)
+        # Parents' tags take precedence over tags the node added before it
+        # was entered again.
+        for obj_id in list(node.tags):
+            parent_tags = self._get_from_parents(node, obj_id)
+            if parent_tags is not None:
+                node.tags[obj_id] = parent_tags
+
+    def has_obj(self, obj_id: int) -> bool:
+        return obj_id in self._obj_nodes
+
+    def get(self, node_id: int, obj_id: int) -> typing.Optional[dict[str, typing.Any]]:
+        if obj_id not in self._obj_nodes:
+            return None
+        node = self._nodes.get(node_id)
+        if node is None:
+            return None
+        tags = node.tags.get(obj_id)
+        if tags is not None:
+            return tags
+        return self._get_from_parents(node, obj_id)
+
+    def _get_from_parents(
+        self, node: _NodeTags, obj_id: int
+    ) -> typing.Optional[dict[str, typing.Any]]:
+        # Depth first, last parent first, matching the order in which
+        # parents' tags used to be merged into the node.
+        visited = {id(node)}
+        stack = list(node.parents)
+        while stack:
+            node = stack.pop()
+            if id(node) in visited:
+                continue
+            visited.add(id(node))
+            tags = node.tags.get(obj_id)
+            if tags is not None:
+                return tags
+            stack.extend(node.parents)
+        return None
+
+    def set(self, node_id: int, obj_id: int, tags: dict[str, typing.Any]) -> None:
+        node = self._node(node_id)
+        if obj_id not in node.tags:
+            self._obj_nodes.setdefault(obj_id, []).append(node)
+        node.tags[obj_id] = tags
+
+    def remove(self, obj_id: int) -> None:
+        for node in self._obj_nodes.pop(obj_id, []):
+            node.tags.pop(obj_id, None)
+
+    def num_entries(self) -> int:
+        return sum(len(node.tags) for node in self._nodes.values())
+
+    def clear(self) -> None:
+        self._nodes.clear()
+        self._obj_nodes.clear()
+
+
+TagStoreType = TagStore
 
 
 # Private global objects used to store the tags for objects
 _OBJ_TAGS_MEM_MAP: contextvars.ContextVar[
-    typing.Optional[TagStoreType]  # shape: {node_id: {obj_id: {tag_key: tag_value}}}
+    typing.Optional[TagStoreType]
 ] = contextvars.ContextVar("obj_tags_mem_map", default=None)
 
 # Current node id for scoping tags
@@ -47,18 +143,10 @@ _OBJ_TAGS_CURR_NODE_ID: contextvars.ContextVar[int] = contextvars.ContextVar(
 )
 
 
-# gets the current tag memory map for the current node
-def _current_obj_tag_mem_map() -> typing.Optional[NodeTagStoreType]:
-    node_tags = _OBJ_TAGS_MEM_MAP.get()
-    if node_tags is None:
-        return None
-    return node_tags[_OBJ_TAGS_CURR_NODE_ID.get()]
-
-
 def current_tag_store_size() -> int:
     current_mmap = _OBJ_TAGS_MEM_MAP.get()
     if current_mmap is not None:
-        n_tag_store_entries = sum(len(current_mmap[key]) for key in current_mmap)
+        n_tag_store_entries = current_mmap.num_entries()
     else:
         n_tag_store_entries = 0
     return n_tag_store_entries
@@ -81,15 +169,14 @@ def with_tag_store_state(
     _OBJ_TAGS_MEM_MAP.reset(tag_store_token)
 
 
-# sets the current node with optionally merged in parent tags
+# sets the current node, which sees the tags of its parents
 @contextmanager
 def set_curr_node(node_id: int, parent_node_ids: list[int]) -> typing.Iterator[None]:
     node_tags = _OBJ_TAGS_MEM_MAP.get()
     if node_tags is None:
         raise errors.WeaveInternalError("No tag store context")
     token = _OBJ_TAGS_CURR_NODE_ID.set(node_id)
-    for parent_id in parent_node_ids:
-        node_tags[node_id].update(node_tags[parent_id])
+    node_tags.add_parents(node_id, parent_node_ids)
     try:
         yield None
     finally:
@@ -113,7 +200,7 @@ def isolated_tagging_context() -> typing.Iterator[None]:
     created_context = False
     if _OBJ_TAGS_MEM_MAP.get() is None:
         created_context = True
-        token = _OBJ_TAGS_MEM_MAP.set(defaultdict(dict))
+        token = _OBJ_TAGS_MEM_MAP.set(TagStore())
     try:
         yield None
     finally:
@@ -123,7 +210,7 @@ def isolated_tagging_context() -> typing.Iterator[None]:
 
 @contextmanager
 def new_tagging_context() -> typing.Iterator[None]:
-    token = _OBJ_TAGS_MEM_MAP.set(defaultdict(dict))
+    token = _OBJ_TAGS_MEM_MAP.set(TagStore())
     try:
         yield None
     finally:
@@ -145,18 +232,6 @@ def with_visited_obj(obj: typing.Any) -> typing.Iterator[None]:
         visited_obj_ids.remove(id_val)
 
 
-def _remove_tags(mem_map: dict[int, typing.Any], id_val: int) -> None:
-    node_tags = _OBJ_TAGS_MEM_MAP.get()
-    if node_tags is None:
-        return
-    # The tags can be on any node, so we need to check all of them.
-    # This is algorithmically inefficient and could be a serious performance
-    # problem.
-    for node_id, tag_map in node_tags.items():
-        if id_val in tag_map:
-            del tag_map[id_val]
-
-
 def get_id(obj: typing.Any) -> int:
     if box.cannot_have_weakref(obj):
         if obj._id is not None:
@@ -172,15 +247,15 @@ def add_tags(
     tags: dict[str, typing.Any],
     give_precedence_to_existing_tags: bool = False,
 ) -> typing.Any:
-    mem_map = _current_obj_tag_mem_map()
-    if mem_map is None:
+    tag_store = _OBJ_TAGS_MEM_MAP.get()
+    if tag_store is None:
         raise errors.WeaveInternalError("No tag store context")
     id_val = get_id(obj)
-    if not box.cannot_have_weakref(obj) and id_val not in mem_map:
+    if not box.cannot_have_weakref(obj) and not tag_store.has_obj(id_val):
         # Ensure we cleanup the tags when the object is garbage collected.
         # Python is happy to reuse IDs after they are freed!
         try:
-            weakref.finalize(obj, _remove_tags, mem_map, id_val)
+            weakref.finalize(obj, tag_store.remove, id_val)
         except:
             # Extreme bug here!
             # Can't box pydantic objects, like those from langchain.
@@ -189,9 +264,10 @@ def add_tags(
     assert box.is_boxed(obj), "Can only tag boxed objects"
     existing_tags = get_tags(obj) if is_tagged(obj) else {}
     if give_precedence_to_existing_tags:
-        mem_map[id_val] = {**tags, **existing_tags}
+        new_tags = {**tags, **existing_tags}
     else:
-        mem_map[id_val] = {**existing_tags, **tags}
+        new_tags = {**existing_tags, **tags}
+    tag_store.set(_OBJ_TAGS_CURR_NODE_ID.get(), id_val, new_tags)
     return obj
 
 
@@ -203,12 +279,13 @@ def get_tags(obj: typing.Any) -> dict[str, typing.Any]:
     if id_val in _VISITED_OBJ_IDS.get():
         raise ValueError("Cannot get tags for an object that is being visited")
 
-    current_mem_map = _current_obj_tag_mem_map()
-    if current_mem_map is None:
+    tag_store = _OBJ_TAGS_MEM_MAP.get()
+    if tag_store is None:
         return {}
-    if id_val not in current_mem_map:
+    tags = tag_store.get(_OBJ_TAGS_CURR_NODE_ID.get(), id_val)
+    if tags is None:
         return {}
-    return current_mem_map[id_val]
+    return tags
 
 
 # Recursively looks up the tag for the object, given a key and target tag_type.
@@ -233,11 +310,11 @@ def is_tagged(obj: typing.Any) -> bool:
     id_val = get_id(obj)
     if id_val in _VISITED_OBJ_IDS.get():
         return False
-    mem_map = _current_obj_tag_mem_map()
-    if mem_map is None:
+    tag_store = _OBJ_TAGS_MEM_MAP.get()
+    if tag_store is None:
         return False
 
-    return id_val in mem_map
+    return tag_store.get(_OBJ_TAGS_CURR_NODE_ID.get(), id_val) is not None
 
 
 def clear_tag_store() -> None:
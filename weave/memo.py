@@ -1,16 +1,106 @@
-import typing
-
-
+import collections
 import contextvars
 import contextlib
+import sys
+import threading
+import typing
+
+import pyarrow as pa
 
 from . import engine_trace
+from . import environment
 
 statsd = engine_trace.statsd()  # type: ignore
 
-_memo_storage: contextvars.ContextVar[typing.Optional[dict]] = contextvars.ContextVar(
-    "memo_storage", default=None
-)
+
+class NoValue:
+    pass
+
+
+NO_VALUE = NoValue()
+
+
+def _value_nbytes(val: typing.Any) -> int:
+    # A cheap estimate of the memory held by a memoized value. We only look one
+    # level into lists, which is enough for the big values we memoize (lists of
+    # ArrowWeaveLists, for example).
+    if isinstance(val, (list, tuple)):
+        return sys.getsizeof(val) + sum(_value_nbytes_shallow(v) for v in val)
+    return _value_nbytes_shallow(val)
+
+
+def _value_nbytes_shallow(val: typing.Any) -> int:
+    from .arrow.list_ import ArrowWeaveList
+
+    if isinstance(val, ArrowWeaveList):
+        return val._arrow_data.nbytes
+    if isinstance(val, (pa.Array, pa.ChunkedArray, pa.Table)):
+        return val.nbytes
+    return sys.getsizeof(val)
+
+
+class MemoStorage:
+    """Memoized results, evicted least recently used first once over max_bytes.
+
+    Shared by all threads working on the same request, so access is locked.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items: collections.OrderedDict[
+            typing.Any, typing.Tuple[typing.Any, int]
+        ] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # fn name -> [hits, misses]
+        self._counts: collections.defaultdict[str, list[int]] = collections.defaultdict(
+            lambda: [0, 0]
+        )
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, fn_name: str, key: typing.Any) -> typing.Any:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self._counts[fn_name][1] += 1
+                return NO_VALUE
+            self._items.move_to_end(key)
+            self._counts[fn_name][0] += 1
+            return item[0]
+
+    def set(self, key: typing.Any, val: typing.Any) -> None:
+        nbytes = _value_nbytes(val)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            prev = self._items.pop(key, None)
+            if prev is not None:
+                self.nbytes -= prev[1]
+            self._items[key] = (val, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._items.popitem(last=False)
+                self.nbytes -= evicted_nbytes
+
+    def hits_and_misses(self) -> dict[str, typing.Tuple[int, int]]:
+        with self._lock:
+            return {name: (c[0], c[1]) for name, c in self._counts.items()}
+
+    def report_stats(self) -> None:
+        # Reported once per storage rather than on every call, memoized
+        # functions are too hot for a statsd call each.
+        for fn_name, (hits, misses) in self.hits_and_misses().items():
+            tags = ["fn:%s" % fn_name]
+            statsd.increment("weave.memo.hit", hits, tags=tags)
+            statsd.increment("weave.memo.miss", misses, tags=tags)
+        statsd.gauge("weave.memo.nbytes", self.nbytes)
+
+
+_memo_storage: contextvars.ContextVar[
+    typing.Optional[MemoStorage]
+] = contextvars.ContextVar("memo_storage", default=None)
 
 
 @contextlib.contextmanager
@@ -22,37 +112,32 @@ def memo_storage() -> typing.Generator[None, None, None]:
     # memoized values from the previous call! We might want to do something
     # similar for other context variables.
     token = None
+    storage = None
     if _memo_storage.get() is None:
-        token = _memo_storage.set({})
+        storage = MemoStorage(environment.memo_max_bytes())
+        token = _memo_storage.set(storage)
     try:
         yield
     finally:
         if token is not None:
             _memo_storage.reset(token)
-
-
-class NoValue:
-    pass
-
-
-NO_VALUE = NoValue()
+        if storage is not None:
+            storage.report_stats()
 
 
 def memo(f: typing.Any) -> typing.Any:
+    fn_name = getattr(f, "__qualname__", repr(f))
+
     def call_memo(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
         storage = _memo_storage.get()
         if storage is None:
             return f(*args, **kwargs)
         key = (f, args, tuple(kwargs.items()))
-        try:
-            val = storage[key]
-            # statsd.increment("weave.memo.hit")
+        val = storage.get(fn_name, key)
+        if val is not NO_VALUE:
             return val
-        except KeyError:
-            pass
-        # statsd.increment("weave.memo.miss")
         result = f(*args, **kwargs)
-        storage[key] = result
+        storage.set(key, result)
         return result
 
     return call_memo
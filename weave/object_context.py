@@ -131,6 +131,13 @@ class ObjectContext:
         artifact_fs.update_weave_meta(weave_type, art)
         art.save(branch=target_branch)  # type: ignore
 
+        # Run records are invalidated individually by TraceLocal.save_run,
+        # any other committed mutation may change cached run outputs.
+        if not art.name.startswith("run-"):
+            from . import trace_local
+
+            trace_local.invalidate_run_output_cache()
+
     def finish_mutations(self) -> None:
         for target_uri in self.objects.keys():
             self.finish_mutation(target_uri)
@@ -36,6 +36,18 @@ class OpArgs:
     def first_param_valid(self, param0_type: types.Type) -> bool:
         raise NotImplementedError
 
+    _optional_arg_type: typing.Optional[tuple[types.Type, types.Type]] = None
+
+    def _optional_type(self, arg_type: types.Type) -> types.Type:
+        # Dispatch checks the first param of every op with a given name, for
+        # every node. Reusing the same optional type lets assign_type's cache
+        # match it by identity. Arg types can be replaced after the op is
+        # created, so this is keyed on the arg type.
+        cached = self._optional_arg_type
+        if cached is None or cached[0] is not arg_type:
+            cached = self._optional_arg_type = (arg_type, types.optional(arg_type))
+        return cached[1]
+
     def nonfirst_params_valid(self, param_types: list[types.Type]) -> bool:
         raise NotImplementedError
 
@@ -71,7 +83,7 @@ class OpVarArgs(OpArgs):
         return types.Dict(types.String(), self.arg_type)
 
     def first_param_valid(self, param0_type: types.Type) -> bool:
-        return types.optional(self.arg_type).assign_type(param0_type)
+        return self._optional_type(self.arg_type).assign_type(param0_type)
 
     def nonfirst_params_valid(self, param_types: list[types.Type]) -> bool:
         return all(self.arg_type.assign_type(t) for t in param_types)
@@ -109,7 +121,9 @@ class OpNamedArgs(OpArgs):
         return t
 
     def first_param_valid(self, param0_type: types.Type) -> bool:
-        return types.optional(list(self.arg_types.values())[0]).assign_type(param0_type)
+        return self._optional_type(next(iter(self.arg_types.values()))).assign_type(
+            param0_type
+        )
 
     def nonfirst_params_valid(self, param_types: list[types.Type]) -> bool:
         arg_names = list(self.arg_types.keys())
@@ -217,6 +217,10 @@ class OpDef:
     pure: bool
     mutation: bool
     raw_resolve_fn: typing.Callable
+    # Optional resolver that takes the inputs of many calls to this op (a list
+    # of kwargs dicts) and returns a list with one result per call. The
+    # executor uses it when several nodes calling this op are ready at once.
+    raw_resolve_batch_fn: typing.Optional[typing.Callable]
     _output_type: typing.Optional[
         typing.Union[
             types.Type,
@@ -256,12 +260,14 @@ class OpDef:
         weave_fn: typing.Optional[graph.Node] = None,
         *,
         plugins=None,
+        resolve_batch_fn: typing.Optional[typing.Callable] = None,
     ):
         self.name = name
         self.input_type = input_type
         self.raw_output_type = output_type
         self.refine_output_type = refine_output_type
         self.raw_resolve_fn = resolve_fn  # type: ignore
+        self.raw_resolve_batch_fn = resolve_batch_fn
         self.setter = setter
         self.render_info = render_info
         self.hidden = hidden
@@ -399,6 +405,24 @@ class OpDef:
             __self, __self.raw_resolve_fn, args, kwargs
         )
 
+    def resolve_batch(
+        self,
+        inputs_list: Sequence[typing.Mapping[str, typing.Any]],
+        item_context: typing.Optional[
+            typing.Callable[[int], typing.ContextManager]
+        ] = None,
+    ) -> list[typing.Any]:
+        if self.raw_resolve_batch_fn is None:
+            raise errors.WeaveInternalError(
+                "Op %s does not have a batch resolver" % self.name
+            )
+        return process_opdef_resolve_fn.process_opdef_resolve_batch_fn(
+            self,
+            self.raw_resolve_batch_fn,
+            [dict(inputs) for inputs in inputs_list],
+            item_context,
+        )
+
     @property
     def output_type(
         self,
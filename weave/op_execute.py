@@ -16,3 +16,11 @@ def execute_op(op_def: "OpDef", inputs: Mapping[str, typing.Any]):
     res = op_def.resolve_fn(**inputs)
 
     return res
+
+
+def execute_op_batch(
+    op_def: "OpDef",
+    inputs_list: list[Mapping[str, typing.Any]],
+    item_context: typing.Optional[typing.Callable[[int], typing.ContextManager]] = None,
+) -> list[typing.Any]:
+    return op_def.resolve_batch(inputs_list, item_context)
@@ -1,17 +1,94 @@
+import datetime
+import functools
+import json
 import logging
+import threading
 import typing
 
+import graphql
+
 from .. import weave_types as types
 from ..api import op
 from . import wb_domain_types as wdt
 from ..wandb_client_api import wandb_gql_query
 from ..language_features.tagging import tagged_value_type
+from .. import cache
+from .. import compile_domain
+from .. import context_state
 from .. import engine_trace
 from .. import errors
 from .. import environment
 from .. import mappers_gql
 from .. import partial_object
 
+ResponseCacheKey = typing.Tuple[str, typing.Optional[str]]
+
+# Responses shared across requests, as JSON so hits don't share mutable
+# objects. Opt in with WEAVE_GQL_RESPONSE_CACHE_TTL_SEC.
+_response_cache: typing.Optional[cache.LruTimeWindowCache[ResponseCacheKey, str]] = None
+_response_cache_lock = threading.Lock()
+
+
+def _get_response_cache() -> (
+    typing.Optional[cache.LruTimeWindowCache[ResponseCacheKey, str]]
+):
+    global _response_cache
+    ttl_sec = environment.gql_response_cache_ttl_sec()
+    if ttl_sec <= 0:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = cache.LruTimeWindowCache(
+                datetime.timedelta(seconds=ttl_sec),
+                max_bytes=environment.gql_response_cache_max_bytes(),
+                size_fn=len,
+                name="gql_response_cache",
+                refresh_on_get=False,
+            )
+        return _response_cache
+
+
+@functools.lru_cache(maxsize=1000)
+def _normalized_query(query_str: str) -> str:
+    return compile_domain.normalize_gql_query_string(query_str)
+
+
+def _response_cache_key(query_str: str) -> typing.Optional[ResponseCacheKey]:
+    try:
+        # The cache is per user, fail in the query, not here.
+        cache.get_user_cache_key()
+        normalized = _normalized_query(query_str)
+    except (errors.WeaveAccessDeniedError, graphql.GraphQLError, ValueError):
+        return None
+    # Never cache mutations.
+    if not normalized.startswith(("query", "{")):
+        return None
+    # A new client cache key asks for fresh results.
+    return (normalized, context_state.get_client_cache_key())
+
+
+def _query_wandb(query_str: str) -> typing.Any:
+    tracer = engine_trace.tracer()
+    num_timeout_retries = environment.num_gql_timeout_retries()
+    with tracer.trace("wbgqlquery:public_api"):
+        logging.info("Executing GQL query: %s", query_str)
+        return wandb_gql_query(query_str, num_timeout_retries=num_timeout_retries)
+
+
+def _query(query_str: str) -> typing.Any:
+    response_cache = _get_response_cache()
+    if response_cache is None:
+        return _query_wandb(query_str)
+    cache_key = _response_cache_key(query_str)
+    if cache_key is None:
+        return _query_wandb(query_str)
+    cached = response_cache.get(cache_key)
+    if not isinstance(cached, cache.LruTimeWindowCache.NotFound):
+        return json.loads(cached)
+    gql_payload = _query_wandb(query_str)
+    response_cache.set(cache_key, json.dumps(gql_payload))
+    return gql_payload
+
 
 def _wbgqlquery_output_type(input_types: dict[str, types.Type]) -> types.Type:
     ot = input_types["alias_list"]
@@ -34,13 +111,7 @@ def _wbgqlquery_output_type(input_types: dict[str, types.Type]) -> types.Type:
     pure=False,
 )
 def wbgqlquery(query_str, alias_list, output_type):
-    tracer = engine_trace.tracer()
-    num_timeout_retries = environment.num_gql_timeout_retries()
-    with tracer.trace("wbgqlquery:public_api"):
-        logging.info("Executing GQL query: %s", query_str)
-        gql_payload = wandb_gql_query(
-            query_str, num_timeout_retries=num_timeout_retries
-        )
+    gql_payload = _query(query_str)
     for alias in alias_list:
         if alias not in gql_payload:
             raise errors.WeaveGQLExecuteMissingAliasError(
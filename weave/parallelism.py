@@ -1,17 +1,16 @@
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
 import contextlib
 import contextvars
-from typing import Optional, Callable, TypeVar, Iterator, Generator
+import os
+import threading
+from typing import Any, Optional, Callable, Generic, TypeVar, Iterator, Generator
 
 from . import context
-from . import cache
-from . import context_state
-from . import graph_client_context
-from . import run_context
+from . import engine_trace
+from . import environment
 from . import execute
-from . import forward_graph
-from . import memo
-from . import wandb_api
+
+statsd = engine_trace.statsd()  # type: ignore
 
 # Must be power of 2
 MAX_PARALLELISM = 16
@@ -40,6 +39,176 @@ def parallel_budget_ctx(budget: Optional[int]) -> Generator[None, None, None]:
 
 ItemType = TypeVar("ItemType")
 ResultType = TypeVar("ResultType")
+# ExecutionContextSnapshot.run isn't tied to the ResultType of a pool.
+RunResultType = TypeVar("RunResultType")
+
+
+class ExecutionContextSnapshot:
+    """The execution context of the thread that created it.
+
+    Contexts aren't automatically propagated to threads. Instead of re-entering
+    each of them for every work item, we capture all of them once and run each
+    work item in a copy of the captured context.
+    """
+
+    def __init__(self, remaining_budget_per_thread: int) -> None:
+        with parallel_budget_ctx(remaining_budget_per_thread):
+            with context.execution_client():
+                self._context = contextvars.copy_context()
+        # Each work item keeps its own stats, which are merged into the stats
+        # of the capturing thread when the item finishes.
+        self._top_level_stats = execute.get_top_level_stats()
+        self._context.run(execute._top_level_stats_ctx.set, None)
+        self._stats_lock = threading.Lock()
+
+    def run(self, fn: Callable[..., RunResultType], *args: Any) -> RunResultType:
+        return self._context.copy().run(lambda: self._run_with_stats(fn, *args))
+
+    def _run_with_stats(
+        self, fn: Callable[..., RunResultType], *args: Any
+    ) -> RunResultType:
+        with execute.top_level_stats() as thread_top_level_stats:
+            try:
+                return fn(*args)
+            finally:
+                if self._top_level_stats is not None:
+                    with self._stats_lock:
+                        self._top_level_stats.merge(thread_top_level_stats)
+
+
+class _WorkItem(Generic[ResultType]):
+    """A unit of work that is run exactly once, by whichever thread claims it first."""
+
+    def __init__(self, fn: Callable[..., ResultType], *args: Any) -> None:
+        self.future: Future[ResultType] = Future()
+        self._fn = fn
+        self._args = args
+        self._claimed = False
+        self._lock = threading.Lock()
+
+    def run_if_unclaimed(self) -> bool:
+        with self._lock:
+            if self._claimed:
+                return False
+            self._claimed = True
+        self.future.set_running_or_notify_cancel()
+        try:
+            result = self._fn(*self._args)
+        except BaseException as e:
+            self.future.set_exception(e)
+        else:
+            self.future.set_result(result)
+        return True
+
+
+class _PoolStats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.busy = 0
+
+    def report(self) -> None:
+        statsd.gauge("weave.parallelism.pool.queued", self.queued)
+        statsd.gauge("weave.parallelism.pool.busy", self.busy)
+
+
+_POOL: Optional[ThreadPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+_POOL_STATS = _PoolStats()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = ThreadPoolExecutor(
+                    max_workers=environment.parallelism_pool_size(),
+                    thread_name_prefix="weave-parallel",
+                )
+    return _POOL
+
+
+def _reset_pool_after_fork() -> None:
+    # Worker threads don't survive fork, so the child must start a fresh pool.
+    global _POOL, _POOL_LOCK, _POOL_STATS
+    _POOL = None
+    _POOL_LOCK = threading.Lock()
+    _POOL_STATS = _PoolStats()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+def _submit_to_pool(fn: Callable[[], None]) -> None:
+    stats = _POOL_STATS
+
+    def run() -> None:
+        with stats.lock:
+            stats.queued -= 1
+            stats.busy += 1
+        try:
+            fn()
+        finally:
+            with stats.lock:
+                stats.busy -= 1
+            stats.report()
+
+    with stats.lock:
+        stats.queued += 1
+    _get_pool().submit(run)
+    stats.report()
+
+
+class ParallelBatch(Generic[ItemType, ResultType]):
+    """Runs do_one over items on the shared thread pool.
+
+    At most `workers` pool threads work on the batch at a time, which is how
+    the parallel budget is enforced now that the pool is shared. The pool is
+    bounded, so a thread that waits on the batch should help out with
+    run_one_inline (or by iterating the batch) rather than block: that way
+    nested parallel work always makes progress, even when every pool thread
+    is busy.
+    """
+
+    def __init__(
+        self,
+        do_one: Callable[[ItemType], ResultType],
+        items: list[ItemType],
+        workers: int,
+    ) -> None:
+        snapshot = ExecutionContextSnapshot(get_remaining_budget_per_thread(len(items)))
+        self._work_items: list[_WorkItem[ResultType]] = [
+            _WorkItem(snapshot.run, do_one, x) for x in items
+        ]
+        for _ in range(min(workers, len(items))):
+            _submit_to_pool(self._run_all)
+
+    @property
+    def futures(self) -> list[Future[ResultType]]:
+        return [work_item.future for work_item in self._work_items]
+
+    def _run_all(self) -> None:
+        for work_item in self._work_items:
+            work_item.run_if_unclaimed()
+
+    def run_one_inline(self) -> bool:
+        """Run the next unclaimed item in the calling thread.
+
+        Returns False if every item has already been claimed.
+        """
+        for work_item in self._work_items:
+            if work_item.run_if_unclaimed():
+                statsd.increment("weave.parallelism.pool.run_inline")
+                return True
+        return False
+
+    def __iter__(self) -> Iterator[ResultType]:
+        for work_item in self._work_items:
+            if work_item.run_if_unclaimed():
+                statsd.increment("weave.parallelism.pool.run_inline")
+            yield work_item.future.result()
 
 
 def do_in_parallel(
@@ -50,44 +219,9 @@ def do_in_parallel(
     if parallel_budget <= 1:
         return map(do_one, items)
 
-    # Contexts aren't automatically propagated to threads, so we have to do so manually for every context
-    memo_ctx = memo._memo_storage.get()
-    remaining_budget_per_thread = get_remaining_budget_per_thread(len(items))
-    wandb_api_ctx = wandb_api.get_wandb_api_context()
-    result_store = forward_graph.get_node_result_store()
-    top_level_stats = execute.get_top_level_stats()
-    eager_mode = context_state.eager_mode()
-    graph_client = graph_client_context.get_graph_client()
-    run_stack = run_context.get_run_stack()
-    cache_prefix = cache.get_cache_prefix_context()
-
-    def do_one_with_memo_and_parallel_budget(x: ItemType) -> ResultType:
-        memo_token = memo._memo_storage.set(memo_ctx)
-        thread_result_store = None
-        thread_top_level_stats = None
-        try:
-            with parallel_budget_ctx(remaining_budget_per_thread):
-                with graph_client_context.set_graph_client(graph_client):
-                    with run_context.set_run_stack(run_stack):
-                        with context_state.set_eager_mode(eager_mode):
-                            with wandb_api.wandb_api_context(wandb_api_ctx):
-                                with cache.time_interval_cache_prefix(cache_prefix):
-                                    with context.execution_client():
-                                        with forward_graph.node_result_store(
-                                            result_store
-                                        ) as thread_result_store:
-                                            with execute.top_level_stats() as thread_top_level_stats:
-                                                return do_one(x)
-        finally:
-            memo._memo_storage.reset(memo_token)
-            if thread_result_store is not None:
-                result_store.merge(thread_result_store)
-            if top_level_stats is not None and thread_top_level_stats is not None:
-                top_level_stats.merge(thread_top_level_stats)
-
-    return ThreadPoolExecutor(max_workers=parallel_budget).map(
-        do_one_with_memo_and_parallel_budget, items
-    )
+    # The calling thread works on the batch too while it iterates the results,
+    # so it takes one slot of the budget.
+    return iter(ParallelBatch(do_one, items, parallel_budget - 1))
 
 
 def get_remaining_budget_per_thread(item_count: int) -> int:
@@ -0,0 +1,122 @@
+# Opt-in capture of execute requests, so they can be replayed later.
+#
+# Captured request bodies are written one per line (requests.jsonl) to a
+# rotating file in the weave log dir. Writing happens on a background thread,
+# requests only pay for queueing their body. If the writer falls behind,
+# requests are dropped rather than queued without bound.
+#
+# Requests are captured when sampled (WEAVE_REQUEST_CAPTURE_SAMPLE_RATE), or
+# when they have the capture header and WEAVE_REQUEST_CAPTURE_ON_HEADER is set.
+# To replay captured requests, POST each line to /__weave/execute, or copy
+# lines to tests/requests.jsonl and run tests/test_execution_graphs.py.
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import typing
+
+from . import engine_trace
+from . import environment
+from . import logs
+
+statsd = engine_trace.statsd()  # type: ignore
+
+CAPTURE_HEADER = "x-weave-capture-request"
+
+MAX_QUEUED_REQUESTS = 1000
+
+# Rotated files kept next to the current one.
+BACKUP_COUNT = 5
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # The queue may be full, wait for the writer to make room.
+        self.queue.put(self._sentinel)  # type: ignore
+
+
+class RequestCapture:
+    def __init__(self, path: str, max_bytes: int) -> None:
+        self.path = path
+        self.dropped = 0
+        self._queue: queue.Queue[logging.LogRecord] = queue.Queue(MAX_QUEUED_REQUESTS)
+        self._handler = logging.handlers.RotatingFileHandler(
+            path,
+            maxBytes=max_bytes,
+            backupCount=BACKUP_COUNT,
+            encoding="utf-8",
+            delay=True,
+        )
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+        self._listener = _Listener(self._queue, self._handler)
+        self._listener.start()
+        self._running = True
+        atexit.register(self.stop)
+
+    def capture(self, line: str) -> None:
+        try:
+            self._queue.put_nowait(logging.makeLogRecord({"msg": line}))
+        except queue.Full:
+            self.dropped += 1
+            statsd.increment("weave.request_capture.dropped")
+            return
+        statsd.increment("weave.request_capture.captured")
+
+    def stop(self) -> None:
+        """Writes the requests captured so far and stops the writer."""
+        if not self._running:
+            return
+        self._running = False
+        self._listener.stop()
+        self._handler.flush()
+
+
+_capture: typing.Optional[RequestCapture] = None
+_capture_pid: typing.Optional[int] = None
+_capture_lock = threading.Lock()
+
+
+def _default_path() -> typing.Optional[str]:
+    # Each server process writes its own file, rotation isn't safe across
+    # processes.
+    return logs.get_logfile_path(f"{os.getpid()}.requests.jsonl")
+
+
+def get_capture() -> typing.Optional[RequestCapture]:
+    global _capture, _capture_pid
+    with _capture_lock:
+        # The writer thread doesn't survive a fork.
+        if _capture is None or _capture_pid != os.getpid():
+            path = environment.request_capture_path() or _default_path()
+            if path is None:
+                return None
+            _capture = RequestCapture(path, environment.request_capture_max_bytes())
+            _capture_pid = os.getpid()
+        return _capture
+
+
+def should_capture(headers: typing.Mapping[str, str]) -> bool:
+    if headers.get(CAPTURE_HEADER) and environment.request_capture_on_header():
+        return True
+    sample_rate = environment.request_capture_sample_rate()
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def capture_request(body: bytes) -> None:
+    capture = get_capture()
+    if capture is None:
+        return
+    try:
+        line = body.decode("utf-8")
+        if "\n" in line:
+            line = json.dumps(json.loads(line))
+    except ValueError:
+        # Not one utf-8 json line, capturing must never fail the request.
+        statsd.increment("weave.request_capture.unreadable")
+        return
+    capture.capture(line)
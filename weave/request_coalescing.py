@@ -0,0 +1,211 @@
+# Coalescing of identical execute requests.
+#
+# When a board is open in many tabs, or many users open the same report, the
+# server gets the same graphs at the same time. Rather than executing each
+# copy, the first request executes and the others wait for its result.
+# Optionally, results are also reused for a short time after they are done.
+#
+# Requests are only coalesced when they can't observe each other: same graphs,
+# same user, same client cache key, and no mutations.
+
+import collections
+import dataclasses
+import hashlib
+import json
+import threading
+import time
+import typing
+
+from . import cache
+from . import context_state
+from . import engine_trace
+from . import errors
+from . import graph
+from . import op_def
+from . import registry_mem
+from . import serialize
+from . import value_or_error
+
+statsd = engine_trace.statsd()  # type: ignore
+
+T = typing.TypeVar("T")
+
+# Results kept for reuse when a result TTL is set.
+MAX_CACHED_RESULTS = 100
+
+
+@dataclasses.dataclass
+class SingleFlightStats:
+    # Calls that executed
+    executions: int = 0
+    # Calls that waited for a call already in flight
+    coalesced: int = 0
+    # Calls that reused a finished call's result
+    result_cache_hits: int = 0
+
+
+class _Call(typing.Generic[T]):
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: typing.Optional[T] = None
+        self.exception: typing.Optional[BaseException] = None
+
+    def get(self) -> T:
+        self.done.wait()
+        if self.exception is not None:
+            raise self.exception
+        return typing.cast(T, self.result)
+
+
+class SingleFlight(typing.Generic[T]):
+    """Runs at most one call per key at a time, concurrent callers with the
+    same key share its result (or exception)."""
+
+    def __init__(
+        self, now_fn: typing.Callable[[], float] = time.monotonic, name: str = ""
+    ) -> None:
+        self._now_fn = now_fn
+        self._name = name
+        self._lock = threading.Lock()
+        self._in_flight: dict[str, _Call[T]] = {}
+        # key -> (expires_at, result), oldest first
+        self._results: collections.OrderedDict[
+            str, typing.Tuple[float, T]
+        ] = collections.OrderedDict()
+        self._stats = SingleFlightStats()
+
+    def _increment(self, stat: str) -> None:
+        setattr(self._stats, stat, getattr(self._stats, stat) + 1)
+        if self._name:
+            statsd.increment(f"weave.{self._name}.{stat}")
+
+    def _cached_result(self, key: str) -> typing.Optional[typing.Tuple[float, T]]:
+        now = self._now_fn()
+        while self._results:
+            oldest_key, (expires_at, _) = next(iter(self._results.items()))
+            if expires_at > now:
+                break
+            del self._results[oldest_key]
+        return self._results.get(key)
+
+    def do(self, key: str, fn: typing.Callable[[], T], result_ttl: float = 0) -> T:
+        with self._lock:
+            cached = self._cached_result(key)
+            if cached is not None:
+                self._increment("result_cache_hits")
+                return cached[1]
+            call = self._in_flight.get(key)
+            if call is not None:
+                self._increment("coalesced")
+                leader = False
+            else:
+                call = _Call()
+                self._in_flight[key] = call
+                self._increment("executions")
+                leader = True
+
+        if not leader:
+            return call.get()
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.exception = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if call.exception is None and result_ttl > 0:
+                    self._results.pop(key, None)
+                    self._results[key] = (
+                        self._now_fn() + result_ttl,
+                        typing.cast(T, call.result),
+                    )
+                    while len(self._results) > MAX_CACHED_RESULTS:
+                        self._results.popitem(last=False)
+            call.done.set()
+        return call.result
+
+    def stats(self) -> SingleFlightStats:
+        with self._lock:
+            return dataclasses.replace(self._stats)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+
+class _MutationOps:
+    """Whether op names refer to mutations, reset when the op registry changes."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._is_mutation: dict[str, bool] = {}
+        self._registry_updated_at = registry_mem.memory_registry.updated_at()
+
+    def _resolve(self, op_name: str) -> bool:
+        registry = registry_mem.memory_registry
+        if registry.have_op(op_name):
+            return registry.get_op(op_name).mutation
+        ops = registry.find_ops_by_common_name(op_def.common_name(op_name))
+        # Ops we can't resolve here may be anything.
+        return not ops or any(op.mutation for op in ops)
+
+    def is_mutation(self, op_name: str) -> bool:
+        with self._lock:
+            updated_at = registry_mem.memory_registry.updated_at()
+            if updated_at != self._registry_updated_at:
+                self._is_mutation.clear()
+                self._registry_updated_at = updated_at
+            res = self._is_mutation.get(op_name)
+        if res is None:
+            res = self._resolve(op_name)
+            with self._lock:
+                self._is_mutation[op_name] = res
+        return res
+
+
+_mutation_ops = _MutationOps()
+
+
+def _serialize_fn_name(serialize_fn: typing.Callable) -> str:
+    # make_js_serializer returns a new partial for each request.
+    fn = getattr(serialize_fn, "func", serialize_fn)
+    return f"{fn.__module__}.{fn.__qualname__}"
+
+
+def request_key(
+    nodes: value_or_error.ValueOrErrors[graph.Node],
+    deref: bool,
+    serialize_fn: typing.Callable,
+) -> typing.Optional[str]:
+    """Key of an execute request, or None if it must not be coalesced."""
+    target_nodes = []
+    for node, error in nodes.iter_items():
+        if error is not None:
+            return None
+        target_nodes.append(node)
+    for node in graph.all_nodes_full(target_nodes):
+        if isinstance(node, graph.OutputNode) and _mutation_ops.is_mutation(
+            node.from_op.name
+        ):
+            return None
+    try:
+        user_key = cache.get_user_cache_key()
+    except errors.WeaveAccessDeniedError:
+        return None
+    hashable = {
+        "nodes": [serialize.node_id(node) for node in target_nodes],
+        "user": user_key,
+        "client_cache_key": context_state.get_client_cache_key(),
+        "deref": deref,
+        "serialize_fn": _serialize_fn_name(serialize_fn),
+    }
+    return hashlib.md5(json.dumps(hashable).encode()).hexdigest()
+
+
+_REQUESTS: SingleFlight = SingleFlight(name="request_coalescing")
+
+
+def requests() -> SingleFlight:
+    return _REQUESTS
@@ -92,40 +92,94 @@ def _is_lambda(node: graph.Node):
     )
 
 
-@memo.memo
-def node_id(node: graph.Node):
-    hashable: dict[str, typing.Any] = {}
+def _type_digest(t: types.Type) -> bytes:
+    # Types are immutable, so the digest is cached on the instance, like
+    # weave_types caches hashes.
+    try:
+        return t.__dict__["_node_id_digest"]
+    except KeyError:
+        digest = hashlib.md5(json.dumps(t.to_dict()).encode()).digest()
+        t.__dict__["_node_id_digest"] = digest
+        return digest
+
+
+def _is_plain_json(val: typing.Any) -> bool:
+    if val is None or isinstance(val, (str, int, float)):
+        return True
+    if type(val) == list:
+        return all(_is_plain_json(v) for v in val)
+    if type(val) == dict:
+        return all(isinstance(k, str) and _is_plain_json(v) for k, v in val.items())
+    return False
+
+
+def _node_digest(node: graph.Node, child_id: typing.Callable[[graph.Node], str]) -> str:
+    # Hashes the node from its own fields and the ids of its children. Fields
+    # are length prefixed so that different nodes never feed the hash the same
+    # bytes.
+    hash = hashlib.md5()
+
+    def update(tag: bytes, data: bytes) -> None:
+        hash.update(b"%s%d:" % (tag, len(data)))
+        hash.update(data)
+
     if isinstance(node, graph.OutputNode):
-        hashable["op_name"] = node.from_op.name
-        hashable["inputs"] = {
-            arg_name: node_id(arg_node)
-            for arg_name, arg_node in node.from_op.inputs.items()
-        }
+        update(b"o", node.from_op.name.encode())
+        for arg_name, arg_node in node.from_op.inputs.items():
+            update(b"a", arg_name.encode())
+            update(b"i", child_id(arg_node).encode())
     elif isinstance(node, graph.VarNode):
         # Must include type here, Const and OutputNode types can
         # be inferred from the graph, but VarNode types cannot.
-        hashable["type"] = node.type.to_dict()
-        hashable["name"] = node.name
+        update(b"v", node.name.encode())
+        update(b"t", _type_digest(node.type))
     elif isinstance(node, graph.ConstNode):
         if isinstance(node.val, graph.OutputNode) or isinstance(
             node.val, graph.VarNode
         ):
-            hashable["val"] = {"lambda": True, "body": node_id(node.val)}
+            update(b"l", child_id(node.val).encode())
+        elif _is_plain_json(node.val):
+            # Values from weavejs are plain json, their encoding is their
+            # python serialization.
+            update(b"j", json.dumps(node.val).encode())
         else:
-            hashable["val"] = storage.to_python(node.val)
-        hashable["type"] = storage.to_python(node.type)
+            update(b"p", json.dumps(storage.to_python(node.val)).encode())
+        update(b"t", _type_digest(node.type))
     else:
         raise errors.WeaveInternalError("invalid node encountered: %s" % node)
-    hash = hashlib.md5()
-    hash.update(json.dumps(hashable).encode())
     return hash.hexdigest()
 
 
+@memo.memo
+def node_id(node: graph.Node):
+    return _node_digest(node, node_id)
+
+
+class _NodeIds:
+    """node_ids of the nodes built during one deserialize.
+
+    Each node is hashed once, from the already computed ids of its children.
+    Nodes are held so their python ids are not reused while deserializing.
+    """
+
+    def __init__(self) -> None:
+        self._ids: dict[int, typing.Tuple[graph.Node, str]] = {}
+
+    def __call__(self, node: graph.Node) -> str:
+        item = self._ids.get(id(node))
+        if item is not None:
+            return item[1]
+        id_ = _node_digest(node, self)
+        self._ids[id(node)] = (node, id_)
+        return id_
+
+
 def _deserialize_node(
     index: int,
     nodes: typing.List[SerializedNode],
     parsed_nodes: typing.MutableMapping[int, graph.Node],
     hashed_nodes: typing.MutableMapping[str, graph.Node],
+    node_ids: _NodeIds,
 ) -> graph.Node:
     if index in parsed_nodes:
         return parsed_nodes[index]
@@ -158,7 +212,7 @@ def _deserialize_node(
                 params = {}
                 for param_name, param_node_index in op["inputs"].items():
                     params[param_name] = _deserialize_node(
-                        param_node_index, nodes, parsed_nodes, hashed_nodes
+                        param_node_index, nodes, parsed_nodes, hashed_nodes, node_ids
                     )
                 node_type = types.TypeRegistry.type_from_dict(node["type"])
                 if not isinstance(node_type, types.Function):
@@ -184,14 +238,14 @@ def _deserialize_node(
         params = {}
         for param_name, param_node_index in op["inputs"].items():
             params[param_name] = _deserialize_node(
-                param_node_index, nodes, parsed_nodes, hashed_nodes
+                param_node_index, nodes, parsed_nodes, hashed_nodes, node_ids
             )
         parsed_node = graph.OutputNode(
             types.TypeRegistry.type_from_dict(node["type"]), op["name"], params
         )
     elif node["nodeType"] == "var":
         parsed_node = graph.VarNode.from_json(node)
-    id_ = node_id(parsed_node)
+    id_ = node_ids(parsed_node)
     if id_ in hashed_nodes:
         parsed_node = hashed_nodes[id_]
     else:
@@ -216,10 +270,11 @@ def deserialize(
     # WeaveJS does not do a good job deduplicating nodes currently, so we do it here.
     # This ensures we don't execute the same node many times.
     hashed_nodes: dict[str, graph.Node] = {}
+    node_ids = _NodeIds()
 
     target_node_values = value_or_error.ValueOrErrors.from_values(target_nodes)
 
     with memo.memo_storage():
         return target_node_values.safe_map(
-            lambda i: _deserialize_node(i, nodes, parsed_nodes, hashed_nodes)
+            lambda i: _deserialize_node(i, nodes, parsed_nodes, hashed_nodes, node_ids)
         )
@@ -31,6 +31,8 @@ from . import util
 from . import graph
 from .language_features.tagging import tag_store
 from . import gql_json_cache
+from . import environment
+from . import request_coalescing
 
 
 # A function to monkeypatch the request post method
@@ -83,35 +85,67 @@ def handle_request(
             with tracer.trace("request:deserialize"):
                 nodes = serialize.deserialize(request["graphs"])
 
-        with tracer.trace("request:execute"):
-            with execute.top_level_stats() as stats:
-                with context.execution_client():
-                    with cache.time_interval_cache_prefix():
-                        with gql_json_cache.gql_json_cache_context():
-                            result = nodes.batch_map(execute.execute_nodes)
-
-            with tracer.trace("request:deref"):
-                if deref:
-                    result = result.zip(nodes).safe_map(
-                        lambda t: t[0]
-                        if isinstance(t[1].type, weave_types.RefType)
-                        else storage.deref(t[0])
-                    )
-
-        # print("Server request %s (%0.5fs): %s..." % (start_time,
-        #                                              time.time() - start_time, [n.from_op.name for n in nodes[:3]]))
-
-        logging.info("FINAL STATS\n%s" % pprint.pformat(stats.op_summary()))
-
-        # Forces output to be untagged
-        with tracer.trace("serialize_response"):
-            with isolated_tagging_context():
-                with wandb_api.from_environment():
-                    result = result.safe_map(serialize_fn)
-
-        logger.info("Server request done in: %ss" % (time.time() - start_time))
-        tag_store.clear_tag_store()
-        return HandleRequestResponse(result, nodes)
+            coalesce_key = None
+            if environment.request_coalescing_enabled():
+                coalesce_key = request_coalescing.request_key(
+                    nodes, deref, serialize_fn
+                )
+
+        if coalesce_key is None:
+            return _execute_request(nodes, deref, serialize_fn, start_time)
+
+        executed = False
+
+        def execute_request() -> HandleRequestResponse:
+            nonlocal executed
+            executed = True
+            return _execute_request(nodes, deref, serialize_fn, start_time)
+
+        response = request_coalescing.requests().do(
+            coalesce_key, execute_request, environment.request_result_ttl_sec()
+        )
+        root_span = tracer.current_root_span()
+        if root_span is not None:
+            root_span.set_tag("request_coalesced", not executed)
+        return response
+
+
+def _execute_request(
+    nodes: value_or_error.ValueOrErrors[graph.Node],
+    deref: bool,
+    serialize_fn: typing.Callable,
+    start_time: float,
+) -> HandleRequestResponse:
+    tracer = engine_trace.tracer()
+    with tracer.trace("request:execute"):
+        with execute.top_level_stats() as stats:
+            with context.execution_client():
+                with cache.time_interval_cache_prefix():
+                    with gql_json_cache.gql_json_cache_context():
+                        result = nodes.batch_map(execute.execute_nodes)
+
+        with tracer.trace("request:deref"):
+            if deref:
+                result = result.zip(nodes).safe_map(
+                    lambda t: t[0]
+                    if isinstance(t[1].type, weave_types.RefType)
+                    else storage.deref(t[0])
+                )
+
+    # print("Server request %s (%0.5fs): %s..." % (start_time,
+    #                                              time.time() - start_time, [n.from_op.name for n in nodes[:3]]))
+
+    logging.info("FINAL STATS\n%s" % pprint.pformat(stats.op_summary()))
+
+    # Forces output to be untagged
+    with tracer.trace("serialize_response"):
+        with isolated_tagging_context():
+            with wandb_api.from_environment():
+                result = result.safe_map(serialize_fn)
+
+    logger.info("Server request done in: %ss" % (time.time() - start_time))
+    tag_store.clear_tag_store()
+    return HandleRequestResponse(result, nodes)
 
 
 class SubprocessServer(multiprocessing.Process):
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+import weave
+from .. import arrow_stream
+from .. import serialize
+from .. import weave_server
+from ..ops_arrow import to_arrow
+
+
+def test_encode_response_round_trip(monkeypatch):
+    monkeypatch.setattr(arrow_stream, "ROWS_PER_BATCH", 2)
+    serialize_fn = arrow_stream.make_serializer()
+    awl = to_arrow([{"a": i, "b": str(i)} for i in range(5)])
+    result = serialize_fn(awl)
+    assert isinstance(result, arrow_stream.ArrowResult)
+
+    response = {"data": [result, {"x": 1}, None], "errors": [], "node_to_error": {}}
+    frames = list(arrow_stream.encode_response(response, lambda v: v))
+    # 3 record batches, the end of the stream, the json result and None,
+    # and the envelope.
+    assert len(frames) == 7
+    assert arrow_stream.decode_response(b"".join(frames)) == {
+        "data": [awl.to_pylist_notags(), {"x": 1}, None],
+        "errors": [],
+        "node_to_error": {},
+    }
+
+
+def _execute(graphs, headers=None):
+    client = weave_server.app.test_client()
+    return client.post(
+        "/__weave/execute", json={"graphs": graphs}, headers=headers or {}
+    )
+
+
+@pytest.mark.parametrize(
+    "accept, streams",
+    [
+        (None, False),
+        ("*/*", False),
+        ("application/json", False),
+        (arrow_stream.MIMETYPE, True),
+        (f"{arrow_stream.MIMETYPE}, application/json", True),
+    ],
+)
+def test_execute_negotiates_arrow_stream(accept, streams):
+    awl = to_arrow([{"a": i} for i in range(3)])
+    graphs = serialize.serialize([weave.save(awl), weave.save([1, 2])])
+    headers = {"Accept": accept} if accept is not None else {}
+    res = _execute(graphs, headers)
+    assert res.status_code == 200
+    if streams:
+        assert res.mimetype == arrow_stream.MIMETYPE
+        data = arrow_stream.decode_response(res.data)["data"]
+    else:
+        data = json.loads(res.data)["data"]
+    assert data == [[{"a": 0}, {"a": 1}, {"a": 2}], [1, 2]]
@@ -97,3 +97,33 @@ def test_clear_cache():
 
     # Ensure cache directory is in the same state as before the test
     assert len(os.listdir(cache_dir)) == orig_file_count
+
+
+def test_lru_time_window_cache_max_bytes():
+    curtime = {"t": datetime.datetime(2020, 1, 1)}
+
+    def now_fn():
+        return curtime["t"]
+
+    c = cache.LruTimeWindowCache(
+        datetime.timedelta(seconds=5),
+        now_fn=now_fn,
+        max_bytes=10,
+        size_fn=len,
+        refresh_on_get=False,
+    )
+    c.set("a", "xxxx")
+    c.set("b", "xxxx")
+    assert c.get("a") == "xxxx"
+    c.set("c", "xxxx")
+    # Over budget, the oldest value is evicted.
+    assert isinstance(c.get("a"), cache.LruTimeWindowCache.NotFound)
+    assert c.nbytes == 8
+
+    # Hits don't extend a value's time window.
+    curtime["t"] += datetime.timedelta(seconds=4)
+    assert c.get("b") == "xxxx"
+    c.set("c", "yyyy")
+    curtime["t"] += datetime.timedelta(seconds=2)
+    assert isinstance(c.get("b"), cache.LruTimeWindowCache.NotFound)
+    assert c.get("c") == "yyyy"
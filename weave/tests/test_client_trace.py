@@ -669,6 +669,32 @@ def test_trace_call_query_offset(client):
         assert len(inner_res.calls) == exp_count
 
 
+def test_trace_call_query_cursor(client):
+    call_spec = simple_line_call_bootstrap()
+
+    ids = []
+    cursor = None
+    while True:
+        inner_res = get_client_trace_server(client).calls_query(
+            tsi.CallsQueryReq(
+                project_id=get_client_project_id(client),
+                limit=4,
+                cursor=cursor,
+            )
+        )
+        ids.extend(c.id for c in inner_res.calls)
+        cursor = inner_res.next_cursor
+        if cursor is None:
+            break
+
+    assert len(ids) == len(set(ids)) == call_spec.total_calls
+    assert [c.id for c in client.calls()] == ids
+    streamed = get_client_trace_server(client).calls_query_stream(
+        tsi.CallsQueryReq(project_id=get_client_project_id(client))
+    )
+    assert [c.id for c in streamed] == ids
+
+
 def test_trace_call_sort(client):
     @weave.op()
     def basic_op(in_val: dict, delay) -> dict:
@@ -11,6 +11,10 @@ from .. import graph
 from .. import weave_types as types
 from .. import async_demo
 from .. import compile
+from .. import compile_cache
+from .. import errors
+from .. import context_state
+from .. import registry_mem
 from ..ops_arrow import to_arrow
 
 
@@ -315,3 +319,61 @@ def test_compile_lambda_on_refineable(user_by_api_key_in_env):
     with raise_on_python_bailout():
         val = use(mapped_node)
     assert val.to_pylist_raw() == list(range(1, 11))
+
+
+def _js_add_node(lhs, rhs):
+    return graph.OutputNode(
+        types.Number(),
+        "add",
+        {
+            "lhs": graph.ConstNode(types.List(types.Number()), lhs),
+            "rhs": graph.ConstNode(types.Number(), rhs),
+        },
+    )
+
+
+def _count_compiles(monkeypatch):
+    calls = []
+    orig_compile = compile._compile
+
+    def counting_compile(nodes):
+        calls.append(nodes)
+        return orig_compile(nodes)
+
+    monkeypatch.setattr(compile, "_compile", counting_compile)
+    compile_cache.clear_plan_cache()
+    return calls
+
+
+def test_compile_plan_cache_binds_new_params(monkeypatch):
+    calls = _count_compiles(monkeypatch)
+    assert use(_js_add_node([1, 2, 3], 2)) == [3, 4, 5]
+    assert use(_js_add_node([1, 2, 3], 5)) == [6, 7, 8]
+    assert len(calls) == 1
+
+    # Non-number consts are part of the key.
+    assert use(_js_add_node([1, 2], 5)) == [6, 7]
+    assert len(calls) == 2
+
+
+def test_compile_plan_cache_invalidation(monkeypatch):
+    calls = _count_compiles(monkeypatch)
+    assert use(_js_add_node([1], 2)) == [3]
+    registry_mem.memory_registry.mark_updated()
+    assert use(_js_add_node([1], 2)) == [3]
+    assert len(calls) == 2
+
+    with context_state.set_client_cache_key("other"):
+        assert use(_js_add_node([1], 2)) == [3]
+    assert len(calls) == 3
+
+
+def test_compile_pass_order_is_checked():
+    passes = [
+        compile.CompilePass("a", lambda nodes, on_error: nodes),
+        compile.CompilePass("b", lambda nodes, on_error: nodes, after=("c",)),
+        compile.CompilePass("c", lambda nodes, on_error: nodes),
+    ]
+    with pytest.raises(errors.WeaveInternalError):
+        compile._check_pass_order(passes)
+    compile._check_pass_order([passes[0], passes[2], passes[1]])
@@ -1,13 +1,23 @@
+import datetime
+import hashlib
+import threading
 import typing
 import os
 import weave
 from .. import api
+from .. import box
+from .. import ref_base
 from .. import weave_types as types
 from .. import weave_internal
 from .. import ops
 from .. import execute
+from .. import op_policy
 from .. import environment
+from .. import trace_local
+from .. import ops_arrow as arrow
+from ..language_features.tagging import tag_store
 from . import test_wb
+import pyarrow as pa
 import pytest
 
 
@@ -40,6 +50,43 @@ def _test_execute_refining_op(x: int) -> typing.Any:
     return x + 1
 
 
+_SCHEDULER_TEST_EVENT = threading.Event()
+
+
+@api.op(input_type={"x": types.Int()}, output_type=types.Boolean(), hidden=True)
+def _test_execute_wait_for_event_op(x):
+    return _SCHEDULER_TEST_EVENT.wait(5)
+
+
+@api.op(input_type={"x": types.Int()}, output_type=types.Int(), hidden=True)
+def _test_execute_set_event_op(x):
+    _SCHEDULER_TEST_EVENT.set()
+    return x
+
+
+_BATCH_CALLS: list[list[dict]] = []
+
+
+def _test_execute_add_one_batch(inputs_list):
+    _BATCH_CALLS.append(inputs_list)
+    return [inputs["x"] + 1 for inputs in inputs_list]
+
+
+@api.op(
+    input_type={"x": types.Int()},
+    output_type=types.Int(),
+    hidden=True,
+    resolve_batch=_test_execute_add_one_batch,
+)
+def _test_execute_add_one(x):
+    raise AssertionError("single resolver should not be called for batches")
+
+
+@api.op(input_type={"n": types.Int()}, output_type=types.List(types.Int()), hidden=True)
+def _test_execute_range(n):
+    return list(range(n))
+
+
 _context_state.clear_loading_built_ins(_loading_builtins_token)
 
 
@@ -61,6 +108,108 @@ def test_execute_no_cache():
     assert res.unwrap() == [12]
 
 
+def test_run_output_cache_serves_repeat_reads(monkeypatch):
+    node = _test_execute_range(3)
+    # Computed and saved, then read back from disk into the run output cache.
+    assert api.use(node) == [0, 1, 2]
+    assert api.use(node) == [0, 1, 2]
+    assert len(trace_local.run_output_cache()) == 1
+
+    def fail_get_run_val(run_key):
+        raise AssertionError("run was read from disk")
+
+    monkeypatch.setattr(execute.TRACE_LOCAL, "get_run_val", fail_get_run_val)
+    res = api.use(node)
+    assert res == [0, 1, 2]
+    # Changing one request's output doesn't change the cached one.
+    res.append(3)
+    assert api.use(node) == [0, 1, 2]
+
+    trace_local.invalidate_run_output_cache()
+    assert len(trace_local.run_output_cache()) == 0
+
+
+class _TestRunOutputRef(ref_base.Ref):
+    @property
+    def type(self):
+        return self._type
+
+
+def test_run_output_cache_hits_get_their_own_output():
+    cache = trace_local.RunOutputCache(1024 * 1024)
+    run_key = trace_local.RunKey("op", "x")
+    awl = arrow.to_arrow([{"a": i} for i in range(10)])
+    cache.set(run_key, _TestRunOutputRef(awl, types.TypeRegistry.type_of(awl)))
+
+    hits = [cache.get(run_key) for _ in range(2)]
+    assert hits[0]._obj is not hits[1]._obj
+    for hit in hits:
+        assert hit._obj is not awl
+        assert hit._obj._arrow_data is awl._arrow_data
+        assert ref_base.get_ref(hit._obj) is hit
+    # Tagging a hit's output leaves the cached output untagged.
+    with tag_store.isolated_tagging_context():
+        tag_store.add_tags(hits[0]._obj, {"a": 1})
+        assert not tag_store.is_tagged(hits[1]._obj)
+
+
+def _arrow_digest(data):
+    hash = hashlib.md5()
+    trace_local._hash_arrow(hash, data)
+    return hash.hexdigest()
+
+
+def test_run_key_arrow_hash_sliced_children():
+    x = pa.array([0, 1, 2, 3, 4])
+    assert _arrow_digest(
+        pa.StructArray.from_arrays([x.slice(0, 4)], names=["a"])
+    ) != _arrow_digest(pa.StructArray.from_arrays([x.slice(1, 4)], names=["a"]))
+
+    offsets = pa.array([0, 2, 4], type=pa.int32())
+    assert _arrow_digest(
+        pa.ListArray.from_arrays(offsets, x.slice(0, 4))
+    ) != _arrow_digest(pa.ListArray.from_arrays(offsets, x.slice(1, 4)))
+
+
+def test_run_key_value_ids():
+    values = [1, 1.0, True, "1", None, [1], [1.0], {"a": 1}, {"a": [1, "x"]}]
+    ids = [trace_local._value_id(v) for v in values]
+    assert len(set(ids)) == len(values)
+    assert trace_local._value_id({"a": [1, "x"]}) == ids[-1]
+
+    awl = arrow.to_arrow([{"a": i} for i in range(10)])
+    assert trace_local._value_id(awl) == trace_local._value_id(
+        arrow.to_arrow([{"a": i} for i in range(10)])
+    )
+    assert trace_local._value_id(awl) != trace_local._value_id(awl._slice(1, 10))
+
+    # Values we don't stream are hashed through to_python.
+    now = datetime.datetime.now()
+    assert trace_local._value_id([now]) == trace_local._value_id([now])
+
+    with tag_store.isolated_tagging_context(), trace_local.value_digests():
+        plain = [1, 2, 3]
+        plain_id = trace_local._value_id(plain)
+        # Memoized by identity for the request.
+        plain.append(4)
+        assert trace_local._value_id(plain) == plain_id
+
+        # Tags are part of the value id, and not memoized.
+        tagged = box.box([1, 2, 3])
+        assert trace_local._value_id(tagged) == plain_id
+        tag_store.add_tags(tagged, {"a": 1})
+        tagged_id = trace_local._value_id(tagged)
+        assert tagged_id != plain_id
+        tag_store.add_tags(tagged, {"a": 2})
+        assert trace_local._value_id(tagged) != tagged_id
+
+        item = box.box({"b": 1})
+        nested = [item]
+        nested_id = trace_local._value_id(nested)
+        tag_store.add_tags(item, {"a": 1})
+        assert trace_local._value_id(nested) != nested_id
+
+
 @pytest.fixture()
 def weave_cache_mode_minimal():
     orig_cache_mode = environment.cache_mode
@@ -113,6 +262,68 @@ def test_we_dont_over_execute(fake_wandb):
     assert summary["count"] - summary["already_executed"] == 16
 
 
+def test_downstream_nodes_do_not_wait_for_parallel_ops(monkeypatch):
+    # The waiting op runs in a worker thread. The setting op only becomes ready
+    # after its input executes, so this checks that downstream nodes are
+    # scheduled as soon as their inputs are ready, not after every node at
+    # the same depth (including the waiting op) has finished.
+    monkeypatch.setattr(
+        op_policy,
+        "PARALLEL_OP_NAMES",
+        op_policy.PARALLEL_OP_NAMES + [_test_execute_wait_for_event_op.name],
+    )
+    _SCHEDULER_TEST_EVENT.clear()
+    one = weave_internal.make_const_node(types.Int(), 1)
+    waited = _test_execute_wait_for_event_op(one)
+    set_event = _test_execute_set_event_op(one + 1)
+    res = execute.execute_nodes([waited, set_event], no_cache=True)
+    assert res.unwrap() == [True, 2]
+
+
+def test_same_op_nodes_use_batch_resolver():
+    _BATCH_CALLS.clear()
+    nodes = [
+        _test_execute_add_one(weave_internal.make_const_node(types.Int(), i))
+        for i in range(5)
+    ]
+    res = execute.execute_nodes(nodes, no_cache=True)
+    assert res.unwrap() == [1, 2, 3, 4, 5]
+    assert len(_BATCH_CALLS) == 1
+    assert [inputs["x"] for inputs in _BATCH_CALLS[0]] == [0, 1, 2, 3, 4]
+
+
+def test_batch_node_cache_error_only_fails_that_node(monkeypatch):
+    _BATCH_CALLS.clear()
+    orig_write_cache = execute._execute_forward_node_write_cache
+
+    def write_cache(pending, result):
+        if result == 3:
+            raise ValueError("write failed")
+        return orig_write_cache(pending, result)
+
+    monkeypatch.setattr(execute, "_execute_forward_node_write_cache", write_cache)
+    nodes = [
+        _test_execute_add_one(weave_internal.make_const_node(types.Int(), i))
+        for i in range(5)
+    ]
+    res = execute.execute_nodes(nodes, no_cache=True)
+    items = list(res.iter_items())
+    assert [v for v, _ in items] == [1, 2, None, 4, 5]
+    assert isinstance(items[2][1], ValueError)
+    assert len(_BATCH_CALLS) == 1
+
+
+def test_batch_resolver_flows_tags():
+    _BATCH_CALLS.clear()
+    tagged_list = ops.make_list(a=10, b=20, c=30).createIndexCheckpointTag()
+    nodes = [_test_execute_add_one(tagged_list[i]) for i in range(3)]
+    res = execute.execute_nodes(
+        nodes + [n.indexCheckpoint() for n in nodes], no_cache=True
+    )
+    assert res.unwrap() == [11, 21, 31, 0, 1, 2]
+    assert len(_BATCH_CALLS) == 1
+
+
 def table_mock_respecting_run_name(q, ndx):
     # this is a more realistic gql responder that will only return run displayName
     # if its selected.
@@ -63,3 +63,11 @@ if os.path.exists(execute_path):
         execute_str = f.read()
     if execute_str and execute_str != "":
         execute_payloads: list[dict] = [json.loads(execute_str)]
+
+# Paste lines captured by request_capture into requests.jsonl
+requests_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "requests.jsonl"
+)
+if os.path.exists(requests_path):
+    with open(requests_path, "r") as f:
+        execute_payloads.extend(json.loads(line) for line in f if line.strip())
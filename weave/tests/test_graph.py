@@ -2,6 +2,7 @@ import weave
 from .. import weave_types as types
 from .. import weave_internal
 from .. import graph
+from .. import graph_debug
 
 
 def test_map_dag_produces_same_len():
@@ -102,3 +103,49 @@ def test_replace_node():
 
     x = graph.map_nodes_top_level([d], replace_c)[0]
     assert weave.use(x) == 6.75
+
+
+def test_map_nodes_full_fused_matches_sequential():
+    a = weave_internal.make_var_node(types.Int(), "a")
+    b = a + 3
+    c = a + 4
+    d = b + c
+
+    def replace_var(node):
+        if isinstance(node, graph.VarNode):
+            return weave_internal.make_var_node(types.Int(), "b")
+        return node
+
+    def wrap_adds(node):
+        # Returns new nodes, only the map fns after this one see them.
+        if isinstance(node, graph.OutputNode) and node.from_op.name == "number-add":
+            return weave_internal.make_output_node(
+                types.Int(), "number-negate", {"val": node}
+            )
+        return node
+
+    visited = []
+
+    def record(node):
+        visited.append(node)
+        return node
+
+    map_fns = [replace_var, wrap_adds, record]
+    sequential = [d]
+    for map_fn in map_fns:
+        sequential = graph.map_nodes_full(sequential, map_fn)
+    n_sequential_visits = len(visited)
+    visited.clear()
+
+    fused = graph.map_nodes_full_fused([d], map_fns)
+    assert graph_debug.node_expr_str_full(fused[0]) == graph_debug.node_expr_str_full(
+        sequential[0]
+    )
+    assert len(visited) == n_sequential_visits
+    # The shared input is still shared.
+    negated_b = fused[0].from_op.inputs["val"].from_op.inputs["lhs"]
+    negated_c = fused[0].from_op.inputs["val"].from_op.inputs["rhs"]
+    assert (
+        negated_b.from_op.inputs["val"].from_op.inputs["lhs"]
+        is negated_c.from_op.inputs["val"].from_op.inputs["lhs"]
+    )
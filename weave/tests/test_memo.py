@@ -0,0 +1,53 @@
+import pyarrow as pa
+
+from .. import memo
+from ..arrow.list_ import ArrowWeaveList
+from .. import weave_types as types
+
+
+def test_memo_caches_within_storage():
+    calls = []
+
+    @memo.memo
+    def double(x):
+        calls.append(x)
+        return x * 2
+
+    with memo.memo_storage():
+        assert double(2) == 4
+        assert double(2) == 4
+        assert double(3) == 6
+        storage = memo._memo_storage.get()
+        assert storage is not None
+        assert storage.hits_and_misses() == {
+            "test_memo_caches_within_storage.<locals>.double": (1, 2)
+        }
+    assert calls == [2, 3]
+
+    # No storage, no memoization
+    double(2)
+    assert calls == [2, 3, 2]
+
+
+def test_memo_storage_evicts_least_recently_used():
+    storage = memo.MemoStorage(max_bytes=3 * memo._value_nbytes("a"))
+    storage.set("a", "a")
+    storage.set("b", "b")
+    storage.set("c", "c")
+    # Touch a, so b is the least recently used
+    assert storage.get("f", "a") == "a"
+    storage.set("d", "d")
+    assert storage.get("f", "b") is memo.NO_VALUE
+    assert [storage.get("f", k) for k in ["a", "c", "d"]] == ["a", "c", "d"]
+    assert storage.nbytes == 3 * memo._value_nbytes("a")
+
+
+def test_memo_storage_sizes_arrow_values():
+    awl = ArrowWeaveList(pa.array(list(range(1000))), types.Int())
+    assert memo._value_nbytes(awl) == awl._arrow_data.nbytes
+    assert memo._value_nbytes([awl, awl]) >= 2 * awl._arrow_data.nbytes
+
+    storage = memo.MemoStorage(max_bytes=awl._arrow_data.nbytes - 1)
+    storage.set("awl", awl)
+    assert storage.get("f", "awl") is memo.NO_VALUE
+    assert storage.nbytes == 0
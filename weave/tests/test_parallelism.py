@@ -0,0 +1,65 @@
+import contextvars
+import threading
+
+import pytest
+
+from .. import parallelism
+
+_test_var: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "_test_parallelism_var", default="unset"
+)
+
+
+def test_do_in_parallel_preserves_order():
+    res = list(parallelism.do_in_parallel(lambda x: x * 2, list(range(50))))
+    assert res == [x * 2 for x in range(50)]
+
+
+def test_do_in_parallel_propagates_context():
+    token = _test_var.set("set")
+    try:
+        res = list(
+            parallelism.do_in_parallel(lambda x: (_test_var.get(), x), list(range(8)))
+        )
+    finally:
+        _test_var.reset(token)
+    assert res == [("set", x) for x in range(8)]
+
+
+def test_do_in_parallel_splits_budget():
+    budgets = list(
+        parallelism.do_in_parallel(
+            lambda x: parallelism.get_parallel_budget(), list(range(4))
+        )
+    )
+    assert budgets == [parallelism.MAX_PARALLELISM // 4] * 4
+
+
+def test_do_in_parallel_raises_item_exception():
+    def do_one(x):
+        if x == 3:
+            raise ValueError("bad item")
+        return x
+
+    with pytest.raises(ValueError, match="bad item"):
+        list(parallelism.do_in_parallel(do_one, list(range(6))))
+
+
+def test_nested_do_in_parallel_does_not_deadlock(monkeypatch):
+    # With a tiny shared pool, every pool thread ends up waiting on nested
+    # work. The waiting threads must run that work themselves.
+    monkeypatch.setattr(parallelism, "_POOL", None)
+    monkeypatch.setattr(parallelism.environment, "parallelism_pool_size", lambda: 2)
+    seen_threads = set()
+
+    def inner(x):
+        seen_threads.add(threading.get_ident())
+        return x + 1
+
+    def outer(x):
+        with parallelism.parallel_budget_ctx(4):
+            return sum(parallelism.do_in_parallel(inner, list(range(x))))
+
+    res = list(parallelism.do_in_parallel(outer, list(range(10))))
+    assert res == [sum(range(1, x + 1)) for x in range(10)]
+    assert len(seen_threads) <= 3
@@ -0,0 +1,55 @@
+import json
+
+from .. import request_capture
+
+
+def test_capture_writes_one_request_per_line(tmp_path):
+    path = str(tmp_path / "requests.jsonl")
+    capture = request_capture.RequestCapture(path, max_bytes=1024 * 1024)
+    capture.capture(json.dumps({"graphs": {"nodes": [], "targetNodes": []}}))
+    capture.capture('{"graphs": {"nodes": ["%s"], "targetNodes": []}}')
+    capture.stop()
+    with open(path) as f:
+        lines = [json.loads(line) for line in f]
+    assert lines == [
+        {"graphs": {"nodes": [], "targetNodes": []}},
+        {"graphs": {"nodes": ["%s"], "targetNodes": []}},
+    ]
+
+
+def test_capture_rotates(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    capture = request_capture.RequestCapture(str(path), max_bytes=100)
+    for i in range(10):
+        capture.capture(json.dumps({"graphs": "x" * 40, "i": i}))
+    capture.stop()
+    rotated = sorted(p.name for p in tmp_path.iterdir())
+    assert rotated[0] == "requests.jsonl"
+    assert len(rotated) == 1 + request_capture.BACKUP_COUNT
+    with open(path) as f:
+        assert [json.loads(line)["i"] for line in f] == [9]
+
+
+def test_capture_request_from_env(tmp_path, monkeypatch):
+    path = tmp_path / "requests.jsonl"
+    monkeypatch.setenv("WEAVE_REQUEST_CAPTURE_PATH", str(path))
+    monkeypatch.setattr(request_capture, "_capture", None)
+
+    assert not request_capture.should_capture({})
+    assert not request_capture.should_capture({request_capture.CAPTURE_HEADER: "1"})
+    monkeypatch.setenv("WEAVE_REQUEST_CAPTURE_ON_HEADER", "true")
+    assert request_capture.should_capture({request_capture.CAPTURE_HEADER: "1"})
+    monkeypatch.setenv("WEAVE_REQUEST_CAPTURE_SAMPLE_RATE", "1")
+    assert request_capture.should_capture({})
+
+    # Pretty printed bodies are written on one line.
+    body = json.dumps({"graphs": {"nodes": [], "targetNodes": []}}, indent=2)
+    request_capture.capture_request(body.encode())
+    # Bodies that aren't utf-8 json are skipped.
+    request_capture.capture_request(b"\xff")
+    request_capture.capture_request(b"{\n")
+    capture = request_capture.get_capture()
+    assert capture is not None and capture.path == str(path)
+    capture.stop()
+    with open(path) as f:
+        assert [json.loads(line) for line in f] == [json.loads(body)]
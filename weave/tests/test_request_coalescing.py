@@ -0,0 +1,173 @@
+import threading
+import time
+
+import pytest
+
+from .. import graph
+from .. import request_coalescing
+from .. import server
+from .. import serialize
+from .. import storage
+from .. import weave_types as types
+
+
+def _run_concurrently(n, fn):
+    results = [None] * n
+
+    def run(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def test_single_flight_shares_concurrent_result():
+    flight = request_coalescing.SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return "result"
+
+    leader, leader_result = _run_concurrently(1, lambda: flight.do("k", fn))
+    started.wait()
+    followers, results = _run_concurrently(3, lambda: flight.do("k", fn))
+    while flight.stats().coalesced < 3:
+        time.sleep(0.01)
+    release.set()
+    for t in leader + followers:
+        t.join()
+
+    assert calls == [1]
+    assert leader_result == ["result"]
+    assert results == ["result"] * 3
+    assert flight.stats() == request_coalescing.SingleFlightStats(
+        executions=1, coalesced=3
+    )
+
+    # Done calls are not reused without a ttl.
+    assert flight.do("k", lambda: "again") == "again"
+
+
+def test_single_flight_shares_exception():
+    flight = request_coalescing.SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fn():
+        started.set()
+        release.wait()
+        raise ValueError("boom")
+
+    leader, leader_result = _run_concurrently(1, lambda: flight.do("k", fn))
+    started.wait()
+    followers, results = _run_concurrently(1, lambda: flight.do("k", fn))
+    while flight.stats().coalesced < 1:
+        time.sleep(0.01)
+    release.set()
+    for t in leader + followers:
+        t.join()
+    assert isinstance(leader_result[0], ValueError)
+    assert results[0] is leader_result[0]
+    with pytest.raises(KeyError):
+        flight.do("k", lambda: {}["missing"])
+
+
+def test_single_flight_result_ttl():
+    now = [0.0]
+    flight = request_coalescing.SingleFlight(now_fn=lambda: now[0])
+    assert flight.do("k", lambda: 1, result_ttl=5) == 1
+    now[0] = 4
+    assert flight.do("k", lambda: 2, result_ttl=5) == 1
+    now[0] = 6
+    assert flight.do("k", lambda: 3, result_ttl=5) == 3
+    assert flight.stats().result_cache_hits == 1
+
+
+def _request(val):
+    node = graph.OutputNode(
+        types.Number(),
+        "number-add",
+        {
+            "lhs": graph.ConstNode(types.Number(), val),
+            "rhs": graph.ConstNode(types.Number(), 1),
+        },
+    )
+    return {"graphs": serialize.serialize([node])}
+
+
+def test_handle_request_coalesces_identical_requests(monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    executions = []
+    orig_execute_request = server._execute_request
+
+    def blocking_execute_request(*args, **kwargs):
+        executions.append(1)
+        started.set()
+        release.wait()
+        return orig_execute_request(*args, **kwargs)
+
+    monkeypatch.setattr(server, "_execute_request", blocking_execute_request)
+    stats_before = request_coalescing.requests().stats()
+
+    leader, leader_result = _run_concurrently(
+        1,
+        lambda: server.handle_request(_request(1), True, storage.make_js_serializer()),
+    )
+    started.wait()
+    followers, results = _run_concurrently(
+        2,
+        lambda: server.handle_request(_request(1), True, storage.make_js_serializer()),
+    )
+    while request_coalescing.requests().stats().coalesced < (
+        stats_before.coalesced + 2
+    ):
+        time.sleep(0.01)
+    release.set()
+    # A different graph is not coalesced.
+    assert server.handle_request(
+        _request(2), True, storage.make_js_serializer()
+    ).results.unwrap() == [3]
+    for t in leader + followers:
+        t.join()
+
+    assert len(executions) == 2
+    assert [r.results.unwrap() for r in leader_result + results] == [[2]] * 3
+
+
+def test_request_key():
+    nodes = serialize.deserialize(_request(1)["graphs"])
+    key = request_coalescing.request_key(nodes, True, storage.make_js_serializer())
+    assert key is not None
+    assert key == request_coalescing.request_key(
+        nodes, True, storage.make_js_serializer()
+    )
+    assert key != request_coalescing.request_key(
+        nodes, False, storage.make_js_serializer()
+    )
+    mutation = graph.OutputNode(
+        types.Any(),
+        "set",
+        {
+            "self": nodes.unwrap()[0],
+            "val": graph.ConstNode(types.Number(), 5),
+        },
+    )
+    assert (
+        request_coalescing.request_key(
+            serialize.deserialize(serialize.serialize([mutation])),
+            True,
+            storage.to_python,
+        )
+        is None
+    )
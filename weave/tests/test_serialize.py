@@ -182,3 +182,61 @@ def test_lambda_node_serialization():
         serialize.serialize([mapped_1, mapped_2])
     ).unwrap()
     assert des_1 is not des_2
+
+
+def test_node_id_dedupe():
+    def const_add(lhs, rhs):
+        return graph.OutputNode(
+            types.Number(),
+            "number-add",
+            {
+                "lhs": graph.ConstNode(types.Number(), lhs),
+                "rhs": graph.ConstNode(types.Number(), rhs),
+            },
+        )
+
+    assert serialize.node_id(const_add(1, 2)) == serialize.node_id(const_add(1, 2))
+    assert serialize.node_id(const_add(1, 2)) != serialize.node_id(const_add(2, 1))
+    # Same value, different types.
+    assert serialize.node_id(graph.ConstNode(types.Int(), 1)) != serialize.node_id(
+        graph.ConstNode(types.Number(), 1)
+    )
+    assert serialize.node_id(graph.ConstNode(types.Number(), 1)) != serialize.node_id(
+        graph.ConstNode(types.Number(), 1.0)
+    )
+    # Field boundaries can't be confused.
+    assert serialize.node_id(
+        graph.ConstNode(types.String(), "ab")
+    ) != serialize.node_id(graph.ConstNode(types.String(), "a"))
+
+    row_type = types.TypedDict({"a": types.Number()})
+    fn_1 = graph.ConstNode(
+        types.Function({"row": row_type}, types.Number()),
+        graph.VarNode(row_type, "row"),
+    )
+    fn_2 = graph.ConstNode(
+        types.Function({"row": row_type}, types.Number()),
+        graph.VarNode(row_type, "x"),
+    )
+    assert serialize.node_id(fn_1) != serialize.node_id(fn_2)
+
+
+def test_deserialize_dedupes_equal_nodes():
+    node_1 = graph.OutputNode(
+        types.Number(),
+        "number-add",
+        {
+            "lhs": graph.ConstNode(types.Number(), 1),
+            "rhs": graph.ConstNode(types.Number(), 2),
+        },
+    )
+    node_2 = graph.OutputNode(
+        types.Number(),
+        "number-add",
+        {
+            "lhs": graph.ConstNode(types.Number(), 1),
+            "rhs": graph.ConstNode(types.Number(), 2),
+        },
+    )
+    [des_1, des_2] = serialize.deserialize(serialize.serialize([node_1, node_2]))
+    assert des_1 is des_2
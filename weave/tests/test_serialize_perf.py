@@ -0,0 +1,79 @@
+# Performance test for deserializing large board requests. Remove the skip
+# marker, run it with
+#   pytest weave/tests/test_serialize_perf.py -s
+# and compare the timings it prints.
+import time
+
+import pytest
+
+from .. import graph
+from .. import serialize
+from .. import weave_types as types
+
+
+def _board_request(n_panels: int) -> serialize.SerializedReturnType:
+    # Roughly the shape of a board: each panel picks a few columns out of
+    # the same table rows and maps over them, with a lot of shared nodes.
+    row_type = types.TypedDict(
+        {"a": types.Number(), "b": types.String(), "c": types.List(types.Int())}
+    )
+    rows = graph.ConstNode(
+        types.List(row_type),
+        [{"a": i, "b": str(i), "c": [i, i + 1]} for i in range(20)],
+    )
+    panels = []
+    for i in range(n_panels):
+        row = graph.VarNode(row_type, "row")
+        body = graph.OutputNode(
+            types.Number(),
+            "number-add",
+            {
+                "lhs": graph.OutputNode(
+                    types.Number(),
+                    "pick",
+                    {"obj": row, "key": graph.ConstNode(types.String(), "a")},
+                ),
+                "rhs": graph.ConstNode(types.Number(), i),
+            },
+        )
+        fn = graph.ConstNode(types.Function({"row": row_type}, types.Number()), body)
+        mapped = graph.OutputNode(
+            types.List(types.Number()), "map", {"arr": rows, "mapFn": fn}
+        )
+        panels.append(
+            graph.OutputNode(
+                types.Number(),
+                "count",
+                {
+                    "arr": graph.OutputNode(
+                        types.List(types.Number()),
+                        "limit",
+                        {
+                            "arr": mapped,
+                            "limit": graph.ConstNode(types.Number(), 50 + i % 3),
+                        },
+                    )
+                },
+            )
+        )
+    return serialize.serialize(panels)
+
+
+def test_board_request_size():
+    # Each panel adds 10 serialized nodes, 500 panels is a 5k node request.
+    request = _board_request(500)
+    assert len(request["nodes"]) > 5000
+
+
+@pytest.mark.skip(reason="Performance test")
+def test_deserialize_perf():
+    request = _board_request(500)
+    timings = []
+    for _ in range(5):
+        start_time = time.time()
+        serialize.deserialize(request)
+        timings.append(time.time() - start_time)
+    print("DESERIALIZE 5K NODES", min(timings))
+    # About 0.26s before node ids were hashed incrementally, 0.12s after, on
+    # a linux workstation.
+    assert min(timings) < 0.2
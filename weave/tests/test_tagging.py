@@ -362,3 +362,29 @@ def test_unwrap_rewrap_tags():
     unwrapped, rewrap = tagged_value_type_helpers.unwrap_tags(t6)
     assert unwrapped == t6
     assert rewrap(unwrapped) == t6
+
+
+def test_tag_store_chains_parent_tags():
+    store = tag_store.TagStore()
+    store.set(1, 100, {"a": 1})
+    # A long chain of nodes only stores the tags each node added.
+    for node_id in range(2, 1000):
+        store.add_parents(node_id, [node_id - 1])
+    assert store.get(999, 100) == {"a": 1}
+    assert store.get(999, 101) is None
+    assert store.num_entries() == 1
+
+    # Later parents take precedence, own tags over parents'.
+    store.set(2000, 100, {"a": 2})
+    store.add_parents(3000, [1, 2000])
+    assert store.get(3000, 100) == {"a": 2}
+    store.set(3000, 100, {"a": 3})
+    assert store.get(3000, 100) == {"a": 3}
+
+    # Entering a node again gives its parents' tags precedence again.
+    store.add_parents(3000, [1])
+    assert store.get(3000, 100) == {"a": 1}
+
+    store.remove(100)
+    assert store.get(999, 100) is None
+    assert store.num_entries() == 0
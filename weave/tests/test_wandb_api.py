@@ -0,0 +1,98 @@
+import asyncio
+import base64
+import http.server
+import json
+import threading
+
+import gql
+import pytest
+
+from .. import wandb_api
+from .. import wandb_client_api
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests: list = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        _Handler.requests.append(
+            {
+                "client_port": self.client_address[1],
+                "authorization": self.headers.get("Authorization"),
+                "cookie": self.headers.get("Cookie"),
+                "query": json.loads(body)["query"],
+            }
+        )
+        res = json.dumps({"data": {"viewer": {"username": "user"}}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(res)))
+        self.send_header("Set-Cookie", "session=abc; Path=/")
+        self.end_headers()
+        self.wfile.write(res)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def gql_server(monkeypatch):
+    _Handler.requests = []
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("WANDB_BASE_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(wandb_api, "_adapter", None)
+    monkeypatch.setattr(wandb_api, "_session", None)
+    yield
+    server.shutdown()
+
+
+VIEWER_QUERY = gql.gql("query Viewer { viewer { username } }")
+
+
+def _basic_auth(api_key):
+    return "Basic " + base64.b64encode(f"api:{api_key}".encode()).decode()
+
+
+def test_queries_share_pooled_connections(gql_server):
+    api = wandb_api.WandbApi()
+    with wandb_api.wandb_api_context(
+        wandb_api.WandbApiContext(None, "key1", None, None)
+    ):
+        assert api.query(VIEWER_QUERY) == {"viewer": {"username": "user"}}
+        # The wbgqlquery path goes through the same pool.
+        wandb_client_api.wandb_gql_query("query Viewer { viewer { username } }")
+    with wandb_api.wandb_api_context(
+        wandb_api.WandbApiContext(None, None, None, {"wandb": "c"})
+    ):
+        api.query(VIEWER_QUERY)
+
+    reqs = _Handler.requests
+    assert len(reqs) == 3
+    assert len({r["client_port"] for r in reqs}) == 1
+    assert [r["authorization"] for r in reqs] == [
+        _basic_auth("key1"),
+        _basic_auth("key1"),
+        None,
+    ]
+    # Cookies set by responses aren't sent on behalf of other users.
+    assert [r["cookie"] for r in reqs] == [None, None, "wandb=c"]
+
+
+def test_async_queries_share_pooled_connections(gql_server):
+    async def run():
+        with wandb_api.wandb_api_context(
+            wandb_api.WandbApiContext(None, "key1", None, None)
+        ):
+            for _ in range(2):
+                api = wandb_api.WandbApiAsync()
+                assert await api.query(VIEWER_QUERY) == {"viewer": {"username": "user"}}
+
+    asyncio.run(run())
+    reqs = _Handler.requests
+    assert len(reqs) == 2
+    assert len({r["client_port"] for r in reqs}) == 1
+    assert reqs[1]["authorization"] == _basic_auth("key1")
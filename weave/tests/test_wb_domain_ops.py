@@ -3,9 +3,11 @@ import weave
 from .. import ops as ops
 import graphql
 from . import fixture_fakewandb as fwb
+from .. import context_state
 from .. import registry_mem
 from ..language_features.tagging import tagged_value_type
 from ..ops_domain import wb_domain_types
+from ..ops_domain import wbgqlquery_op
 from ..ops_primitives import _dict_utils
 import wandb
 
@@ -547,3 +549,27 @@ def test_null_propagation_through_nonnull_gql_ops(fake_wandb):
     # this should fail?
     node = ops.project("e_0", "p_0").run("r_0").name()
     assert weave.use(node) == None
+
+
+def test_gql_response_cache(fake_wandb, monkeypatch):
+    fake_wandb.fake_api.add_mock(
+        lambda query, ndx: {
+            "project_518fa79465d8ffaeb91015dce87e092f": fwb.project_payload
+        }
+    )
+    node = ops.project("stacey", "mendeleev").name()
+    assert weave.use(node) == "mendeleev"
+    assert weave.use(node) == "mendeleev"
+    assert len(fake_wandb.fake_api.execute_log()) == 2
+
+    monkeypatch.setenv("WEAVE_GQL_RESPONSE_CACHE_TTL_SEC", "60")
+    monkeypatch.setattr(wbgqlquery_op, "_response_cache", None)
+    assert weave.use(node) == "mendeleev"
+    assert weave.use(node) == "mendeleev"
+    assert len(fake_wandb.fake_api.execute_log()) == 3
+
+    # A new client cache key gets fresh results.
+    with context_state.set_client_cache_key("1"):
+        assert weave.use(node) == "mendeleev"
+        assert weave.use(node) == "mendeleev"
+    assert len(fake_wandb.fake_api.execute_log()) == 4
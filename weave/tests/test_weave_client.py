@@ -19,6 +19,7 @@ from weave.trace.refs import (
 )
 
 from weave.trace import refs
+from weave.trace import vals
 from weave.trace.tests.testutil import ObjectRefStrMatcher
 from weave.trace.isinstance import weave_isinstance
 from weave.trace_server.trace_server_interface import (
@@ -170,6 +171,59 @@ def test_obj_with_table(client):
     assert row_vals[2]["a"] == 3
 
 
+def test_obj_with_table_reads_pages(client, monkeypatch):
+    class ObjWithTable(weave.Object):
+        table: weave_client.Table
+
+    n_rows = vals.TABLE_PAGE_SIZE * 2 + 5
+    o = ObjWithTable(table=weave_client.Table([{"a": i} for i in range(n_rows)]))
+    res = client.save_object(o, "my-obj")
+    table = client.get(res).table
+
+    queries = []
+    table_query = client.server.table_query
+
+    def counting_table_query(req):
+        queries.append(req)
+        return table_query(req)
+
+    monkeypatch.setattr(client.server, "table_query", counting_table_query)
+
+    assert table[vals.TABLE_PAGE_SIZE + 1]["a"] == vals.TABLE_PAGE_SIZE + 1
+    assert len(table) == n_rows
+    assert len(queries) == 1
+    assert table[-1]["a"] == n_rows - 1
+    assert [r["a"] for r in table[2:5]] == [2, 3, 4]
+    assert table[table[7].ref.extra[-1]]["a"] == 7
+    with pytest.raises(IndexError):
+        table[n_rows]
+    with pytest.raises(KeyError):
+        table["not-a-row"]
+    assert [r["a"] for r in table] == list(range(n_rows))
+    assert len(queries) == 4
+
+
+def test_table_len_without_stats(client, monkeypatch):
+    class ObjWithTable(weave.Object):
+        table: weave_client.Table
+
+    n_rows = vals.TABLE_PAGE_SIZE * 2
+    o = ObjWithTable(table=weave_client.Table([{"a": i} for i in range(n_rows)]))
+    res = client.save_object(o, "my-obj")
+    table = client.get(res).table
+
+    table_query = client.server.table_query
+
+    def table_query_without_stats(req):
+        res = table_query(req)
+        res.stats = None
+        return res
+
+    monkeypatch.setattr(client.server, "table_query", table_query_without_stats)
+
+    assert len(table) == n_rows
+
+
 def test_pydantic(client):
     class A(pydantic.BaseModel):
         a: int
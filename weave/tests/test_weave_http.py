@@ -0,0 +1,159 @@
+import hashlib
+import http.server
+import os
+import threading
+
+import pytest
+
+from .. import errors
+from .. import filesystem
+from .. import request_coalescing
+from .. import wandb_file_manager
+from .. import weave_http
+
+CONTENT = bytes(range(256)) * 1000
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    requests: list = []
+
+    def do_GET(self):
+        _Handler.requests.append(self.headers.get("Range"))
+        range_header = self.headers.get("Range")
+        if self.path == "/empty":
+            body = b""
+            if range_header is not None:
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */0")
+            else:
+                self.send_response(200)
+        elif range_header is not None and self.path != "/no-ranges":
+            start_str, end_str = range_header.removeprefix("bytes=").split("-")
+            start = int(start_str)
+            end = int(end_str) if end_str else len(CONTENT) - 1
+            body = CONTENT[start : end + 1]
+            self.send_response(206)
+            total = "*" if self.path == "/unknown-size" else len(CONTENT)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{total}")
+        else:
+            body = CONTENT
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def server_url():
+    _Handler.requests = []
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+@pytest.fixture()
+def http_client(tmp_path, monkeypatch):
+    monkeypatch.setenv("WEAVE_LOCAL_ARTIFACT_DIR", str(tmp_path))
+    with weave_http.Http(filesystem.get_filesystem()) as http_client:
+        yield http_client
+
+
+def _read(http_client, path):
+    with http_client.fs.open_read(path) as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("range_workers", [1, 4])
+def test_download_file(http_client, server_url, monkeypatch, range_workers):
+    monkeypatch.setattr(weave_http, "DOWNLOAD_CHUNK_SIZE", 1000)
+    monkeypatch.setattr(weave_http, "DOWNLOAD_RANGE_SIZE", 30000)
+    md5_hex = hashlib.md5(CONTENT).hexdigest()
+    http_client.download_file(
+        server_url + "/file", "f/file", md5_hex=md5_hex, range_workers=range_workers
+    )
+    assert _read(http_client, "f/file") == CONTENT
+    if range_workers == 1:
+        assert _Handler.requests == [None]
+    else:
+        assert len(_Handler.requests) == 9
+
+
+def test_download_file_without_range_support(http_client, server_url, monkeypatch):
+    monkeypatch.setattr(weave_http, "DOWNLOAD_RANGE_SIZE", 30000)
+    http_client.download_file(server_url + "/no-ranges", "f/file", range_workers=4)
+    assert _read(http_client, "f/file") == CONTENT
+    assert len(_Handler.requests) == 1
+
+
+def test_download_file_of_unknown_size(http_client, server_url, monkeypatch):
+    monkeypatch.setattr(weave_http, "DOWNLOAD_RANGE_SIZE", 30000)
+    http_client.download_file(
+        server_url + "/unknown-size",
+        "f/file",
+        md5_hex=hashlib.md5(CONTENT).hexdigest(),
+        range_workers=4,
+    )
+    assert _read(http_client, "f/file") == CONTENT
+    assert _Handler.requests == ["bytes=0-29999", None]
+
+
+@pytest.mark.parametrize("range_workers", [1, 4])
+def test_download_empty_file(http_client, server_url, range_workers):
+    http_client.download_file(
+        server_url + "/empty",
+        "f/file",
+        md5_hex=hashlib.md5(b"").hexdigest(),
+        range_workers=range_workers,
+    )
+    assert _read(http_client, "f/file") == b""
+
+
+def test_download_file_md5_mismatch_leaves_no_file(http_client, server_url):
+    with pytest.raises(errors.WeaveInternalError):
+        http_client.download_file(server_url + "/file", "f/file", md5_hex="0" * 32)
+    assert not http_client.fs.exists("f/file")
+    assert os.listdir(http_client.fs.path("f")) == []
+
+
+def test_concurrent_downloads_of_a_file_are_shared(http_client, monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    downloads = []
+
+    def download_file(url, path, **kwargs):
+        downloads.append(url)
+        started.set()
+        release.wait()
+        with http_client.fs.open_write(path) as f:
+            f.write(b"data")
+
+    monkeypatch.setattr(http_client, "download_file", download_file)
+    monkeypatch.setattr(
+        wandb_file_manager, "_downloads", request_coalescing.SingleFlight()
+    )
+    file_manager = wandb_file_manager.WandbFileManager(
+        http_client.fs, http_client, None
+    )
+    url = "https://example.com/files/a.parquet"
+    results = []
+
+    def ensure():
+        results.append(file_manager.ensure_file_downloaded(url))
+
+    threads = [threading.Thread(target=ensure) for _ in range(3)]
+    threads[0].start()
+    started.wait()
+    for t in threads[1:]:
+        t.start()
+    while wandb_file_manager._downloads.stats().coalesced < 2:
+        release.wait(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+    assert downloads == [url]
+    assert results == ["wandb_file_manager/example.com/files/a.parquet"] * 3
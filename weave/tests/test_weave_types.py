@@ -736,3 +736,85 @@ def test_load_unknown_subobj_type():
     assert isinstance(t, types.TypedDict)
     assert t.property_types["a"] == types.Int()
     assert t.property_types["b"] == types.UnknownType()
+
+
+def test_type_from_dict_shares_parsed_types():
+    d = {
+        "type": "typedDict",
+        "propertyTypes": {"a": "int", "b": {"type": "list", "objectType": "string"}},
+    }
+    t = weave.types.TypeRegistry.type_from_dict(d)
+    assert weave.types.TypeRegistry.type_from_dict(dict(d)) is t
+
+    # Property order is part of the type.
+    reordered = {
+        "type": "typedDict",
+        "propertyTypes": {"b": {"type": "list", "objectType": "string"}, "a": "int"},
+    }
+    t2 = weave.types.TypeRegistry.type_from_dict(reordered)
+    assert t2 is not t
+    assert list(t2.property_types) == ["b", "a"]
+
+
+def test_type_from_dict_cache_cleared_for_new_types():
+    d = {"type": "typedDict", "propertyTypes": {"a": {"type": "new_test_type"}}}
+    t = weave.types.TypeRegistry.type_from_dict(d)
+    assert t.property_types["a"] == types.UnknownType()
+
+    @dataclasses.dataclass(frozen=True)
+    class NewTestType(types.Type):
+        name = "new_test_type"
+
+    t = weave.types.TypeRegistry.type_from_dict(d)
+    assert isinstance(t.property_types["a"], NewTestType)
+
+
+def test_merge_types_cache_keeps_member_order():
+    a = types.TypedDict({"a": types.Int(), "b": types.String()})
+    b = types.TypedDict({"b": types.String(), "a": types.Int()})
+    c = types.TypedDict({"a": types.Float(), "b": types.String()})
+    d = types.TypedDict({"b": types.String(), "a": types.Float()})
+    assert a == b and c == d
+    assert list(types.merge_types(a, c).property_types) == ["a", "b"]
+    # Equal to the cached pair, but the result's key order differs.
+    assert list(types.merge_types(b, d).property_types) == ["b", "a"]
+
+    int_or_str = types.UnionType(types.Int(), types.String())
+    str_or_int = types.UnionType(types.String(), types.Int())
+    none_type = types.NoneType()
+    assert types.merge_types(int_or_str, none_type).members == [
+        types.Int(),
+        types.String(),
+        none_type,
+    ]
+    assert types.merge_types(str_or_int, none_type).members == [
+        types.String(),
+        types.Int(),
+        none_type,
+    ]
+
+
+def test_assign_type_cache():
+    cache = types._assign_type_cache
+    cache.clear()
+    target = types.List(types.TypedDict({"a": types.Int()}))
+    value = TaggedValueType(
+        types.TypedDict({"run": types.String()}),
+        types.List(types.TypedDict({"a": types.Int(), "b": types.String()})),
+    )
+    before = cache.stats()
+    assert target.assign_type(value)
+    assert target.assign_type(value)
+    # A new but equal type is found too.
+    assert types.List(types.TypedDict({"a": types.Int()})).assign_type(value)
+    assert not target.assign_type(types.List(types.TypedDict({"a": types.String()})))
+    stats = cache.stats()
+    assert stats.hits - before.hits == 2
+    assert stats.misses - before.misses == 2
+
+    # Defining a type clears the cache, assignability can depend on it.
+    @dataclasses.dataclass(frozen=True)
+    class AssignCacheTestType(types.Type):
+        pass
+
+    assert len(cache) == 0
@@ -1,3 +1,4 @@
+import collections
 import inspect
 from typing import Iterator, Literal, Any, Union, Optional, Generator, SupportsIndex
 import dataclasses
@@ -25,6 +26,7 @@ from weave.trace_server.trace_server_interface import (
     TraceServerInterface,
     _TableRowFilter,
     TableQueryReq,
+    TableRowSchema,
     ObjReadReq,
 )
 
@@ -191,6 +193,12 @@ class TraceObject(Tracable):
         return self._val == other
 
 
+# Rows are fetched from the server a page at a time. Only the most recently
+# used pages are kept, so large tables are never held in memory as a whole.
+TABLE_PAGE_SIZE = 250
+TABLE_MAX_CACHED_PAGES = 16
+
+
 class TraceTable(Tracable):
     filter: _TableRowFilter
 
@@ -209,64 +217,107 @@ class TraceTable(Tracable):
         if root is None:
             root = self
         self.root = root
-        self._loaded_rows: typing.Optional[typing.List[typing.Dict]] = None
+        # page index -> rows, least recently used first
+        self._pages: collections.OrderedDict[
+            int, typing.List[typing.Any]
+        ] = collections.OrderedDict()
+        self._count: typing.Optional[int] = None
 
     def __len__(self) -> int:
-        return len(self._all_rows())
-
-    def _all_rows(self) -> typing.List[typing.Dict]:
-        # TODO: This is not an efficient way to do this - we essentially
-        # load the entire set of rows the first time we need anything. However
-        # the previous implementation loaded the entire set of rows for every action
-        # so this is still better.
-        if self._loaded_rows == None:
-            self._loaded_rows = [row for row in self._remote_iter()]
-
-        return typing.cast(typing.List[typing.Dict], self._loaded_rows)
-
-    def _remote_iter(self) -> Generator[typing.Dict, None, None]:
-        page_index = 0
-        page_size = 1000
-        i = 0
-        while True:
-            response = self.server.table_query(
-                TableQueryReq(
-                    project_id=f"{self.table_ref.entity}/{self.table_ref.project}",
-                    digest=self.table_ref.digest,
-                    offset=page_index * page_size,
-                    limit=page_size,
-                    # filter=self.filter,
-                )
-            )
-            for item in response.rows:
-                new_ref = self.ref.with_item(item.digest)
-                yield make_trace_obj(
-                    item.val,
-                    new_ref,
-                    self.server,
-                    self.root,
-                )
-                i += 1
-            if len(response.rows) < page_size:
-                break
+        if self._count is None:
+            self._page(0)
+        # Servers that don't return stats: page through to the end.
+        page_index = 1
+        while self._count is None:
+            if not self._page(page_index):
+                # The previous page was full, so the table ends right there.
+                self._count = page_index * TABLE_PAGE_SIZE
             page_index += 1
+        return self._count
+
+    def _project_id(self) -> str:
+        return f"{self.table_ref.entity}/{self.table_ref.project}"
+
+    def _make_row(self, item: TableRowSchema) -> Any:
+        new_ref = self.ref.with_item(item.digest)
+        return make_trace_obj(item.val, new_ref, self.server, self.root)
+
+    def _page(self, page_index: int) -> typing.List[typing.Any]:
+        page = self._pages.get(page_index)
+        if page is not None:
+            self._pages.move_to_end(page_index)
+            return page
+        offset = page_index * TABLE_PAGE_SIZE
+        response = self.server.table_query(
+            TableQueryReq(
+                project_id=self._project_id(),
+                digest=self.table_ref.digest,
+                offset=offset,
+                limit=TABLE_PAGE_SIZE,
+                include_stats=self._count is None,
+                # filter=self.filter,
+            )
+        )
+        if response.stats is not None:
+            self._count = response.stats.count
+        elif len(response.rows) < TABLE_PAGE_SIZE and (
+            response.rows or page_index == 0
+        ):
+            self._count = offset + len(response.rows)
+        page = [self._make_row(item) for item in response.rows]
+        self._pages[page_index] = page
+        while len(self._pages) > TABLE_MAX_CACHED_PAGES:
+            self._pages.popitem(last=False)
+        return page
+
+    def _row(self, index: int) -> Any:
+        page = self._page(index // TABLE_PAGE_SIZE)
+        return page[index % TABLE_PAGE_SIZE]
+
+    def _row_by_digest(self, row_digest: str) -> Any:
+        for page in self._pages.values():
+            for row in page:
+                if row.ref.extra[-1] == row_digest:
+                    return row
+        response = self.server.table_query(
+            TableQueryReq(
+                project_id=self._project_id(),
+                digest=self.table_ref.digest,
+                filter=_TableRowFilter(row_digests=[row_digest]),
+                limit=1,
+            )
+        )
+        if not response.rows:
+            raise KeyError(f"Row ID not found: {row_digest}")
+        return self._make_row(response.rows[0])
 
     def __getitem__(self, key: Union[int, slice, str]) -> Any:
-        rows = self._all_rows()
         if isinstance(key, slice):
-            return rows[key]
+            return [self._row(i) for i in range(*key.indices(len(self)))]
         elif isinstance(key, int):
-            return rows[key]
+            index = key
+            if index < 0:
+                index += len(self)
+            if index < 0 or (self._count is not None and index >= self._count):
+                raise IndexError("list index out of range")
+            try:
+                return self._row(index)
+            except IndexError:
+                raise IndexError("list index out of range")
         else:
-            for row in rows:
-                if row.ref.extra[-1] == key:  # type: ignore
-                    return row
-            else:
-                raise KeyError(f"Row ID not found: {key}")
+            return self._row_by_digest(key)
 
     def __iter__(self) -> Generator[Any, None, None]:
-        for row in self._all_rows():
-            yield row
+        page_index = 0
+        while True:
+            page = self._page(page_index)
+            for row in page:
+                yield row
+            page_index += 1
+            if len(page) < TABLE_PAGE_SIZE or (
+                self._count is not None and page_index * TABLE_PAGE_SIZE >= self._count
+            ):
+                break
 
     def append(self, val: Any) -> None:
         if not isinstance(self.ref, ObjectRef):
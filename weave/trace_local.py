@@ -1,10 +1,19 @@
+import collections
+import contextlib
+import contextvars
+import copy
 import hashlib
+import struct
+import threading
 import typing
 from typing import Mapping
 import json
 import dataclasses
 import random
 
+import pyarrow as pa
+
+from . import box
 from . import storage
 from . import ref_base
 from . import op_def
@@ -14,6 +23,13 @@ from . import graph
 from . import artifact_local
 from . import weave_internal
 from . import op_policy
+from . import engine_trace
+from . import environment
+from . import filesystem
+from . import memo
+from .language_features.tagging import tag_store
+
+statsd = engine_trace.statsd()  # type: ignore
 
 
 @dataclasses.dataclass
@@ -22,16 +38,227 @@ class RunKey:
     id: str
 
 
+class _ValueDigests:
+    """Digests of input values, memoized by object identity for a request.
+
+    Holds on to the values, so their ids can't be reused while the digests
+    are stored.
+    """
+
+    def __init__(self) -> None:
+        self._digests: dict[int, typing.Tuple[typing.Any, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, val: typing.Any) -> typing.Optional[str]:
+        item = self._digests.get(id(val))
+        if item is None or item[0] is not val:
+            return None
+        return item[1]
+
+    def set(self, val: typing.Any, digest: str) -> None:
+        with self._lock:
+            self._digests[id(val)] = (val, digest)
+
+
+_value_digests: contextvars.ContextVar[
+    typing.Optional[_ValueDigests]
+] = contextvars.ContextVar("value_digests", default=None)
+
+
+@contextlib.contextmanager
+def value_digests() -> typing.Generator[None, None, None]:
+    # Like memo.memo_storage, re-entrant calls share the outer request's
+    # digests.
+    token = None
+    if _value_digests.get() is None:
+        token = _value_digests.set(_ValueDigests())
+    try:
+        yield
+    finally:
+        if token is not None:
+            _value_digests.reset(token)
+
+
+class _Unhashable(Exception):
+    pass
+
+
+def _arrow_type_is_nested(t: pa.DataType) -> bool:
+    return t.num_fields > 0 or pa.types.is_dictionary(t)
+
+
+def _hash_arrow(
+    hash: typing.Any, data: typing.Union[pa.Array, pa.ChunkedArray]
+) -> None:
+    hash.update(str(data.type).encode())
+    if _arrow_type_is_nested(data.type):
+        # Array.buffers() doesn't include dictionaries, and flattens children
+        # without their own offsets, so two differently sliced children can
+        # share buffers. Serialize instead, IPC normalizes offsets.
+        table = pa.Table.from_arrays([data], names=["v"])
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        hash.update(memoryview(sink.getvalue()))
+        return
+    chunks = data.chunks if isinstance(data, pa.ChunkedArray) else [data]
+    for chunk in chunks:
+        hash.update(struct.pack("<qq", chunk.offset, len(chunk)))
+        for buf in chunk.buffers():
+            if buf is None:
+                hash.update(b"N")
+            else:
+                hash.update(struct.pack("<q", buf.size))
+                hash.update(memoryview(buf))
+
+
+_PLAIN_SCALAR_TYPES = frozenset([type(None), bool, int, float, str])
+_PLAIN_TYPES = _PLAIN_SCALAR_TYPES | {list, dict}
+
+
+def _is_plain(val: typing.Any) -> bool:
+    # Only exact builtin types, boxed values may be tagged.
+    t = type(val)
+    if t is list:
+        return _has_plain_items(val)
+    if t is dict:
+        return all(type(k) is str for k in val) and _has_plain_items(val.values())
+    return t in _PLAIN_SCALAR_TYPES
+
+
+def _has_plain_items(values: typing.Iterable[typing.Any]) -> bool:
+    types = set(map(type, values))
+    if types.issubset(_PLAIN_SCALAR_TYPES):
+        return True
+    if not types.issubset(_PLAIN_TYPES):
+        return False
+    return all(_is_plain(v) for v in values)
+
+
+class _ValueHasher:
+    """Streams a value into a hash, without serializing it first.
+
+    Covers plain data, ArrowWeaveLists and refs, including the python tags
+    of anything below the top level. Anything else raises _Unhashable.
+    plain is cleared if something below the top level could be tagged,
+    since tags can be added later and depend on the current node's scope.
+    """
+
+    def __init__(self) -> None:
+        self.hash = hashlib.md5()
+        self.plain = True
+
+    def update(self, val: typing.Any, top_level: bool = False) -> None:
+        from .arrow.list_ import ArrowWeaveList
+
+        h = self.hash
+        t = type(val)
+        if t is str:
+            encoded = val.encode()
+            h.update(b"s%d:" % len(encoded))
+            h.update(encoded)
+            return
+        if t is int:
+            h.update(b"i%d;" % val)
+            return
+        if t is float:
+            h.update(b"f" + struct.pack("<d", val))
+            return
+        if t is bool:
+            h.update(b"T" if val else b"F")
+            return
+        if val is None:
+            h.update(b"n")
+            return
+        if not top_level and t is not list and t is not dict:
+            self.plain = False
+            if tag_store.is_tagged(val):
+                h.update(b"t")
+                self.update_dict(tag_store.get_tags(val))
+        if isinstance(val, box.BoxedNone):
+            h.update(b"n")
+        elif isinstance(val, box.BoxedBool):
+            h.update(b"T" if val.val else b"F")
+        elif isinstance(val, str):
+            self.update(str(val))
+        elif isinstance(val, float):
+            self.update(float(val))
+        elif isinstance(val, int) and not isinstance(val, bool):
+            self.update(int(val))
+        elif isinstance(val, list):
+            if _has_plain_items(val):
+                self._update_json(val)
+                return
+            h.update(b"l%d[" % len(val))
+            for v in val:
+                self.update(v)
+            h.update(b"]")
+        elif isinstance(val, dict):
+            self.update_dict(val)
+        elif isinstance(val, ArrowWeaveList):
+            # Tags inside ArrowWeaveLists are part of the arrow data.
+            h.update(b"a")
+            self.update(json.dumps(val.object_type.to_dict()))
+            _hash_arrow(h, val._arrow_data)
+        elif isinstance(val, ref_base.Ref):
+            h.update(b"r")
+            self.update(str(val))
+        else:
+            raise _Unhashable()
+
+    def _update_json(self, val: typing.Any) -> None:
+        # Items can't hold tags, let json encode them in one go.
+        encoded = json.dumps(val).encode()
+        self.hash.update(b"j%d:" % len(encoded))
+        self.hash.update(encoded)
+
+    def update_dict(self, val: dict) -> None:
+        if all(type(k) is str for k in val) and _has_plain_items(val.values()):
+            self._update_json(val)
+            return
+        self.hash.update(b"d%d{" % len(val))
+        for k, v in val.items():
+            if type(k) is not str:
+                raise _Unhashable()
+            self.update(k)
+            self.update(v)
+        self.hash.update(b"}")
+
+
+def _value_id_from_python(val):
+    hash_val = json.dumps(storage.to_python(val)["_val"])
+    hash = hashlib.md5()
+    hash.update(json.dumps(hash_val).encode())
+    return hash.hexdigest()
+
+
 def _value_id(val):
     # Important, do not include the type here, as it can change.
     # This happens because you can have a ref to an item that's in a list.
     # The list's object_type can change as items are appended to it.
     # We don't know the specific type of each item within the list without
     # further refinement.
-    hash_val = json.dumps(storage.to_python(val)["_val"])
-    hash = hashlib.md5()
-    hash.update(json.dumps(hash_val).encode())
-    return hash.hexdigest()
+    digests = _value_digests.get()
+    digest = digests.get(val) if digests is not None else None
+    if digest is None:
+        hasher = _ValueHasher()
+        try:
+            hasher.update(val, top_level=True)
+        except _Unhashable:
+            return _value_id_from_python(val)
+        digest = hasher.hash.hexdigest()
+        if digests is not None and hasher.plain:
+            digests.set(val, digest)
+    # The value's own tags aren't memoized, they depend on the current node.
+    if type(val) is not list and type(val) is not dict and tag_store.is_tagged(val):
+        hasher = _ValueHasher()
+        hasher.hash.update(digest.encode())
+        try:
+            hasher.update_dict(tag_store.get_tags(val))
+        except _Unhashable:
+            return _value_id_from_python(val)
+        return hasher.hash.hexdigest()
+    return digest
 
 
 def make_run_key(
@@ -62,6 +289,172 @@ def make_run_key(
     return RunKey(op_def.simple_name, hash.hexdigest())
 
 
+def _type_dict_has_python_tags(type_dict: typing.Any) -> bool:
+    # Tags inside ArrowWeaveLists are stored in the arrow data. Any other
+    # tagged type is restored into the current request's tag store when the
+    # value is deserialized.
+    if isinstance(type_dict, dict):
+        type_name = type_dict.get("type")
+        if type_name == "tagged":
+            return True
+        if type_name == "ArrowWeaveList":
+            return False
+        return any(_type_dict_has_python_tags(v) for v in type_dict.values())
+    if isinstance(type_dict, list):
+        return any(_type_dict_has_python_tags(v) for v in type_dict)
+    return False
+
+
+def _is_shareable(val: typing.Any) -> bool:
+    # Only plain data and ArrowWeaveLists are shared across requests. Other
+    # python objects (Table, Run, ...) may hold state that was computed for
+    # the request that first read them.
+    from .arrow.list_ import ArrowWeaveList
+
+    if val is None or isinstance(val, (str, int, float, bool, ArrowWeaveList)):
+        return True
+    if isinstance(val, list):
+        return all(_is_shareable(v) for v in val)
+    if isinstance(val, dict):
+        return all(isinstance(k, str) and _is_shareable(v) for k, v in val.items())
+    return False
+
+
+def _copy_shareable(val: typing.Any) -> typing.Any:
+    # Copies the containers of a shareable value, keeping their box types.
+    # Scalars and ArrowWeaveLists aren't changed in place, they are shared.
+    if isinstance(val, list):
+        items = [_copy_shareable(v) for v in val]
+        return box.BoxedList(items) if isinstance(val, box.BoxedList) else items
+    if isinstance(val, dict):
+        d = {k: _copy_shareable(v) for k, v in val.items()}
+        return box.BoxedDict(d) if isinstance(val, box.BoxedDict) else d
+    return val
+
+
+class RunOutputCache:
+    """Deserialized run outputs, shared by every request in the process.
+
+    Entries are keyed by the filesystem dir the run was read from, which
+    contains the user cache key and the time interval cache prefix, so users
+    and cache buckets never share entries. Least recently used entries are
+    evicted first once over max_bytes.
+
+    Tags live in a per-request tag store, so only plain data outputs that
+    carry no python tags can be shared.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items: collections.OrderedDict[
+            typing.Tuple[str, str, str], typing.Tuple[ref_base.Ref, int]
+        ] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _key(self, run_key: RunKey) -> typing.Tuple[str, str, str]:
+        return (filesystem.get_filesystem_dir(), run_key.op_simple_name, run_key.id)
+
+    def get(self, run_key: RunKey) -> typing.Optional[ref_base.Ref]:
+        key = self._key(run_key)
+        tags = ["op:%s" % run_key.op_simple_name]
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+        if item is None:
+            statsd.increment("weave.run_output_cache.miss", tags=tags)
+            return None
+        statsd.increment("weave.run_output_cache.hit", tags=tags)
+        # Each caller gets its own ref and output, tags are attached by id.
+        # Copying the output keeps in place changes and this request's tags
+        # (which pin its tag store until the object is freed) off the cached
+        # object. ArrowWeaveList copies share their arrow data.
+        ref = copy.copy(item[0])
+        output = _copy_shareable(ref._obj)
+        if output is ref._obj:
+            output = copy.copy(output)
+        ref._obj = output
+        ref_base._put_ref(output, ref)
+        return ref
+
+    def set(self, run_key: RunKey, output_ref: ref_base.Ref) -> None:
+        output = output_ref._obj
+        if output is None:
+            return
+        if tag_store.is_tagged(output_ref) or tag_store.is_tagged(output):
+            return
+        if _type_dict_has_python_tags(output_ref.type.to_dict()):
+            return
+        if not _is_shareable(output):
+            return
+        nbytes = memo._value_nbytes(output)
+        if nbytes > self.max_bytes:
+            return
+        key = self._key(run_key)
+        with self._lock:
+            prev = self._items.pop(key, None)
+            if prev is not None:
+                self.nbytes -= prev[1]
+            self._items[key] = (output_ref, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._items.popitem(last=False)
+                self.nbytes -= evicted_nbytes
+            statsd.gauge("weave.run_output_cache.nbytes", self.nbytes)
+
+    def invalidate(self, run_key: RunKey) -> None:
+        key = self._key(run_key)
+        with self._lock:
+            prev = self._items.pop(key, None)
+            if prev is not None:
+                self.nbytes -= prev[1]
+
+    def invalidate_filesystem_dir(self, filesystem_dir: str) -> None:
+        with self._lock:
+            for key in [k for k in self._items if k[0] == filesystem_dir]:
+                self.nbytes -= self._items.pop(key)[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+
+_RUN_OUTPUT_CACHE: typing.Optional[RunOutputCache] = None
+_RUN_OUTPUT_CACHE_LOCK = threading.Lock()
+
+
+def run_output_cache() -> typing.Optional[RunOutputCache]:
+    global _RUN_OUTPUT_CACHE
+    max_bytes = environment.run_output_cache_max_bytes()
+    if max_bytes <= 0:
+        return None
+    with _RUN_OUTPUT_CACHE_LOCK:
+        if _RUN_OUTPUT_CACHE is None or _RUN_OUTPUT_CACHE.max_bytes != max_bytes:
+            _RUN_OUTPUT_CACHE = RunOutputCache(max_bytes)
+        return _RUN_OUTPUT_CACHE
+
+
+def invalidate_run_output_cache() -> None:
+    # Called after a mutation is committed. Outputs may hold the objects that
+    # were mutated, so drop everything the current user has cached.
+    with _RUN_OUTPUT_CACHE_LOCK:
+        run_cache = _RUN_OUTPUT_CACHE
+    if run_cache is not None:
+        run_cache.invalidate_filesystem_dir(filesystem.get_filesystem_dir())
+
+
+def clear_run_output_cache() -> None:
+    with _RUN_OUTPUT_CACHE_LOCK:
+        run_cache = _RUN_OUTPUT_CACHE
+    if run_cache is not None:
+        run_cache.clear()
+
+
 # Trace interface. Makes use of objects and mutations to store trace data.
 # Manually constructs nodes and op calls to avoid recursively calling
 # the execute engine, either via use or type refinement.
@@ -128,6 +521,9 @@ class TraceLocal:
         from .ops_primitives import weave_api
 
         run_key = RunKey(run.op_name, run.id)
+        run_cache = run_output_cache()
+        if run_cache is not None:
+            run_cache.invalidate(run_key)
         if self._should_save_to_table(run_key):
             weave_api.append(self._run_table(run_key), run, {})
         else:
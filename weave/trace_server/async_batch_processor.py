@@ -1,22 +1,72 @@
-from typing import Callable, Generic, List, TypeVar
-from threading import Thread, Lock, Event
-from queue import Queue
-import time
+from typing import Callable, Deque, Generic, Hashable, List, Optional, TypeVar
+from threading import Thread, Condition, get_ident
 import atexit
+import collections
+import dataclasses
+import logging
+import os
+import time
+import weakref
 
 T = TypeVar("T")
 
+logger = logging.getLogger(__name__)
+
+# Processors that need fresh queues and threads in a forked child.
+_processors: "weakref.WeakSet[AsyncBatchProcessor]" = weakref.WeakSet()
+
+
+@dataclasses.dataclass
+class AsyncBatchProcessorStats:
+    queue_depth: int = 0
+    in_flight: int = 0
+    batches: int = 0
+    items: int = 0
+    retries: int = 0
+    failed_batches: int = 0
+    last_flush_latency: float = 0.0
+    max_flush_latency: float = 0.0
+    total_flush_latency: float = 0.0
+
+
+class _Lane(Generic[T]):
+    # Items that must be processed in order, by one worker.
+    def __init__(self) -> None:
+        self.items: Deque[T] = collections.deque()
+        self.nbytes = 0
+        self.oldest_at = 0.0
+        self.in_flight = 0
+        # Items ever added to and processed from this lane, so flush can
+        # wait for the items enqueued before it without waiting for later ones.
+        self.enqueued = 0
+        self.processed = 0
+
 
 class AsyncBatchProcessor(Generic[T]):
     """
     A class that asynchronously processes batches of items using a provided processor function.
+
+    Items are split into lanes by `key_fn` (by default, the thread that
+    enqueued them). Each lane is processed in order by its own worker, so
+    items with the same key are never reordered, while up to `num_workers`
+    batches are in flight at once. A lane's batch is processed as soon as it
+    reaches `max_batch_size` items or `max_batch_bytes`, or once its oldest
+    item has waited `max_batch_interval` seconds.
     """
 
     def __init__(
         self,
         processor_fn: Callable[[List[T]], None],
         max_batch_size: int = 100,
-        min_batch_interval: float = 1.0,
+        max_batch_interval: float = 1.0,
+        max_queue_size: int = 10000,
+        num_workers: int = 1,
+        key_fn: Optional[Callable[[T], Hashable]] = None,
+        size_fn: Optional[Callable[[T], int]] = None,
+        max_batch_bytes: Optional[int] = None,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        should_retry: Optional[Callable[[Exception], bool]] = None,
     ) -> None:
         """
         Initializes an instance of AsyncBatchProcessor.
@@ -24,52 +74,218 @@ class AsyncBatchProcessor(Generic[T]):
         Args:
             processor_fn (Callable[[List[T]], None]): The function to process the batches of items.
             max_batch_size (int, optional): The maximum size of each batch. Defaults to 100.
-            min_batch_interval (float, optional): The minimum interval between processing batches. Defaults to 1.0.
+            max_batch_interval (float, optional): The longest an item waits before its batch is processed. Defaults to 1.0.
+            max_queue_size (int, optional): The most items that can wait to be processed. Once full, enqueue blocks until there is room. Defaults to 10000.
+            num_workers (int, optional): The number of batches processed at once. Defaults to 1.
+            key_fn (Callable[[T], Hashable], optional): Items with the same key are processed in order. Defaults to the enqueueing thread.
+            size_fn (Callable[[T], int], optional): The size in bytes of an item, checked against max_batch_bytes.
+            max_batch_bytes (int, optional): Process a batch once its items are this large.
+            max_retries (int, optional): How many times a failed batch is retried. Defaults to 3.
+            retry_backoff (float, optional): Seconds before the first retry, doubled for each one after. Defaults to 0.5.
+            should_retry (Callable[[Exception], bool], optional): Whether a failed batch can be retried. Defaults to retrying every error.
         """
         self.processor_fn = processor_fn
         self.max_batch_size = max_batch_size
-        self.min_batch_interval = min_batch_interval
-        self.queue: Queue[T] = Queue()
-        self.lock = Lock()
-        self.stop_event = Event()  # Use an event to signal stopping
-        self.processing_thread = Thread(target=self._process_batches)
-        self.processing_thread.daemon = True
-        self.processing_thread.start()
+        self.max_batch_interval = max_batch_interval
+        self.max_queue_size = max_queue_size
+        self.num_workers = num_workers
+        self.key_fn = key_fn
+        self.size_fn = size_fn
+        self.max_batch_bytes = max_batch_bytes
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.should_retry = should_retry
+        self._reset()
+        _processors.add(self)
         atexit.register(self.wait_until_all_processed)  # Register cleanup function
 
+    def _reset(self) -> None:
+        self._cond = Condition()
+        self._lanes: List[_Lane[T]] = [_Lane() for _ in range(self.num_workers)]
+        self._queued = 0
+        self._flush_waiters = 0
+        self._stopping = False
+        self._stats = AsyncBatchProcessorStats()
+        # Started on first enqueue, so processes that never enqueue (like
+        # forked workers) don't run threads.
+        self._workers: List[Thread] = []
+
+    def _after_fork_in_child(self) -> None:
+        # The parent still owns the items that were queued when it forked and
+        # will process them, and the worker threads do not exist in the
+        # child. Start over with empty lanes.
+        self._reset()
+
+    def _lane(self, item: T) -> _Lane[T]:
+        if self.num_workers == 1:
+            return self._lanes[0]
+        key = self.key_fn(item) if self.key_fn is not None else get_ident()
+        return self._lanes[hash(key) % self.num_workers]
+
     def enqueue(self, items: List[T]) -> None:
         """
         Enqueues a list of items to be processed.
 
+        Blocks while the queue is full, so producers can't outrun the
+        processor without bound.
+
         Args:
             items (List[T]): The items to be processed.
         """
-        with self.lock:
+        if self._stopping:
+            # Stopped at exit, nothing will process the queue anymore.
+            self.processor_fn(items)
+            return
+        with self._cond:
+            if not self._workers:
+                self._start_workers()
             for item in items:
-                self.queue.put(item)
+                while self._queued >= self.max_queue_size:
+                    # Full lanes are processed right away, see _ready.
+                    self._cond.notify_all()
+                    self._cond.wait()
+                lane = self._lane(item)
+                if not lane.items:
+                    lane.oldest_at = time.monotonic()
+                lane.items.append(item)
+                lane.enqueued += 1
+                if self.size_fn is not None:
+                    lane.nbytes += self.size_fn(item)
+                self._queued += 1
+            self._stats.queue_depth = self._queued
+            self._cond.notify_all()
 
-    def _process_batches(self) -> None:
+    def _start_workers(self) -> None:
+        for lane in self._lanes:
+            worker = Thread(target=self._process_batches, args=(lane,))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def _ready(self, lane: _Lane[T]) -> bool:
+        # Called with the lock held.
+        if not lane.items:
+            return False
+        return (
+            self._stopping
+            or self._flush_waiters > 0
+            or self._queued >= self.max_queue_size
+            or len(lane.items) >= self.max_batch_size
+            or (
+                self.max_batch_bytes is not None and lane.nbytes >= self.max_batch_bytes
+            )
+            or time.monotonic() - lane.oldest_at >= self.max_batch_interval
+        )
+
+    def _process_batches(self, lane: _Lane[T]) -> None:
         """
-        Internal method that continuously processes batches of items from the queue.
+        Internal method that processes batches of items from one lane until stopped.
         """
+        # The lock is replaced when reset after a fork.
+        cond = self._cond
         while True:
-            current_batch: List[T] = []
-            while not self.queue.empty() and len(current_batch) < self.max_batch_size:
-                current_batch.append(self.queue.get())
+            with cond:
+                while not self._ready(lane):
+                    if self._stopping and not lane.items:
+                        return
+                    timeout = None
+                    if lane.items:
+                        timeout = max(
+                            0.0,
+                            lane.oldest_at + self.max_batch_interval - time.monotonic(),
+                        )
+                    cond.wait(timeout)
+                batch: List[T] = []
+                while lane.items and len(batch) < self.max_batch_size:
+                    item = lane.items.popleft()
+                    if self.size_fn is not None:
+                        lane.nbytes -= self.size_fn(item)
+                    batch.append(item)
+                lane.oldest_at = time.monotonic()
+                lane.in_flight = len(batch)
+                self._queued -= len(batch)
+                self._stats.queue_depth = self._queued
+                self._stats.in_flight += len(batch)
+                # Room in the queue for blocked producers.
+                cond.notify_all()
+
+            started_at = time.monotonic()
+            failed = not self._process_with_retries(batch)
+            latency = time.monotonic() - started_at
 
-            if current_batch:
-                self.processor_fn(current_batch)
+            if lane not in self._lanes:
+                # Reset while processing, the lane is no longer ours.
+                return
+            with cond:
+                lane.in_flight = 0
+                lane.processed += len(batch)
+                stats = self._stats
+                stats.in_flight -= len(batch)
+                stats.batches += 1
+                stats.items += len(batch)
+                stats.failed_batches += failed
+                stats.last_flush_latency = latency
+                stats.max_flush_latency = max(stats.max_flush_latency, latency)
+                stats.total_flush_latency += latency
+                cond.notify_all()
 
-            if self.stop_event.is_set() and self.queue.empty():
-                break
+    def _process_with_retries(self, batch: List[T]) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.processor_fn(batch)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries or (
+                    self.should_retry is not None and not self.should_retry(e)
+                ):
+                    logger.exception(
+                        "Failed to process a batch of %s items", len(batch)
+                    )
+                    return False
+                with self._cond:
+                    self._stats.retries += 1
+                time.sleep(self.retry_backoff * 2**attempt)
+        return False
+
+    def stats(self) -> AsyncBatchProcessorStats:
+        """
+        Returns a snapshot of the queue depth, counts and flush latencies.
+        """
+        with self._cond:
+            return dataclasses.replace(self._stats)
 
-            # Unless we are stopping, sleep for a the min_batch_interval
-            if not self.stop_event.is_set():
-                time.sleep(self.min_batch_interval)
+    def flush(self) -> None:
+        """
+        Blocks until every item enqueued so far has been processed.
+        """
+        with self._cond:
+            if not self._workers:
+                return
+            targets = [(lane, lane.enqueued) for lane in self._lanes]
+            self._flush_waiters += 1
+            try:
+                self._cond.notify_all()
+                while any(lane.processed < target for lane, target in targets):
+                    self._cond.wait()
+            finally:
+                self._flush_waiters -= 1
 
     def wait_until_all_processed(self) -> None:
         """
         Waits until all enqueued items have been processed.
         """
-        self.stop_event.set()
-        self.processing_thread.join()
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            workers = list(self._workers)
+        for worker in workers:
+            worker.join()
+
+
+def _reset_processors_after_fork() -> None:
+    for processor in list(_processors):
+        processor._after_fork_in_child()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_processors_after_fork)
@@ -17,7 +17,8 @@ from pydantic import BaseModel
 
 from . import environment as wf_env
 from . import clickhouse_trace_server_migrator as wf_migrator
-from .errors import RequestTooLarge
+from .async_batch_processor import AsyncBatchProcessor
+from .errors import InvalidRequest, RequestTooLarge
 
 from .trace_server_interface_util import (
     extract_refs_from_values,
@@ -25,6 +26,9 @@ from .trace_server_interface_util import (
     str_digest,
     bytes_digest,
     WILDCARD_ARTIFACT_VERSION_AND_PATH,
+    MAX_REFS_READ_BATCH,
+    decode_calls_cursor,
+    next_calls_cursor,
 )
 from . import trace_server_interface as tsi
 
@@ -32,6 +36,7 @@ from . import refs_internal
 
 MAX_FLUSH_COUNT = 10000
 MAX_FLUSH_AGE = 15
+MAX_FLUSH_WORKERS = 4
 
 FILE_CHUNK_SIZE = 100000
 
@@ -148,6 +153,7 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
         password: str = "",
         database: str = "default",
         use_async_insert: bool = False,
+        use_batch_processor: bool = False,
     ):
         super().__init__()
         self._thread_local = threading.local()
@@ -159,9 +165,21 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
         self._flush_immediately = True
         self._call_batch: typing.List[typing.List[typing.Any]] = []
         self._use_async_insert = use_async_insert
+        # Call parts are merged by the table engine, so they can be inserted
+        # in any order, from several background inserts at once.
+        self._call_processor: typing.Optional[AsyncBatchProcessor] = None
+        if use_batch_processor:
+            self._call_processor = AsyncBatchProcessor(
+                self._insert_call_batch,
+                max_batch_size=MAX_FLUSH_COUNT,
+                max_batch_interval=MAX_FLUSH_AGE,
+                num_workers=MAX_FLUSH_WORKERS,
+            )
 
     @classmethod
-    def from_env(cls, use_async_insert: bool = False) -> "ClickHouseTraceServer":
+    def from_env(
+        cls, use_async_insert: bool = False, use_batch_processor: bool = False
+    ) -> "ClickHouseTraceServer":
         return cls(
             host=wf_env.wf_clickhouse_host(),
             port=wf_env.wf_clickhouse_port(),
@@ -169,8 +187,13 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
             password=wf_env.wf_clickhouse_pass(),
             database=wf_env.wf_clickhouse_database(),
             use_async_insert=use_async_insert,
+            use_batch_processor=use_batch_processor,
         )
 
+    def flush(self) -> None:
+        if self._call_processor is not None:
+            self._call_processor.flush()
+
     @contextmanager
     def call_batch(self) -> typing.Iterator[None]:
         # Not thread safe - do not use across threads
@@ -213,10 +236,55 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
         return tsi.CallEndRes()
 
     def call_read(self, req: tsi.CallReadReq) -> tsi.CallReadRes:
+        self.flush()
         # Return the marshaled response
         return tsi.CallReadRes(call=_ch_call_to_call_schema(self._call_read(req)))
 
     def calls_query(self, req: tsi.CallsQueryReq) -> tsi.CallsQueryRes:
+        self.flush()
+        conditions, parameters = self._calls_query_conditions(req)
+        id_conditions = self._calls_query_id_conditions(req, parameters)
+        ch_call_dicts = self._select_calls_query_raw(
+            req.project_id,
+            conditions=conditions,
+            id_conditions=id_conditions,
+            parameters=parameters,
+            limit=req.limit,
+            offset=req.offset,
+            order_by=None
+            if not req.sort_by
+            else [(s.field, s.direction) for s in req.sort_by],
+        )
+        calls = [
+            tsi.CallSchema.model_validate(_ch_call_dict_to_call_schema_dict(ch_dict))
+            for ch_dict in ch_call_dicts
+        ]
+        return tsi.CallsQueryRes(calls=calls, next_cursor=next_calls_cursor(req, calls))
+
+    def calls_query_stream(
+        self, req: tsi.CallsQueryReq
+    ) -> typing.Iterator[tsi.CallSchema]:
+        self.flush()
+        conditions, parameters = self._calls_query_conditions(req)
+        id_conditions = self._calls_query_id_conditions(req, parameters)
+        for ch_dict in self._select_calls_query_raw_stream(
+            req.project_id,
+            conditions=conditions,
+            id_conditions=id_conditions,
+            parameters=parameters,
+            limit=req.limit,
+            offset=req.offset,
+            order_by=None
+            if not req.sort_by
+            else [(s.field, s.direction) for s in req.sort_by],
+        ):
+            yield tsi.CallSchema.model_validate(
+                _ch_call_dict_to_call_schema_dict(ch_dict)
+            )
+
+    def _calls_query_conditions(
+        self, req: tsi.CallsQueryReq
+    ) -> typing.Tuple[typing.List[str], typing.Dict[str, typing.Any]]:
         conditions = []
         parameters: typing.Dict[str, typing.Union[typing.List[str], str]] = {}
         if req.filter:
@@ -281,20 +349,25 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
                 conditions.append("wb_run_id IN {wb_run_ids: Array(String)}")
                 parameters["wb_run_ids"] = req.filter.wb_run_ids
 
-        ch_call_dicts = self._select_calls_query_raw(
-            req.project_id,
-            conditions=conditions,
-            parameters=parameters,
-            limit=req.limit,
-            offset=req.offset,
-            order_by=None
-            if not req.sort_by
-            else [(s.field, s.direction) for s in req.sort_by],
-        )
-        calls = [
-            _ch_call_dict_to_call_schema_dict(ch_dict) for ch_dict in ch_call_dicts
-        ]
-        return tsi.CallsQueryRes(calls=calls)
+        return conditions, parameters
+
+    def _calls_query_id_conditions(
+        self, req: tsi.CallsQueryReq, parameters: typing.Dict[str, typing.Any]
+    ) -> typing.List[str]:
+        # Conditions on single call parts, applied before the parts are
+        # merged, so a page doesn't have to merge every call in the project.
+        id_conditions = []
+        if req.cursor is not None:
+            if req.sort_by:
+                raise InvalidRequest("cursor can't be combined with sort_by")
+            cursor_started_at, cursor_id = decode_calls_cursor(req.cursor)
+            # Only start parts have started_at.
+            id_conditions.append(
+                "(started_at, id) > (parseDateTime64BestEffort({cursor_started_at: String}, 3), {cursor_id: String})"
+            )
+            parameters["cursor_started_at"] = cursor_started_at
+            parameters["cursor_id"] = cursor_id
+        return id_conditions
 
     def op_create(self, req: tsi.OpCreateReq) -> tsi.OpCreateRes:
         raise NotImplementedError()
@@ -449,7 +522,7 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
         parameters = {}
         if req.filter:
             if req.filter.row_digests:
-                conds.append("tr.digest IN {row_digets: Array(String)}")
+                conds.append("tr.digest IN {row_digests: Array(String)}")
                 parameters["row_digests"] = req.filter.row_digests
         else:
             conds.append("1 = 1")
@@ -459,8 +532,14 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
             conditions=conds,
             limit=req.limit,
             offset=req.offset,
+            parameters=parameters,
         )
-        return tsi.TableQueryRes(rows=rows)
+        stats = None
+        if req.include_stats:
+            stats = tsi.TableQueryStats(
+                count=self._table_row_count(req.project_id, req.digest)
+            )
+        return tsi.TableQueryRes(rows=rows, stats=stats)
 
     def _table_query(
         self,
@@ -471,21 +550,26 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
         offset: typing.Optional[int] = None,
         parameters: typing.Optional[typing.Dict[str, typing.Any]] = None,
     ) -> typing.List[tsi.TableRowSchema]:
-        conds = ["project_id = {project_id: String}"]
+        conds = ["tr.project_id = {project_id: String}"]
         if conditions:
             conds.extend(conditions)
 
         predicate = _combine_conditions(conds, "AND")
+        # Ordered by position in the table so limit and offset page stably.
         query = f"""
                 SELECT tr.digest, tr.val_dump
                 FROM (
-                    SELECT project_id, row_digest
+                    SELECT project_id, row_digest, row_index
                     FROM tables_deduped
-                    ARRAY JOIN row_digests AS row_digest
-                    WHERE digest = {{digest:String}}
+                    ARRAY JOIN
+                        row_digests AS row_digest,
+                        arrayEnumerate(row_digests) AS row_index
+                    WHERE project_id = {{project_id: String}}
+                    AND digest = {{digest:String}}
                 ) AS t
                 JOIN table_rows_deduped tr ON t.project_id = tr.project_id AND t.row_digest = tr.digest
                 WHERE {predicate}
+                ORDER BY t.row_index
             """
         if parameters is None:
             parameters = {}
@@ -510,12 +594,22 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
             for r in query_result.result_rows
         ]
 
+    def _table_row_count(self, project_id: str, digest: str) -> int:
+        query_result = self.ch_client.query(
+            """
+                SELECT length(row_digests)
+                FROM tables_deduped
+                WHERE project_id = {project_id: String}
+                AND digest = {digest: String}
+            """,
+            parameters={"project_id": project_id, "digest": digest},
+        )
+        if not query_result.result_rows:
+            raise NotFoundError(f"Table {digest} not found")
+        return query_result.result_rows[0][0]
+
     def refs_read_batch(self, req: tsi.RefsReadBatchReq) -> tsi.RefsReadBatchRes:
-        # TODO: This reads one ref at a time, it should read them in batches
-        # where it can. Like it should group by object that we need to read.
-        # And it should also batch into table refs (like when we are reading a bunch
-        # of rows from a single Dataset)
-        if len(req.refs) > 1000:
+        if len(req.refs) > MAX_REFS_READ_BATCH:
             raise ValueError("Too many refs")
 
         parsed_raw_refs = [refs_internal.parse_internal_uri(r) for r in req.refs]
@@ -536,33 +630,29 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
         def get_object_refs_root_val(
             refs: list[refs_internal.InternalObjectRef],
         ) -> typing.Any:
-            conds = []
-            parameters = {}
-            for ref_index, ref in enumerate(refs):
+            # Each root object is read once, with one query per project.
+            needed: typing.Dict[str, typing.Set[typing.Tuple[str, str]]] = {}
+            for ref in refs:
                 if ref.version == "latest":
                     raise ValueError("Reading refs with `latest` is not supported")
-
-                cache_key = make_ref_cache_key(ref)
-
-                if cache_key in root_val_cache:
+                if make_ref_cache_key(ref) in root_val_cache:
                     continue
+                needed.setdefault(ref.project_id, set()).add((ref.name, ref.version))
 
-                object_id_param_key = "object_id_" + str(ref_index)
-                version_param_key = "version_" + str(ref_index)
-                conds.append(
-                    f"object_id = {{{object_id_param_key}: String}} AND digest = {{{version_param_key}: String}}"
-                )
-                parameters[object_id_param_key] = ref.name
-                parameters[version_param_key] = ref.version
-
-            if len(conds) > 0:
-                conditions = [_combine_conditions(conds, "OR")]
+            for project_id, keys in needed.items():
                 objs = self._select_objs_query(
-                    ref.project_id, conditions=conditions, parameters=parameters
+                    project_id,
+                    conditions=[
+                        "(object_id, digest) IN {pairs: Array(Tuple(String, String))}"
+                    ],
+                    parameters={"pairs": sorted(keys)},
                 )
                 for obj in objs:
                     root_val_cache[make_obj_cache_key(obj)] = json.loads(obj.val_dump)
 
+            for ref in refs:
+                if make_ref_cache_key(ref) not in root_val_cache:
+                    raise NotFoundError(f"Obj {ref.name}:{ref.version} not found")
             return [root_val_cache[make_ref_cache_key(ref)] for ref in refs]
 
         # Represents work left to do for resolving a ref
@@ -609,7 +699,12 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
                 elif op == refs_internal.LIST_INDEX_EDGE_NAME:
                     index = int(arg)
                     if index >= len(val):
-                        return None
+                        return PartialRefResult(
+                            remaining_extra=[],
+                            unresolved_obj_ref=None,
+                            unresolved_table_ref=None,
+                            val=None,
+                        )
                     val = val[index]
                 else:
                     raise ValueError(f"Unknown ref type: {extra[extra_index]}")
@@ -681,7 +776,7 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
                     ).append((i, row_digest))
             # Make the queries
             for (project_id, digest), index_digests in table_queries.items():
-                row_digests = [d for i, d in index_digests]
+                row_digests = sorted({d for i, d in index_digests})
                 rows = self._table_query(
                     project_id=project_id,
                     digest=digest,
@@ -691,6 +786,8 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
                 # Unpack the results into the target rows
                 row_digest_vals = {r.digest: r.val for r in rows}
                 for index, row_digest in index_digests:
+                    if row_digest not in row_digest_vals:
+                        raise NotFoundError(f"Row {row_digest} not found")
                     extra_results[index] = PartialRefResult(
                         remaining_extra=extra_results[index].remaining_extra[2:],
                         val=row_digest_vals[row_digest],
@@ -832,7 +929,60 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
         offset: typing.Optional[int] = None,
         limit: typing.Optional[int] = None,
         parameters: typing.Optional[typing.Dict[str, typing.Any]] = None,
+        id_conditions: typing.Optional[typing.List[str]] = None,
     ) -> typing.List[typing.Dict]:
+        query, parameters, columns = self._make_calls_query(
+            project_id,
+            columns=columns,
+            conditions=conditions,
+            id_conditions=id_conditions,
+            order_by=order_by,
+            offset=offset,
+            limit=limit,
+            parameters=parameters,
+        )
+        raw_res = self._query(query, parameters)
+
+        dicts = []
+        for row in raw_res.result_rows:
+            dicts.append(dict(zip(columns, row)))
+        return dicts
+
+    def _select_calls_query_raw_stream(
+        self,
+        project_id: str,
+        columns: typing.Optional[typing.List[str]] = None,
+        conditions: typing.Optional[typing.List[str]] = None,
+        order_by: typing.Optional[typing.List[typing.Tuple[str, str]]] = None,
+        offset: typing.Optional[int] = None,
+        limit: typing.Optional[int] = None,
+        parameters: typing.Optional[typing.Dict[str, typing.Any]] = None,
+        id_conditions: typing.Optional[typing.List[str]] = None,
+    ) -> typing.Iterator[typing.Dict]:
+        query, parameters, columns = self._make_calls_query(
+            project_id,
+            columns=columns,
+            conditions=conditions,
+            id_conditions=id_conditions,
+            order_by=order_by,
+            offset=offset,
+            limit=limit,
+            parameters=parameters,
+        )
+        for row in self._query_stream(query, parameters):
+            yield dict(zip(columns, row))
+
+    def _make_calls_query(
+        self,
+        project_id: str,
+        columns: typing.Optional[typing.List[str]] = None,
+        conditions: typing.Optional[typing.List[str]] = None,
+        order_by: typing.Optional[typing.List[typing.Tuple[str, str]]] = None,
+        offset: typing.Optional[int] = None,
+        limit: typing.Optional[int] = None,
+        parameters: typing.Optional[typing.Dict[str, typing.Any]] = None,
+        id_conditions: typing.Optional[typing.List[str]] = None,
+    ) -> typing.Tuple[str, typing.Dict[str, typing.Any], typing.List[str]]:
         if not parameters:
             parameters = {}
         parameters = typing.cast(typing.Dict[str, typing.Any], parameters)
@@ -859,12 +1009,35 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
                 merged_cols.append(f"any({col}) AS {col}")
         select_columns_part = ", ".join(merged_cols)
 
+        # id_conditions select calls by one of their parts, before grouping.
+        id_filter_part = ""
+        if id_conditions:
+            id_conditions_part = _combine_conditions(id_conditions, "AND")
+            id_limit_part = ""
+            if not conditions and order_by is None and limit is not None:
+                # Nothing filters the merged calls, so only the ids of this
+                # page need merging.
+                id_limit_part = (
+                    "ORDER BY started_at ASC, id ASC LIMIT {id_limit: Int64}"
+                )
+                parameters["id_limit"] = limit + (offset or 0)
+            id_filter_part = f"""
+                AND id IN (
+                    SELECT id
+                    FROM calls_merged
+                    WHERE project_id = {{project_id: String}}
+                    AND {id_conditions_part}
+                    {id_limit_part}
+                )
+            """
+
         if not conditions:
             conditions = ["1 = 1"]
 
         conditions_part = _combine_conditions(conditions, "AND")
 
-        order_by_part = "ORDER BY started_at ASC"
+        # Cursors point into this order.
+        order_by_part = "ORDER BY started_at ASC, id ASC"
         if order_by is not None:
             order_parts = []
             for field, direction in order_by:
@@ -914,24 +1087,18 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
             limit_part = "LIMIT {limit: Int64}"
             parameters["limit"] = limit
 
-        raw_res = self._query(
-            f"""
+        query = f"""
             SELECT {select_columns_part}
             FROM calls_merged
             WHERE project_id = {{project_id: String}}
+            {id_filter_part}
             GROUP BY project_id, id
             HAVING {conditions_part}
             {order_by_part}
             {limit_part}
             {offset_part}
-        """,
-            parameters,
-        )
-
-        dicts = []
-        for row in raw_res.result_rows:
-            dicts.append(dict(zip(columns, row)))
-        return dicts
+        """
+        return query, parameters, columns
 
     def _select_objs_query(
         self,
@@ -990,6 +1157,19 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
         print("Summary: " + json.dumps(res.summary, indent=2))
         return res
 
+    def _query_stream(
+        self,
+        query: str,
+        parameters: typing.Dict[str, typing.Any],
+        column_formats: typing.Optional[typing.Dict[str, typing.Any]] = None,
+    ) -> typing.Iterator[typing.Sequence[typing.Any]]:
+        parameters = _process_parameters(parameters)
+        with self.ch_client.query_rows_stream(
+            query, parameters=parameters, column_formats=column_formats, use_none=True
+        ) as stream:
+            for row in stream:
+                yield row
+
     def _insert(
         self,
         table: str,
@@ -1022,7 +1202,10 @@ class ClickHouseTraceServer(tsi.TraceServerInterface):
             self._flush_calls()
 
     def _flush_calls(self) -> None:
-        self._insert_call_batch(self._call_batch)
+        if self._call_processor is not None:
+            self._call_processor.enqueue(self._call_batch)
+        else:
+            self._insert_call_batch(self._call_batch)
         self._call_batch = []
 
 
@@ -10,6 +10,7 @@ from weave.trace_server import environment as wf_env
 from weave.wandb_interface import project_creator
 from .async_batch_processor import AsyncBatchProcessor
 from . import trace_server_interface as tsi
+from .trace_server_interface_util import bytes_digest
 
 
 class StartBatchItem(BaseModel):
@@ -26,6 +27,33 @@ class Batch(BaseModel):
     batch: t.List[t.Union[StartBatchItem, EndBatchItem]]
 
 
+class FileCreateBatchItem(BaseModel):
+    # Queued with the calls, but uploaded on its own ahead of them.
+    mode: str = "file_create"
+    req: tsi.FileCreateReq
+
+
+# Calls and files from different threads are sent in parallel. Each thread's
+# items are sent in the order they were queued, so a call's files and start
+# always reach the server before its end.
+BATCH_WORKERS = 4
+# Queued file contents are sent early once they add up to this many bytes.
+MAX_BATCH_FILE_BYTES = 10 * 1024 * 1024
+
+
+def _batch_item_size(item: BaseModel) -> int:
+    if isinstance(item, FileCreateBatchItem):
+        return len(item.req.content)
+    return 0
+
+
+def _is_retryable(e: Exception) -> bool:
+    # Client errors fail again on every retry.
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code >= 500 or e.response.status_code == 429
+    return isinstance(e, (requests.ConnectionError, requests.Timeout))
+
+
 class ServerInfoRes(BaseModel):
     min_required_weave_python_version: str
 
@@ -33,13 +61,21 @@ class ServerInfoRes(BaseModel):
 class RemoteHTTPTraceServer(tsi.TraceServerInterface):
     trace_server_url: str
 
-    # My current batching is not safe in notebooks, disable it for now
+    # When batching, call starts, call ends and file uploads are queued and
+    # sent from a background thread. Every other request flushes the queue
+    # first, so reads always see this process's earlier writes.
     def __init__(self, trace_server_url: str, should_batch: bool = False):
         super().__init__()
         self.trace_server_url = trace_server_url
         self.should_batch = should_batch
         if self.should_batch:
-            self.call_processor = AsyncBatchProcessor(self._flush_calls)
+            self.call_processor = AsyncBatchProcessor(
+                self._flush_calls,
+                num_workers=BATCH_WORKERS,
+                size_fn=_batch_item_size,
+                max_batch_bytes=MAX_BATCH_FILE_BYTES,
+                should_retry=_is_retryable,
+            )
         self._auth: t.Optional[t.Tuple[str, str]] = None
 
     def ensure_project_exists(self, entity: str, project: str) -> None:
@@ -54,10 +90,23 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
     def set_auth(self, auth: t.Tuple[str, str]) -> None:
         self._auth = auth
 
+    def flush(self) -> None:
+        if self.should_batch:
+            self.call_processor.flush()
+
     def _flush_calls(self, batch: t.List) -> None:
-        if len(batch) == 0:
+        # Calls in the batch may refer to the files, so upload them first.
+        call_items = []
+        for item in batch:
+            if isinstance(item, FileCreateBatchItem):
+                self._file_create(item.req)
+            else:
+                call_items.append(item)
+        if len(call_items) == 0:
             return
-        data = Batch(batch=batch).model_dump_json()
+        # A short call's start and end are usually in the same batch, and
+        # the server writes them together.
+        data = Batch(batch=call_items).model_dump_json()
         r = requests.post(
             self.trace_server_url + "/call/upsert_batch",
             data=data.encode("utf-8"),
@@ -74,6 +123,7 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
     ) -> BaseModel:
         if isinstance(req, dict):
             req = req_model.model_validate(req)
+        self.flush()
         r = requests.post(
             self.trace_server_url + url,
             data=req.model_dump_json().encode("utf-8"),
@@ -150,6 +200,29 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
             "/calls/query", req, tsi.CallsQueryReq, tsi.CallsQueryRes
         )
 
+    def calls_query_stream(
+        self, req: t.Union[tsi.CallsQueryReq, t.Dict[str, t.Any]]
+    ) -> t.Iterator[tsi.CallSchema]:
+        # The server writes one json encoded call per line (NDJSON) as it
+        # reads them, so neither side holds the whole result in memory.
+        # Requires a trace server that serves /calls/stream_query, which
+        # isn't part of this repo. Older servers answer 404, use calls_query
+        # with cursors against them instead.
+        if isinstance(req, dict):
+            req = tsi.CallsQueryReq.model_validate(req)
+        self.flush()
+        r = requests.post(
+            self.trace_server_url + "/calls/stream_query",
+            data=req.model_dump_json().encode("utf-8"),
+            auth=self._auth,
+            stream=True,
+        )
+        with r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if line:
+                    yield tsi.CallSchema.model_validate_json(line)
+
     # Op API
 
     def op_create(
@@ -210,6 +283,14 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
         )
 
     def file_create(self, req: tsi.FileCreateReq) -> tsi.FileCreateRes:
+        if self.should_batch:
+            # Files are content addressed, the digest is known without
+            # waiting for the upload.
+            self.call_processor.enqueue([FileCreateBatchItem(req=req)])
+            return tsi.FileCreateRes(digest=bytes_digest(req.content))
+        return self._file_create(req)
+
+    def _file_create(self, req: tsi.FileCreateReq) -> tsi.FileCreateRes:
         r = requests.post(
             self.trace_server_url + "/files/create",
             auth=self._auth,
@@ -220,6 +301,7 @@ class RemoteHTTPTraceServer(tsi.TraceServerInterface):
         return tsi.FileCreateRes.model_validate(r.json())
 
     def file_content_read(self, req: tsi.FileContentReadReq) -> tsi.FileContentReadRes:
+        self.flush()
         r = requests.post(
             self.trace_server_url + "/files/content",
             json={"project_id": req.project_id, "digest": req.digest},
@@ -1,9 +1,9 @@
 # Sqlite Trace Server
 
-from typing import cast, Optional, Any, Union
+from typing import cast, Optional, Any, Iterator, Union
+import os
 import threading
 
-import contextvars
 import contextlib
 import datetime
 import json
@@ -15,7 +15,11 @@ from .trace_server_interface_util import (
     extract_refs_from_values,
     str_digest,
     bytes_digest,
+    decode_calls_cursor,
+    next_calls_cursor,
+    MAX_REFS_READ_BATCH,
 )
+from .errors import InvalidRequest
 from . import trace_server_interface as tsi
 
 from weave.trace import refs
@@ -37,26 +41,234 @@ class NotFoundError(Exception):
     pass
 
 
-_conn_cursor: contextvars.ContextVar[
-    Optional[tuple[sqlite3.Connection, sqlite3.Cursor]]
-] = contextvars.ContextVar("conn_cursor", default=None)
+# Connections are pooled per thread: sqlite3 connections can't be shared
+# across threads, and opening one is far more expensive than the statements
+# we run on it. sqlite3 also keeps a per-connection cache of prepared
+# statements, so reusing connections lets parameterized queries skip parsing.
+_thread_conns = threading.local()
+
+# Number of prepared statements each connection keeps around.
+STATEMENT_CACHE_SIZE = 256
+
+# Values bound per IN (...) list, well under sqlite's variable limit.
+MAX_IN_PARAMS = 500
+
+# How long (ms) a writer waits for another connection's write transaction.
+BUSY_TIMEOUT_MS = 30000
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, cached_statements=STATEMENT_CACHE_SIZE)
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    # In WAL mode (set once per db file in setup_tables), synchronous=NORMAL
+    # only syncs at checkpoints.
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -64000")
+    return conn
 
 
 def get_conn_cursor(db_path: str) -> tuple[sqlite3.Connection, sqlite3.Cursor]:
-    # conn_cursor = _conn_cursor.get()
-    conn_cursor = None
+    conns = getattr(_thread_conns, "conns", None)
+    # Connections must not be used across a fork, so they are tracked per pid.
+    if conns is None or _thread_conns.pid != os.getpid():
+        conns = _thread_conns.conns = {}
+        _thread_conns.pid = os.getpid()
+    conn_cursor = conns.get(db_path)
     if conn_cursor is None:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        conn_cursor = (conn, cursor)
-        _conn_cursor.set(conn_cursor)
+        conn = _connect(db_path)
+        conn_cursor = (conn, conn.cursor())
+        conns[db_path] = conn_cursor
     return conn_cursor
 
 
+# Schema migrations, applied in order on top of the base tables created in
+# setup_tables. PRAGMA user_version records how many have been applied to a
+# db file, so files created by older versions are brought up to date.
+_MIGRATIONS: list[list[str]] = [
+    # 1: Ref side table and indexes for the common call lookups.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS call_refs (
+            project_id TEXT,
+            call_id TEXT,
+            ref TEXT,
+            direction TEXT)
+        """,
+        """
+        INSERT INTO call_refs (project_id, call_id, ref, direction)
+        SELECT DISTINCT calls.project_id, calls.id, json_each.value, 'input'
+        FROM calls, json_each(calls.input_refs)
+        WHERE calls.input_refs IS NOT NULL
+        """,
+        """
+        INSERT INTO call_refs (project_id, call_id, ref, direction)
+        SELECT DISTINCT calls.project_id, calls.id, json_each.value, 'output'
+        FROM calls, json_each(calls.output_refs)
+        WHERE calls.output_refs IS NOT NULL
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS call_refs_call
+        ON call_refs (call_id, direction, ref)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS call_refs_ref
+        ON call_refs (project_id, direction, ref)
+        """,
+        "CREATE INDEX IF NOT EXISTS calls_trace ON calls (project_id, trace_id)",
+        "CREATE INDEX IF NOT EXISTS calls_parent ON calls (project_id, parent_id)",
+        """
+        CREATE INDEX IF NOT EXISTS calls_op_started
+        ON calls (project_id, op_name, started_at)
+        """,
+        "CREATE INDEX IF NOT EXISTS calls_wb_run ON calls (wb_run_id)",
+    ],
+    # 2: Default calls order, used by calls_query cursors.
+    [
+        """
+        CREATE INDEX IF NOT EXISTS calls_started
+        ON calls (project_id, started_at, id)
+        """,
+    ],
+]
+
+
+def _ref_match_condition() -> str:
+    # A ref filter matches the ref itself and any ref into it (a row or
+    # attribute of a matched object, for example). Written as a range rather
+    # than LIKE so the ref index can be used.
+    return "(ref = ? OR (ref >= ? AND ref < ?))"
+
+
+def _ref_match_params(ref: str) -> list[str]:
+    # "0" is the character after "/", so this range covers ref + "/..."
+    return [ref, ref + "/", ref + "0"]
+
+
+def _insert_call_refs(
+    cursor: sqlite3.Cursor,
+    project_id: str,
+    call_id: str,
+    direction: str,
+    call_refs: list[str],
+) -> None:
+    cursor.executemany(
+        """INSERT OR IGNORE INTO call_refs (project_id, call_id, ref, direction)
+        VALUES (?, ?, ?, ?)""",
+        [(project_id, call_id, ref, direction) for ref in call_refs],
+    )
+
+
+def _sqlite_json_path(dotted_path: str) -> str:
+    # a.list.0 -> $."a"."list"[0], sqlite indexes arrays with [n].
+    path = "$"
+    for part in dotted_path.split("."):
+        if part.isdigit():
+            path += f"[{part}]"
+        else:
+            path += f'."{part}"'
+    return path
+
+
+def _placeholders(values: list[Any]) -> str:
+    return ", ".join("?" * len(values))
+
+
+def _call_row_to_call_schema(row: tuple) -> tsi.CallSchema:
+    return tsi.CallSchema(
+        project_id=row[0],
+        id=row[1],
+        trace_id=row[2],
+        parent_id=row[3],
+        op_name=row[4],
+        started_at=row[5],
+        ended_at=row[6],
+        exception=row[7],
+        attributes=json.loads(row[8]),
+        inputs=json.loads(row[9]),
+        output=None if row[11] is None else json.loads(row[11]),
+        output_refs=None if row[12] is None else json.loads(row[12]),
+        summary=json.loads(row[13]) if row[13] else None,
+        wb_user_id=row[14],
+        wb_run_id=row[15],
+    )
+
+
+def _walk_extra(val: Any, extra: list[str], start: int) -> tuple[Any, int]:
+    """Follows extra from index start until the end or a table row edge.
+
+    Returns the value reached and the index the walk stopped at. When stopped
+    at a table row edge the value is the parsed TableRef holding the row.
+    """
+    for extra_index in range(start, len(extra), 2):
+        op, arg = extra[extra_index], extra[extra_index + 1]
+        if op == DICT_KEY_EDGE_NAME:
+            val = val[arg]
+        elif op == OBJECT_ATTR_EDGE_NAME:
+            val = val[arg]
+        elif op == LIST_INDEX_EDGE_NAME:
+            val = val[int(arg)]
+        elif op == TABLE_ROW_ID_EDGE_NAME:
+            table_ref = None
+            if isinstance(val, str) and val.startswith("weave://"):
+                table_ref = refs.parse_uri(val)
+            if not isinstance(table_ref, refs.TableRef):
+                raise ValueError(
+                    "invalid data layout encountered, expected TableRef when resolving id"
+                )
+            return table_ref, extra_index
+        else:
+            raise ValueError(f"Unknown ref type: {extra[extra_index]}")
+    return val, len(extra)
+
+
 class SqliteTraceServer(tsi.TraceServerInterface):
     def __init__(self, db_path: str):
-        self.lock = threading.Lock()
         self.db_path = db_path
+        # Per thread, set while inside call_batch()
+        self._batching = threading.local()
+
+    @contextlib.contextmanager
+    def call_batch(self) -> Iterator[None]:
+        # Call starts and ends made by this thread inside the batch are
+        # committed together in one transaction when it exits. If the body
+        # raises, the batch is rolled back.
+        if getattr(self._batching, "active", False):
+            yield
+            return
+        conn, cursor = get_conn_cursor(self.db_path)
+        self._batching.active = True
+        try:
+            yield
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+        finally:
+            self._batching.active = False
+
+    def _commit_call_write(self, conn: sqlite3.Connection) -> None:
+        if not getattr(self._batching, "active", False):
+            conn.commit()
+
+    @contextlib.contextmanager
+    def _write_transaction(
+        self, conn: sqlite3.Connection, cursor: sqlite3.Cursor
+    ) -> Iterator[None]:
+        # Inside call_batch() the batch's transaction is already open, the
+        # writes join it and are committed with the batch.
+        if conn.in_transaction:
+            yield
+            return
+        # IMMEDIATE takes the write lock up front, so reads made inside the
+        # transaction can't be invalidated by another connection's write.
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
 
     def drop_tables(self) -> None:
         conn, cursor = get_conn_cursor(self.db_path)
@@ -64,9 +276,14 @@ class SqliteTraceServer(tsi.TraceServerInterface):
         cursor.execute("DROP TABLE IF EXISTS objects")
         cursor.execute("DROP TABLE IF EXISTS tables")
         cursor.execute("DROP TABLE IF EXISTS table_rows")
+        cursor.execute("DROP TABLE IF EXISTS call_refs")
+        cursor.execute("PRAGMA user_version = 0")
 
     def setup_tables(self) -> None:
         conn, cursor = get_conn_cursor(self.db_path)
+        # WAL lets readers proceed while a write is in progress. The mode is
+        # stored in the db file, so connections don't need to set it.
+        cursor.execute("PRAGMA journal_mode = WAL")
         cursor.execute(
             """
             CREATE TABLE IF NOT EXISTS calls (
@@ -129,6 +346,17 @@ class SqliteTraceServer(tsi.TraceServerInterface):
                 val BLOB)
             """
         )
+        self._migrate(conn, cursor)
+
+    def _migrate(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor) -> None:
+        with self._write_transaction(conn, cursor):
+            cursor.execute("PRAGMA user_version")
+            version = cursor.fetchone()[0]
+            for i, migration in enumerate(_MIGRATIONS[version:], start=version + 1):
+                for statement in migration:
+                    cursor.execute(statement)
+                # PRAGMA doesn't take parameters.
+                cursor.execute(f"PRAGMA user_version = {i}")
 
     # Creates a new call
     def call_start(self, req: tsi.CallStartReq) -> tsi.CallStartRes:
@@ -137,41 +365,42 @@ class SqliteTraceServer(tsi.TraceServerInterface):
             raise ValueError("trace_id is required")
         if req.start.id is None:
             raise ValueError("id is required")
-        with self.lock:
-            # Converts the user-provided call details into a clickhouse schema.
-            # This does validation and conversion of the input data as well
-            # as enforcing business rules and defaults
-            cursor.execute(
-                """INSERT INTO calls (
-                    project_id,
-                    id,
-                    trace_id,
-                    parent_id,
-                    op_name,
-                    started_at,
-                    attributes,
-                    inputs,
-                    input_refs,
-                    wb_user_id,
-                    wb_run_id
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (
-                    req.start.project_id,
-                    req.start.id,
-                    req.start.trace_id,
-                    req.start.parent_id,
-                    req.start.op_name,
-                    req.start.started_at.isoformat(),
-                    json.dumps(req.start.attributes),
-                    json.dumps(req.start.inputs),
-                    json.dumps(
-                        extract_refs_from_values(list(req.start.inputs.values()))
-                    ),
-                    req.start.wb_user_id,
-                    req.start.wb_run_id,
-                ),
-            )
-            conn.commit()
+        input_refs = extract_refs_from_values(list(req.start.inputs.values()))
+        # Converts the user-provided call details into a clickhouse schema.
+        # This does validation and conversion of the input data as well
+        # as enforcing business rules and defaults
+        cursor.execute(
+            """INSERT INTO calls (
+                project_id,
+                id,
+                trace_id,
+                parent_id,
+                op_name,
+                started_at,
+                attributes,
+                inputs,
+                input_refs,
+                wb_user_id,
+                wb_run_id
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                req.start.project_id,
+                req.start.id,
+                req.start.trace_id,
+                req.start.parent_id,
+                req.start.op_name,
+                req.start.started_at.isoformat(),
+                json.dumps(req.start.attributes),
+                json.dumps(req.start.inputs),
+                json.dumps(input_refs),
+                req.start.wb_user_id,
+                req.start.wb_run_id,
+            ),
+        )
+        _insert_call_refs(
+            cursor, req.start.project_id, req.start.id, "input", input_refs
+        )
+        self._commit_call_write(conn)
 
         # Returns the id of the newly created call
         return tsi.CallStartRes(
@@ -185,27 +414,26 @@ class SqliteTraceServer(tsi.TraceServerInterface):
         if not isinstance(parsable_output, dict):
             parsable_output = {"output": parsable_output}
         parsable_output = cast(dict, parsable_output)
-        with self.lock:
-            cursor.execute(
-                """UPDATE calls SET
-                    ended_at = ?,
-                    exception = ?,
-                    output = ?,
-                    output_refs = ?,
-                    summary = ?
-                WHERE id = ?""",
-                (
-                    req.end.ended_at.isoformat(),
-                    req.end.exception,
-                    json.dumps(req.end.output),
-                    json.dumps(
-                        extract_refs_from_values(list(parsable_output.values()))
-                    ),
-                    json.dumps(req.end.summary),
-                    req.end.id,
-                ),
-            )
-            conn.commit()
+        output_refs = extract_refs_from_values(list(parsable_output.values()))
+        cursor.execute(
+            """UPDATE calls SET
+                ended_at = ?,
+                exception = ?,
+                output = ?,
+                output_refs = ?,
+                summary = ?
+            WHERE id = ?""",
+            (
+                req.end.ended_at.isoformat(),
+                req.end.exception,
+                json.dumps(req.end.output),
+                json.dumps(output_refs),
+                json.dumps(req.end.summary),
+                req.end.id,
+            ),
+        )
+        _insert_call_refs(cursor, req.end.project_id, req.end.id, "output", output_refs)
+        self._commit_call_write(conn)
         return tsi.CallEndRes()
 
     def call_read(self, req: tsi.CallReadReq) -> tsi.CallReadRes:
@@ -220,9 +448,28 @@ class SqliteTraceServer(tsi.TraceServerInterface):
         )
 
     def calls_query(self, req: tsi.CallsQueryReq) -> tsi.CallsQueryRes:
-        print("REQ", req)
         conn, cursor = get_conn_cursor(self.db_path)
-        conds = []
+        query, params = self._calls_query_sql(req)
+        cursor.execute(query, params)
+        calls = [_call_row_to_call_schema(row) for row in cursor.fetchall()]
+        return tsi.CallsQueryRes(calls=calls, next_cursor=next_calls_cursor(req, calls))
+
+    def calls_query_stream(self, req: tsi.CallsQueryReq) -> Iterator[tsi.CallSchema]:
+        conn, _ = get_conn_cursor(self.db_path)
+        query, params = self._calls_query_sql(req)
+        # The thread's shared cursor may be reused by the caller while we are
+        # still yielding rows, so read through our own.
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            for row in cursor:
+                yield _call_row_to_call_schema(row)
+        finally:
+            cursor.close()
+
+    def _calls_query_sql(self, req: tsi.CallsQueryReq) -> tuple[str, list[Any]]:
+        conds: list[str] = []
+        params: list[Any] = []
         filter = req.filter
         if filter:
             if filter.op_names:
@@ -237,42 +484,58 @@ class SqliteTraceServer(tsi.TraceServerInterface):
                         non_wildcarded_names.append(name)
 
                 if non_wildcarded_names:
-                    in_expr = ", ".join((f"'{x}'" for x in non_wildcarded_names))
-                    or_conditions += [f"op_name IN ({', '.join({in_expr})})"]
+                    or_conditions.append(
+                        f"op_name IN ({_placeholders(non_wildcarded_names)})"
+                    )
+                    params.extend(non_wildcarded_names)
 
-                for name_ndx, name in enumerate(wildcarded_names):
+                for name in wildcarded_names:
                     like_name = name[: -len(WILDCARD_ARTIFACT_VERSION_AND_PATH)] + "%"
-                    or_conditions.append(f"op_name LIKE '{like_name}'")
+                    or_conditions.append("op_name LIKE ?")
+                    params.append(like_name)
 
                 if or_conditions:
                     conds.append("(" + " OR ".join(or_conditions) + ")")
 
-            if filter.input_refs:
-                or_conditions = []
-                for ref in filter.input_refs:
-                    or_conditions.append(f"input_refs LIKE '%{ref}%'")
-                conds.append("(" + " OR ".join(or_conditions) + ")")
-            if filter.output_refs:
-                or_conditions = []
-                for ref in filter.output_refs:
-                    or_conditions.append(f"output_refs LIKE '%{ref}%'")
-                conds.append("(" + " OR ".join(or_conditions) + ")")
+            for direction, filter_refs in (
+                ("input", filter.input_refs),
+                ("output", filter.output_refs),
+            ):
+                if not filter_refs:
+                    continue
+                ref_conds = " OR ".join([_ref_match_condition()] * len(filter_refs))
+                conds.append(
+                    f"""id IN (
+                        SELECT call_id FROM call_refs
+                        WHERE project_id = ? AND direction = ? AND ({ref_conds})
+                    )"""
+                )
+                params.extend([req.project_id, direction])
+                for ref in filter_refs:
+                    params.extend(_ref_match_params(ref))
             if filter.parent_ids:
-                in_expr = ", ".join((f"'{x}'" for x in filter.parent_ids))
-                conds += [f"parent_id IN ({in_expr})"]
+                conds.append(f"parent_id IN ({_placeholders(filter.parent_ids)})")
+                params.extend(filter.parent_ids)
             if filter.trace_ids:
-                in_expr = ", ".join((f"'{x}'" for x in filter.trace_ids))
-                conds += [f"trace_id IN ({in_expr})"]
+                conds.append(f"trace_id IN ({_placeholders(filter.trace_ids)})")
+                params.extend(filter.trace_ids)
             if filter.call_ids:
-                in_expr = ", ".join((f"'{x}'" for x in filter.call_ids))
-                conds += [f"id IN ({in_expr})"]
+                conds.append(f"id IN ({_placeholders(filter.call_ids)})")
+                params.extend(filter.call_ids)
             if filter.trace_roots_only:
                 conds.append("parent_id IS NULL")
             if filter.wb_run_ids:
-                in_expr = ", ".join((f"'{x}'" for x in filter.wb_run_ids))
-                conds += [f"wb_run_id IN ({in_expr})"]
+                conds.append(f"wb_run_id IN ({_placeholders(filter.wb_run_ids)})")
+                params.extend(filter.wb_run_ids)
 
-        query = f"SELECT * FROM calls WHERE project_id = '{req.project_id}'"
+        if req.cursor is not None:
+            if req.sort_by:
+                raise InvalidRequest("cursor can't be combined with sort_by")
+            conds.append("(started_at, id) > (?, ?)")
+            params.extend(decode_calls_cursor(req.cursor))
+
+        query = "SELECT * FROM calls WHERE project_id = ?"
+        params.insert(0, req.project_id)
 
         conditions_part = " AND ".join(conds)
 
@@ -286,16 +549,12 @@ class SqliteTraceServer(tsi.TraceServerInterface):
             order_parts = []
             for field, direction in order_by:
                 json_path: Optional[str] = None
-                if field.startswith("inputs"):
-                    field = "inputs" + field[len("inputs") :]
-                    if field.startswith("inputs."):
-                        field = "inputs"
-                        json_path = field[len("inputs.") :]
-                elif field.startswith("output"):
-                    field = "output" + field[len("output") :]
-                    if field.startswith("output."):
-                        field = "output"
-                        json_path = field[len("output.") :]
+                if field.startswith("inputs."):
+                    json_path = field[len("inputs.") :]
+                    field = "inputs"
+                elif field.startswith("output."):
+                    json_path = field[len("output.") :]
+                    field = "output"
                 elif field.startswith("attributes"):
                     field = "attributes_dump" + field[len("attributes") :]
                 elif field.startswith("summary"):
@@ -310,44 +569,24 @@ class SqliteTraceServer(tsi.TraceServerInterface):
                     "desc",
                 ], f"Invalid order_by direction: {direction}"
                 if json_path:
-                    field = f"json_extract({field}, '$.{json_path}')"
+                    field = f"json_extract({field}, ?)"
+                    params.append(_sqlite_json_path(json_path))
                 order_parts.append(f"{field} {direction}")
 
             order_by_part = ", ".join(order_parts)
-            query += f"ORDER BY {order_by_part}"
+            query += f" ORDER BY {order_by_part}"
+        else:
+            # Cursors point into this order.
+            query += " ORDER BY started_at, id"
 
-        limit = req.limit or -1
-        if limit:
-            query += f" LIMIT {limit}"
+        # sqlite needs a LIMIT to accept an OFFSET, -1 means no limit.
+        query += " LIMIT ?"
+        params.append(req.limit or -1)
         if req.offset:
-            query += f" OFFSET {req.offset}"
-        print("QUERY", query)
+            query += " OFFSET ?"
+            params.append(req.offset)
 
-        cursor.execute(query)
-
-        query_result = cursor.fetchall()
-        return tsi.CallsQueryRes(
-            calls=[
-                tsi.CallSchema(
-                    project_id=row[0],
-                    id=row[1],
-                    trace_id=row[2],
-                    parent_id=row[3],
-                    op_name=row[4],
-                    started_at=row[5],
-                    ended_at=row[6],
-                    exception=row[7],
-                    attributes=json.loads(row[8]),
-                    inputs=json.loads(row[9]),
-                    output=None if row[11] is None else json.loads(row[11]),
-                    output_refs=None if row[12] is None else json.loads(row[12]),
-                    summary=json.loads(row[13]) if row[13] else None,
-                    wb_user_id=row[14],
-                    wb_run_id=row[15],
-                )
-                for row in query_result
-            ]
-        )
+        return query, params
 
     def op_create(self, req: tsi.OpCreateReq) -> tsi.OpCreateRes:
         raise NotImplementedError()
@@ -365,8 +604,7 @@ class SqliteTraceServer(tsi.TraceServerInterface):
 
         req_obj = req.obj
         # TODO: version index isn't right here, what if we delete stuff?
-        with self.lock:
-            cursor.execute("BEGIN TRANSACTION")
+        with self._write_transaction(conn, cursor):
             # first get version count
             cursor.execute(
                 """SELECT COUNT(*) FROM objects WHERE project_id = ? AND object_id = ?""",
@@ -400,20 +638,20 @@ class SqliteTraceServer(tsi.TraceServerInterface):
                     1,
                 ),
             )
-            conn.commit()
         return tsi.ObjCreateRes(digest=digest)
 
     def obj_read(self, req: tsi.ObjReadReq) -> tsi.ObjReadRes:
-        conds = [
-            f"object_id = '{req.object_id}'",
-        ]
+        conds = ["object_id = ?"]
+        params: list[Any] = [req.object_id]
         if req.digest == "latest":
             conds.append("is_latest = 1")
         else:
-            conds.append(f"digest = '{req.digest}'")
+            conds.append("digest = ?")
+            params.append(req.digest)
         objs = self._select_objs_query(
             req.project_id,
             conditions=conds,
+            parameters=params,
         )
         if len(objs) == 0:
             raise NotFoundError(f"Obj {req.object_id}:{req.digest} not found")
@@ -422,6 +660,7 @@ class SqliteTraceServer(tsi.TraceServerInterface):
 
     def objs_query(self, req: tsi.ObjQueryReq) -> tsi.ObjQueryRes:
         conds: list[str] = []
+        params: list[Any] = []
         if req.filter:
             if req.filter.is_op is not None:
                 if req.filter.is_op:
@@ -429,17 +668,21 @@ class SqliteTraceServer(tsi.TraceServerInterface):
                 else:
                     conds.append("kind != 'op'")
             if req.filter.object_ids:
-                in_list = ", ".join([f"'{n}'" for n in req.filter.object_ids])
-                conds.append(f"object_id IN ({in_list})")
+                conds.append(f"object_id IN ({_placeholders(req.filter.object_ids)})")
+                params.extend(req.filter.object_ids)
             if req.filter.latest_only:
                 conds.append("is_latest = 1")
             if req.filter.base_object_classes:
-                in_list = ", ".join([f"'{t}'" for t in req.filter.base_object_classes])
-                conds.append(f"base_object_class IN ({in_list})")
+                conds.append(
+                    "base_object_class IN "
+                    f"({_placeholders(req.filter.base_object_classes)})"
+                )
+                params.extend(req.filter.base_object_classes)
 
         objs = self._select_objs_query(
             req.project_id,
             conditions=conds,
+            parameters=params,
         )
 
         return tsi.ObjQueryRes(objs=objs)
@@ -453,7 +696,7 @@ class SqliteTraceServer(tsi.TraceServerInterface):
             row_json = json.dumps(r)
             row_digest = str_digest(row_json)
             insert_rows.append((req.table.project_id, row_digest, row_json))
-        with self.lock:
+        with self._write_transaction(conn, cursor):
             cursor.executemany(
                 "INSERT OR IGNORE INTO table_rows (project_id, digest, val) VALUES (?, ?, ?)",
                 insert_rows,
@@ -470,26 +713,30 @@ class SqliteTraceServer(tsi.TraceServerInterface):
                 "INSERT OR IGNORE INTO tables (project_id, digest, row_digests) VALUES (?, ?, ?)",
                 (req.table.project_id, digest, json.dumps(row_digests)),
             )
-            conn.commit()
 
         return tsi.TableCreateRes(digest=digest)
 
     def table_query(self, req: tsi.TableQueryReq) -> tsi.TableQueryRes:
-        conds = []
+        row_digests = None
         if req.filter:
-            raise NotImplementedError("Table filter not implemented")
-        else:
-            conds.append("1 = 1")
-        rows = self._table_query(req.project_id, req.digest, conditions=conds)
+            row_digests = req.filter.row_digests
+        rows = self._table_query(
+            req.project_id,
+            req.digest,
+            row_digests=row_digests,
+            limit=req.limit,
+            offset=req.offset,
+        )
+        stats = None
+        if req.include_stats:
+            stats = tsi.TableQueryStats(
+                count=self._table_row_count(req.project_id, req.digest)
+            )
 
-        return tsi.TableQueryRes(rows=rows)
+        return tsi.TableQueryRes(rows=rows, stats=stats)
 
     def refs_read_batch(self, req: tsi.RefsReadBatchReq) -> tsi.RefsReadBatchRes:
-        # TODO: This reads one ref at a time, it should read them in batches
-        # where it can. Like it should group by object that we need to read.
-        # And it should also batch into table refs (like when we are reading a bunch
-        # of rows from a single Dataset)
-        if len(req.refs) > 1000:
+        if len(req.refs) > MAX_REFS_READ_BATCH:
             raise ValueError("Too many refs")
 
         parsed_refs = [refs.parse_uri(r) for r in req.refs]
@@ -497,54 +744,78 @@ class SqliteTraceServer(tsi.TraceServerInterface):
             raise ValueError("Table refs not supported")
         parsed_obj_refs = cast(list[refs.ObjectRef], parsed_refs)
 
-        def read_ref(r: refs.ObjectRef) -> Any:
-            conds = [
-                f"object_id = '{r.name}'",
-                f"digest = '{r.digest}'",
-            ]
-            objs = self._select_objs_query(
-                f"{r.entity}/{r.project}",
-                conditions=conds,
+        # Each root object is read once, however many refs point into it.
+        root_vals = self._read_obj_vals(parsed_obj_refs)
+        vals = [
+            root_vals[(f"{r.entity}/{r.project}", r.name, r.digest)]
+            for r in parsed_obj_refs
+        ]
+        extra_indexes = [0] * len(parsed_obj_refs)
+        while True:
+            # Walk every ref's extra up to its next table row, then read the
+            # rows the refs are waiting on with one query per table.
+            # (project_id, table digest) -> row digest -> ref indexes
+            pending_rows: dict[tuple[str, str], dict[str, list[int]]] = {}
+            for i, r in enumerate(parsed_obj_refs):
+                vals[i], extra_indexes[i] = _walk_extra(
+                    vals[i], r.extra, extra_indexes[i]
+                )
+                if extra_indexes[i] < len(r.extra):
+                    table_ref = vals[i]
+                    table_key = (
+                        f"{table_ref.entity}/{table_ref.project}",
+                        table_ref.digest,
+                    )
+                    row_digest = r.extra[extra_indexes[i] + 1]
+                    pending_rows.setdefault(table_key, {}).setdefault(
+                        row_digest, []
+                    ).append(i)
+            if not pending_rows:
+                break
+            for (project_id, _), row_digest_refs in pending_rows.items():
+                rows = self._table_rows_read(project_id, list(row_digest_refs))
+                for row_digest, ref_indexes in row_digest_refs.items():
+                    if row_digest not in rows:
+                        raise NotFoundError(f"Row {row_digest} not found")
+                    for i in ref_indexes:
+                        vals[i] = rows[row_digest]
+                        extra_indexes[i] += 2
+
+        return tsi.RefsReadBatchRes(vals=vals)
+
+    def _read_obj_vals(
+        self, obj_refs: list[refs.ObjectRef]
+    ) -> dict[tuple[str, str, str], Any]:
+        # (project_id, object_id, digest) -> val
+        keys_by_project: dict[str, set[tuple[str, str]]] = {}
+        for r in obj_refs:
+            keys_by_project.setdefault(f"{r.entity}/{r.project}", set()).add(
+                (r.name, r.digest)
             )
-            if len(objs) == 0:
-                raise NotFoundError(f"Obj {r.name}:{r.digest} not found")
-            obj = objs[0]
-            val = obj.val
-            extra = r.extra
-            for extra_index in range(0, len(extra), 2):
-                op, arg = extra[extra_index], extra[extra_index + 1]
-                if op == DICT_KEY_EDGE_NAME:
-                    val = val[arg]
-                elif op == OBJECT_ATTR_EDGE_NAME:
-                    val = val[arg]
-                elif op == LIST_INDEX_EDGE_NAME:
-                    val = val[int(arg)]
-                elif op == TABLE_ROW_ID_EDGE_NAME:
-                    if isinstance(val, str) and val.startswith("weave://"):
-                        table_ref = refs.parse_uri(val)
-                        if not isinstance(table_ref, refs.TableRef):
-                            raise ValueError(
-                                "invalid data layout encountered, expected TableRef when resolving id"
-                            )
-                        row = self._table_row_read(
-                            project_id=f"{table_ref.entity}/{table_ref.project}",
-                            row_digest=arg,
-                        )
-                        val = row.val
-                    else:
-                        raise ValueError(
-                            "invalid data layout encountered, expected TableRef when resolving id"
-                        )
-                else:
-                    raise ValueError(f"Unknown ref type: {extra[extra_index]}")
-            return val
-
-        return tsi.RefsReadBatchRes(vals=[read_ref(r) for r in parsed_obj_refs])
+        vals: dict[tuple[str, str, str], Any] = {}
+        for project_id, keys in keys_by_project.items():
+            sorted_keys = sorted(keys)
+            # Each pair binds two values.
+            chunk_size = MAX_IN_PARAMS // 2
+            for start in range(0, len(sorted_keys), chunk_size):
+                chunk = sorted_keys[start : start + chunk_size]
+                pairs = ", ".join(["(?, ?)"] * len(chunk))
+                objs = self._select_objs_query(
+                    project_id,
+                    conditions=[f"(object_id, digest) IN (VALUES {pairs})"],
+                    parameters=[v for key in chunk for v in key],
+                )
+                for obj in objs:
+                    vals[(project_id, obj.object_id, obj.digest)] = obj.val
+            for name, digest in keys:
+                if (project_id, name, digest) not in vals:
+                    raise NotFoundError(f"Obj {name}:{digest} not found")
+        return vals
 
     def file_create(self, req: tsi.FileCreateReq) -> tsi.FileCreateRes:
         conn, cursor = get_conn_cursor(self.db_path)
         digest = bytes_digest(req.content)
-        with self.lock:
+        with self._write_transaction(conn, cursor):
             cursor.execute(
                 "INSERT OR IGNORE INTO files (project_id, digest, val) VALUES (?, ?, ?)",
                 (
@@ -553,7 +824,6 @@ class SqliteTraceServer(tsi.TraceServerInterface):
                     req.content,
                 ),
             )
-            conn.commit()
         return tsi.FileCreateRes(digest=digest)
 
     def file_content_read(self, req: tsi.FileContentReadReq) -> tsi.FileContentReadRes:
@@ -571,30 +841,36 @@ class SqliteTraceServer(tsi.TraceServerInterface):
         self,
         project_id: str,
         digest: str,
-        conditions: Optional[list[str]] = None,
+        row_digests: Optional[list[str]] = None,
         limit: Optional[int] = None,
-        parameters: Optional[dict[str, Any]] = None,
+        offset: Optional[int] = None,
     ) -> list[tsi.TableRowSchema]:
         conn, cursor = get_conn_cursor(self.db_path)
-        conds = ["project_id = {project_id: String}"]
-        if conditions:
-            conds.extend(conditions)
-
-        predicate = " AND ".join(conds)
-        # First get the row IDs by querying tables
+        params: list[Any] = [project_id, digest]
+        digest_cond = ""
+        if row_digests is not None:
+            digest_cond = f"AND json_each.value IN ({_placeholders(row_digests)})"
+            params.extend(row_digests)
+        # sqlite needs a LIMIT to accept an OFFSET, -1 means no limit.
+        params.extend([limit or -1, offset or 0])
+        # Rows are paged in table order before being joined, so a page only
+        # reads the rows it returns.
         cursor.execute(
-            """
+            f"""
             WITH OrderedDigests AS (
                 SELECT
-                    json_each.value AS digest
+                    json_each.value AS digest,
+                    json_each.key AS row_index
                 FROM
                     tables,
                     json_each(tables.row_digests)
                 WHERE
                     tables.project_id = ? AND
                     tables.digest = ?
+                    {digest_cond}
                 ORDER BY
-                    json_each.id
+                    json_each.key
+                LIMIT ? OFFSET ?
             )
             SELECT
                 table_rows.digest,
@@ -602,42 +878,62 @@ class SqliteTraceServer(tsi.TraceServerInterface):
             FROM
                 OrderedDigests
                 JOIN table_rows ON OrderedDigests.digest = table_rows.digest
+            ORDER BY
+                OrderedDigests.row_index
             """,
-            (project_id, digest),
+            params,
         )
         query_result = cursor.fetchall()
         return [
             tsi.TableRowSchema(digest=r[0], val=json.loads(r[1])) for r in query_result
         ]
 
-    def _table_row_read(self, project_id: str, row_digest: str) -> tsi.TableRowSchema:
+    def _table_row_count(self, project_id: str, digest: str) -> int:
         conn, cursor = get_conn_cursor(self.db_path)
-        # Now get the rows
         cursor.execute(
             """
-            SELECT digest, val FROM table_rows
+            SELECT json_array_length(row_digests) FROM tables
             WHERE project_id = ? AND digest = ?
             """,
-            [project_id, row_digest],
+            (project_id, digest),
         )
         query_result = cursor.fetchone()
         if query_result is None:
-            raise NotFoundError(f"Row {row_digest} not found")
-        return tsi.TableRowSchema(
-            digest=query_result[0], val=json.loads(query_result[1])
-        )
+            raise NotFoundError(f"Table {digest} not found")
+        return query_result[0]
+
+    def _table_rows_read(
+        self, project_id: str, row_digests: list[str]
+    ) -> dict[str, Any]:
+        # row digest -> val
+        conn, cursor = get_conn_cursor(self.db_path)
+        rows: dict[str, Any] = {}
+        for start in range(0, len(row_digests), MAX_IN_PARAMS):
+            chunk = row_digests[start : start + MAX_IN_PARAMS]
+            cursor.execute(
+                f"""
+                SELECT digest, val FROM table_rows
+                WHERE project_id = ? AND digest IN ({_placeholders(chunk)})
+                """,
+                [project_id, *chunk],
+            )
+            for digest, val in cursor.fetchall():
+                rows[digest] = json.loads(val)
+        return rows
 
     def _select_objs_query(
         self,
         project_id: str,
         conditions: Optional[list[str]] = None,
         limit: Optional[int] = None,
+        parameters: Optional[list[Any]] = None,
     ) -> list[tsi.ObjSchema]:
+        # conditions use ? placeholders, bound in order to parameters.
         conn, cursor = get_conn_cursor(self.db_path)
         pred = " AND ".join(conditions or ["1 = 1"])
         cursor.execute(
             """SELECT * FROM objects WHERE project_id = ? AND """ + pred,
-            (project_id,),
+            [project_id, *(parameters or [])],
         )
         query_result = cursor.fetchall()
         result: list[tsi.ObjSchema] = []
@@ -0,0 +1,177 @@
+import threading
+import time
+
+from weave.trace_server.async_batch_processor import AsyncBatchProcessor
+
+
+def test_flush_processes_without_waiting_for_interval():
+    batches = []
+    processor = AsyncBatchProcessor(batches.append, max_batch_interval=60)
+    processor.enqueue([1, 2])
+    processor.enqueue([3])
+    processor.flush()
+    assert [i for b in batches for i in b] == [1, 2, 3]
+    processor.wait_until_all_processed()
+
+
+def test_flush_does_not_wait_for_later_items():
+    release_first = threading.Event()
+    started_later = threading.Event()
+    release_later = threading.Event()
+
+    def process(batch):
+        if batch == [1]:
+            release_first.wait()
+        else:
+            started_later.set()
+            release_later.wait()
+
+    processor = AsyncBatchProcessor(process, max_batch_size=1, max_batch_interval=60)
+    processor.enqueue([1])
+    t = threading.Thread(target=processor.flush)
+    t.start()
+    deadline = time.monotonic() + 5
+    while not processor._flush_waiters and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Enqueued after flush started, flush shouldn't wait for it.
+    processor.enqueue([2])
+    release_first.set()
+    assert started_later.wait(5)
+    t.join(5)
+    assert not t.is_alive()
+    release_later.set()
+    processor.wait_until_all_processed()
+
+
+def test_batch_processed_at_size_or_deadline():
+    batches = []
+    processor = AsyncBatchProcessor(
+        batches.append, max_batch_size=2, max_batch_interval=0.2
+    )
+    processor.enqueue([1, 2, 3])
+    # A full batch goes right away, the rest waits for the deadline.
+    deadline = time.monotonic() + 5
+    while not batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert batches == [[1, 2]]
+    while len(batches) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert batches == [[1, 2], [3]]
+    processor.wait_until_all_processed()
+
+
+def test_batch_processed_at_byte_threshold():
+    batches = []
+    processor = AsyncBatchProcessor(
+        batches.append, max_batch_interval=60, size_fn=len, max_batch_bytes=10
+    )
+    processor.enqueue([b"12345", b"67890"])
+    deadline = time.monotonic() + 5
+    while not batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert batches == [[b"12345", b"67890"]]
+    processor.wait_until_all_processed()
+
+
+def test_workers_keep_order_per_key():
+    release = threading.Event()
+    processed = []
+
+    def process(batch):
+        if batch[0][0] == 0:
+            # Only key 1 can make progress while key 0 is blocked.
+            release.wait()
+        processed.extend(batch)
+
+    # Integer keys hash to themselves, so the two keys get different workers.
+    processor = AsyncBatchProcessor(
+        process,
+        max_batch_size=1,
+        max_batch_interval=0,
+        num_workers=2,
+        key_fn=lambda item: item[0],
+    )
+    processor.enqueue([(0, "a"), (1, "a"), (0, "b"), (1, "b")])
+    deadline = time.monotonic() + 5
+    while len(processed) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert processed == [(1, "a"), (1, "b")]
+    release.set()
+    processor.flush()
+    assert processed[2:] == [(0, "a"), (0, "b")]
+    processor.wait_until_all_processed()
+
+
+def test_enqueue_blocks_while_queue_is_full():
+    release = threading.Event()
+    processed = []
+
+    def process(batch):
+        release.wait()
+        processed.extend(batch)
+
+    processor = AsyncBatchProcessor(
+        process, max_batch_size=1, max_batch_interval=0, max_queue_size=1
+    )
+    processor.enqueue([1])
+    t = threading.Thread(target=processor.enqueue, args=([2, 3],))
+    t.start()
+    t.join(0.2)
+    # One item is being processed, one waits in the queue, the last one
+    # has to wait for room.
+    assert t.is_alive()
+    release.set()
+    t.join()
+    processor.flush()
+    assert processed == [1, 2, 3]
+    processor.wait_until_all_processed()
+
+
+def test_failed_batch_is_retried():
+    attempts = []
+
+    def process(batch):
+        attempts.append(batch)
+        if len(attempts) < 3:
+            raise ValueError("boom")
+
+    processor = AsyncBatchProcessor(process, retry_backoff=0)
+    processor.enqueue([1])
+    processor.flush()
+    assert attempts == [[1], [1], [1]]
+    stats = processor.stats()
+    assert stats.retries == 2
+    assert stats.failed_batches == 0
+    assert stats.batches == 1
+    processor.wait_until_all_processed()
+
+
+def test_failed_batch_does_not_stop_processing():
+    processed = []
+
+    def process(batch):
+        if batch == [1]:
+            raise ValueError("boom")
+        processed.extend(batch)
+
+    processor = AsyncBatchProcessor(
+        process, max_batch_size=1, max_batch_interval=0, retry_backoff=0
+    )
+    processor.enqueue([1, 2])
+    processor.flush()
+    assert processed == [2]
+    stats = processor.stats()
+    assert stats.failed_batches == 1
+    assert stats.items == 2
+    assert stats.queue_depth == 0
+    processor.wait_until_all_processed()
+
+
+def test_reset_after_fork_drops_parent_items():
+    release = threading.Event()
+    processor = AsyncBatchProcessor(lambda batch: release.wait(), max_batch_size=1)
+    processor.enqueue([1, 2])
+    processor._after_fork_in_child()
+    assert processor.stats().queue_depth == 0
+    assert processor._workers == []
+    release.set()
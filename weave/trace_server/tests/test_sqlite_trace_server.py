@@ -0,0 +1,273 @@
+import datetime
+import threading
+
+import pytest
+
+from weave.trace_server import errors
+from weave.trace_server import sqlite_trace_server
+from weave.trace_server import trace_server_interface as tsi
+
+
+@pytest.fixture()
+def server(tmp_path):
+    server = sqlite_trace_server.SqliteTraceServer(str(tmp_path / "trace.db"))
+    server.setup_tables()
+    return server
+
+
+def _start(call_id: str, op_name: str = "op") -> tsi.CallStartReq:
+    return tsi.CallStartReq(
+        start=tsi.StartedCallSchemaForInsert(
+            project_id="e/p",
+            id=call_id,
+            trace_id="t",
+            op_name=op_name,
+            started_at=datetime.datetime.now(),
+            attributes={},
+            inputs={},
+        )
+    )
+
+
+def _end(call_id: str) -> tsi.CallEndReq:
+    return tsi.CallEndReq(
+        end=tsi.EndedCallSchemaForInsert(
+            project_id="e/p",
+            id=call_id,
+            ended_at=datetime.datetime.now(),
+            summary={},
+            output=1,
+        )
+    )
+
+
+def _call_ids(server, **filter) -> list[str]:
+    res = server.calls_query(
+        tsi.CallsQueryReq(project_id="e/p", filter=tsi._CallsFilter(**filter))
+    )
+    return [c.id for c in res.calls]
+
+
+def test_call_batch_commits_together(server, tmp_path):
+    other = sqlite_trace_server.SqliteTraceServer(str(tmp_path / "trace.db"))
+    seen_in_batch = []
+
+    def read_from_other_thread():
+        seen_in_batch.extend(_call_ids(other))
+
+    with server.call_batch():
+        for i in range(3):
+            server.call_start(_start(f"c{i}"))
+            server.call_end(_end(f"c{i}"))
+        t = threading.Thread(target=read_from_other_thread)
+        t.start()
+        t.join()
+
+    assert seen_in_batch == []
+    assert sorted(_call_ids(other)) == ["c0", "c1", "c2"]
+
+
+def test_call_batch_rolls_back_on_error(server):
+    with pytest.raises(ValueError):
+        with server.call_batch():
+            server.call_start(_start("c0"))
+            raise ValueError("boom")
+    assert _call_ids(server) == []
+
+
+def test_calls_query_binds_filter_values(server):
+    server.call_start(_start("c0", op_name="it's"))
+    server.call_start(_start("c1", op_name="other"))
+    assert _call_ids(server, op_names=["it's"]) == ["c0"]
+    assert _call_ids(server, call_ids=["c1", "' OR 1=1 --"]) == ["c1"]
+
+
+def test_calls_query_by_ref(server):
+    ref = "weave:///e/p/object/dataset:abc"
+    start = _start("c0")
+    start.start.inputs = {"dataset": ref, "row": ref + "/attr/rows/id/1"}
+    server.call_start(start)
+    other = _start("c1")
+    other.start.inputs = {"dataset": ref + "d"}
+    server.call_start(other)
+    server.call_end(_end("c1"))
+
+    assert _call_ids(server, input_refs=[ref]) == ["c0"]
+    assert _call_ids(server, input_refs=[ref + "/attr/rows/id/1"]) == ["c0"]
+    assert _call_ids(server, output_refs=[ref]) == []
+
+
+def test_call_lookups_use_indexes(server):
+    conn, cursor = sqlite_trace_server.get_conn_cursor(server.db_path)
+    cursor.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM calls WHERE project_id = ? AND trace_id = ?",
+        ("e/p", "t"),
+    )
+    assert "calls_trace" in str(cursor.fetchall())
+    cursor.execute(
+        """EXPLAIN QUERY PLAN SELECT call_id FROM call_refs
+        WHERE project_id = ? AND direction = ? AND ref = ?""",
+        ("e/p", "input", "r"),
+    )
+    assert "call_refs_ref" in str(cursor.fetchall())
+
+
+def test_setup_tables_migrates_existing_db(tmp_path):
+    db_path = str(tmp_path / "old.db")
+    conn, cursor = sqlite_trace_server.get_conn_cursor(db_path)
+    # calls table as created before migrations existed
+    cursor.execute(
+        """CREATE TABLE calls (
+            project_id TEXT, id TEXT PRIMARY KEY, trace_id TEXT, parent_id TEXT,
+            op_name TEXT, started_at TEXT, ended_at TEXT, exception TEXT,
+            attributes TEXT, inputs TEXT, input_refs TEXT, output TEXT,
+            output_refs TEXT, summary TEXT, wb_user_id TEXT, wb_run_id TEXT)"""
+    )
+    cursor.execute(
+        """INSERT INTO calls (project_id, id, trace_id, op_name, started_at,
+            attributes, inputs, input_refs)
+        VALUES ('e/p', 'c0', 't', 'op', '2024-01-01T00:00:00', '{}', '{}', ?)""",
+        ('["weave:///e/p/object/x:1", "weave:///e/p/object/x:1"]',),
+    )
+    conn.commit()
+
+    server = sqlite_trace_server.SqliteTraceServer(db_path)
+    server.setup_tables()
+    server.setup_tables()
+
+    assert _call_ids(server, input_refs=["weave:///e/p/object/x:1"]) == ["c0"]
+    cursor.execute("PRAGMA user_version")
+    assert cursor.fetchone()[0] == len(sqlite_trace_server._MIGRATIONS)
+
+
+def test_calls_query_cursor_pages(server):
+    # Same started_at for every call, so pages are split on the id.
+    started_at = datetime.datetime.now()
+    for i in range(7):
+        start = _start(f"c{i}")
+        start.start.started_at = started_at
+        server.call_start(start)
+
+    ids = []
+    cursor = None
+    while True:
+        res = server.calls_query(
+            tsi.CallsQueryReq(project_id="e/p", limit=3, cursor=cursor)
+        )
+        ids.extend(c.id for c in res.calls)
+        cursor = res.next_cursor
+        if cursor is None:
+            break
+    assert ids == [f"c{i}" for i in range(7)]
+
+    streamed = server.calls_query_stream(tsi.CallsQueryReq(project_id="e/p"))
+    assert [c.id for c in streamed] == ids
+
+
+def test_calls_query_rejects_bad_cursors(server):
+    res = server.calls_query(tsi.CallsQueryReq(project_id="e/p", limit=1))
+    assert res.next_cursor is None
+    with pytest.raises(errors.InvalidRequest):
+        server.calls_query(
+            tsi.CallsQueryReq(
+                project_id="e/p",
+                cursor="bm90IGEgY3Vyc29y",
+            )
+        )
+    server.call_start(_start("c0"))
+    res = server.calls_query(tsi.CallsQueryReq(project_id="e/p", limit=1))
+    with pytest.raises(errors.InvalidRequest):
+        server.calls_query(
+            tsi.CallsQueryReq(
+                project_id="e/p",
+                cursor=res.next_cursor,
+                sort_by=[tsi._SortBy(field="op_name", direction="asc")],
+            )
+        )
+
+
+def test_refs_read_batch_reads_each_object_and_table_once(server):
+    rows = [{"a": i} for i in range(600)]
+    table = server.table_create(
+        tsi.TableCreateReq(table=tsi.TableSchemaForInsert(project_id="e/p", rows=rows))
+    )
+    dataset_digest = server.obj_create(
+        tsi.ObjCreateReq(
+            obj=tsi.ObjSchemaForInsert(
+                project_id="e/p",
+                object_id="ds",
+                val={"rows": f"weave:///e/p/table/{table.digest}"},
+            )
+        )
+    ).digest
+    row_refs = [
+        f"weave:///e/p/object/ds:{dataset_digest}/attr/rows/id/{r.digest}/key/a"
+        for r in server.table_query(
+            tsi.TableQueryReq(project_id="e/p", digest=table.digest)
+        ).rows
+    ]
+
+    conn, _ = sqlite_trace_server.get_conn_cursor(server.db_path)
+    statements: list[str] = []
+    conn.set_trace_callback(statements.append)
+    try:
+        res = server.refs_read_batch(tsi.RefsReadBatchReq(refs=row_refs * 2))
+    finally:
+        conn.set_trace_callback(None)
+
+    assert res.vals == list(range(600)) * 2
+    # One objects query, and the 600 distinct rows in two chunks.
+    assert len(statements) == 3
+
+    with pytest.raises(sqlite_trace_server.NotFoundError):
+        server.refs_read_batch(
+            tsi.RefsReadBatchReq(refs=[f"weave:///e/p/object/ds:{'0' * 43}"])
+        )
+
+
+def test_refs_read_batch_reads_object_pairs_in_chunks(server):
+    obj_refs = []
+    for i in range(300):
+        digest = server.obj_create(
+            tsi.ObjCreateReq(
+                obj=tsi.ObjSchemaForInsert(project_id="e/p", object_id=f"o{i}", val=i)
+            )
+        ).digest
+        obj_refs.append(f"weave:///e/p/object/o{i}:{digest}")
+
+    conn, _ = sqlite_trace_server.get_conn_cursor(server.db_path)
+    statements: list[str] = []
+    conn.set_trace_callback(statements.append)
+    try:
+        res = server.refs_read_batch(tsi.RefsReadBatchReq(refs=obj_refs))
+    finally:
+        conn.set_trace_callback(None)
+
+    assert res.vals == list(range(300))
+    # Two values per pair, so 300 pairs take two queries.
+    assert len(statements) == 2
+
+
+def test_table_query_pages_filters_and_counts(server):
+    rows = [{"a": i} for i in range(10)]
+    table = server.table_create(
+        tsi.TableCreateReq(table=tsi.TableSchemaForInsert(project_id="e/p", rows=rows))
+    )
+
+    res = server.table_query(
+        tsi.TableQueryReq(
+            project_id="e/p", digest=table.digest, offset=4, limit=3, include_stats=True
+        )
+    )
+    assert [r.val["a"] for r in res.rows] == [4, 5, 6]
+    assert res.stats == tsi.TableQueryStats(count=10)
+
+    res = server.table_query(
+        tsi.TableQueryReq(
+            project_id="e/p",
+            digest=table.digest,
+            filter=tsi._TableRowFilter(row_digests=[res.rows[2].digest]),
+        )
+    )
+    assert [r.val["a"] for r in res.rows] == [6]
+    assert res.stats is None
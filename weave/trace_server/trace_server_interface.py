@@ -161,10 +161,17 @@ class CallsQueryReq(BaseModel):
     offset: typing.Optional[int] = None
     # Sort by multiple fields
     sort_by: typing.Optional[typing.List[_SortBy]] = None
+    # `next_cursor` of the previous page. Only the calls after the cursor in
+    # (started_at, id) order are returned, so paging through a project costs
+    # the same for every page. Can't be combined with `sort_by`.
+    cursor: typing.Optional[str] = None
 
 
 class CallsQueryRes(BaseModel):
     calls: typing.List[CallSchema]
+    # Set when the page is full and `sort_by` was not given. Pass it back as
+    # `cursor` to get the next page.
+    next_cursor: typing.Optional[str] = None
 
 
 class OpCreateReq(BaseModel):
@@ -256,10 +263,19 @@ class TableQueryReq(BaseModel):
     filter: typing.Optional[_TableRowFilter] = None
     limit: typing.Optional[int] = None
     offset: typing.Optional[int] = None
+    # Also return the table's row count in `stats`.
+    include_stats: typing.Optional[bool] = None
+
+
+class TableQueryStats(BaseModel):
+    # Rows in the table, ignoring filter, limit and offset.
+    count: int
 
 
 class TableQueryRes(BaseModel):
     rows: typing.List[TableRowSchema]
+    # Set when the request asked for `include_stats`.
+    stats: typing.Optional[TableQueryStats] = None
 
 
 class RefsReadBatchReq(BaseModel):
@@ -293,6 +309,11 @@ class TraceServerInterface:
     def ensure_project_exists(self, entity: str, project: str) -> None:
         pass
 
+    def flush(self) -> None:
+        # Servers that send writes in the background block here until the
+        # writes made so far have been sent.
+        pass
+
     # Call API
     @abc.abstractmethod
     def call_start(self, req: CallStartReq) -> CallStartRes:
@@ -310,6 +331,10 @@ class TraceServerInterface:
     def calls_query(self, req: CallsQueryReq) -> CallsQueryRes:
         ...
 
+    @abc.abstractmethod
+    def calls_query_stream(self, req: CallsQueryReq) -> typing.Iterator[CallSchema]:
+        ...
+
     # Op API
     @abc.abstractmethod
     def op_create(self, req: OpCreateReq) -> OpCreateRes:
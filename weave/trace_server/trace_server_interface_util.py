@@ -5,11 +5,14 @@ import typing
 import uuid
 
 from . import trace_server_interface as tsi
+from . import errors
 from . import refs_internal
 
 TRACE_REF_SCHEME = "weave"
 ARTIFACT_REF_SCHEME = "wandb-artifact"
 WILDCARD_ARTIFACT_VERSION_AND_PATH = ":*"
+# Most refs a single refs_read_batch request may resolve.
+MAX_REFS_READ_BATCH = 10000
 
 
 def generate_id() -> str:
@@ -81,3 +84,25 @@ def extract_refs_from_values(
 
     _visit(vals)
     return refs
+
+
+def encode_calls_cursor(call: tsi.CallSchema) -> str:
+    key = json.dumps([call.started_at.isoformat(), call.id])
+    return base64.urlsafe_b64encode(key.encode()).decode("ascii")
+
+
+def decode_calls_cursor(cursor: str) -> typing.Tuple[str, str]:
+    """Returns the (started_at isoformat, id) the cursor points at."""
+    try:
+        started_at, call_id = json.loads(base64.urlsafe_b64decode(cursor))
+    except (TypeError, ValueError):
+        raise errors.InvalidRequest(f"Invalid calls cursor: {cursor}")
+    return started_at, call_id
+
+
+def next_calls_cursor(
+    req: tsi.CallsQueryReq, calls: typing.List[tsi.CallSchema]
+) -> typing.Optional[str]:
+    if req.sort_by or not req.limit or len(calls) < req.limit:
+        return None
+    return encode_calls_cursor(calls[-1])
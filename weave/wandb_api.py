@@ -2,15 +2,22 @@
 # Weave interactions with the Weave API should go through this
 # module.
 
+import asyncio
+import http.cookiejar
+import os
+import threading
 import typing
+import weakref
 import graphql
 import gql
 import aiohttp
 import contextlib
 import contextvars
+import requests
 
 from gql.transport.aiohttp import AIOHTTPTransport
 from gql.transport.requests import RequestsHTTPTransport
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
 from . import engine_trace
@@ -96,9 +103,84 @@ def from_environment() -> typing.Generator[None, None, None]:
             reset_wandb_api_context(token)
 
 
+# Connections to the W&B API are pooled process wide, rather than opened for
+# each query. The pool lives in one HTTPAdapter, which sessions share by
+# mounting it. Credentials are sent with each request, so the shared session
+# is used by all users, and it never stores cookies from responses.
+
+_adapter: typing.Optional[HTTPAdapter] = None
+_session: typing.Optional[requests.Session] = None
+_pool_pid: typing.Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def _ensure_pool() -> None:
+    # Called with _pool_lock held.
+    global _adapter, _session, _pool_pid
+    # Pooled connections can't be shared with a forked process.
+    if _adapter is None or _session is None or _pool_pid != os.getpid():
+        _adapter = HTTPAdapter(pool_maxsize=weave_env.wandb_api_max_connections())
+        session = requests.Session()
+        session.cookies.set_policy(
+            http.cookiejar.DefaultCookiePolicy(allowed_domains=[])
+        )
+        session.mount("http://", _adapter)
+        session.mount("https://", _adapter)
+        _session = session
+        _pool_pid = os.getpid()
+
+
+def http_session() -> requests.Session:
+    with _pool_lock:
+        _ensure_pool()
+        return typing.cast(requests.Session, _session)
+
+
+def mount_pooled_connections(session: requests.Session) -> None:
+    """Sends session's requests over the process wide pool, keeping its own
+    auth, headers, cookies and proxies."""
+    with _pool_lock:
+        _ensure_pool()
+        adapter = typing.cast(HTTPAdapter, _adapter)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+
+# aiohttp connectors belong to an event loop, so the async path pools per loop.
+_connectors: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, aiohttp.TCPConnector
+] = weakref.WeakKeyDictionary()
+
+
+def aiohttp_connector() -> aiohttp.TCPConnector:
+    loop = asyncio.get_running_loop()
+    connector = _connectors.get(loop)
+    if connector is None or connector.closed:
+        connector = aiohttp.TCPConnector(limit=weave_env.wandb_api_max_connections())
+        _connectors[loop] = connector
+    return connector
+
+
+class _PooledRequestsHTTPTransport(RequestsHTTPTransport):
+    def connect(self) -> None:
+        self.session = http_session()  # type: ignore
+
+    def close(self) -> None:
+        # The session is shared, leave it open.
+        self.session = None
+
+
+def _query_name(query: graphql.DocumentNode) -> str:
+    operation = graphql.get_operation_ast(query)
+    if operation is None or operation.name is None:
+        return "anonymous"
+    return operation.name.value
+
+
 class WandbApiAsync:
-    def __init__(self) -> None:
-        self.connector = aiohttp.TCPConnector(limit=50)
+    @property
+    def connector(self) -> aiohttp.TCPConnector:
+        return aiohttp_connector()
 
     async def query(
         self, query: graphql.DocumentNode, **kwargs: typing.Any
@@ -134,8 +216,9 @@ class WandbApiAsync:
         # Closing the session just closes the connector, which we don't want anyway, so we don't
         # bother.
         client = gql.Client(transport=transport, fetch_schema_from_transport=False)
-        session = await client.connect_async(reconnecting=False)  # type: ignore
-        result = await session.execute(query, kwargs)
+        with tracer.trace("gql.%s" % _query_name(query)):
+            session = await client.connect_async(reconnecting=False)  # type: ignore
+            result = await session.execute(query, kwargs)
         # Manually reset the connection, bypassing the SSL bug, avoiding ERROR:asyncio:Unclosed client session
         await transport.session.close()
         return result
@@ -258,18 +341,16 @@ class WandbApi:
             if wandb_context.api_key is not None:
                 auth = HTTPBasicAuth("api", wandb_context.api_key)
         url_base = weave_env.wandb_base_url()
-        transport = RequestsHTTPTransport(
+        transport = _PooledRequestsHTTPTransport(
             url=url_base + "/graphql", headers=headers, cookies=cookies, auth=auth
         )
-        # Warning: we do not use the recommended context manager pattern, because we're
-        # using connector_owner to tell the session not to close our connection pool.
-        # There is a bug in aiohttp that causes session close to hang for the ssl_close_timeout
-        # which is 10 seconds by default. See issue: https://github.com/graphql-python/gql/issues/381
-        # Closing the session just closes the connector, which we don't want anyway, so we don't
-        # bother.
         client = gql.Client(transport=transport, fetch_schema_from_transport=False)
-        session = client.connect_sync()  # type: ignore
-        return session.execute(query, kwargs)
+        with tracer.trace("gql.%s" % _query_name(query)):
+            session = client.connect_sync()  # type: ignore
+            try:
+                return session.execute(query, kwargs)
+            finally:
+                client.close_sync()  # type: ignore
 
     SERVER_INFO_QUERY = gql.gql(
         """
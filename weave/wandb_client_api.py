@@ -32,6 +32,20 @@ def assert_wandb_authenticated() -> None:
         )
 
 
+def wandb_gql_client() -> typing.Any:
+    """The public API's GQL client, sending its queries over weave's pooled
+    connections.
+
+    The client keeps the public API's url, credentials, proxies and retries,
+    only its connections come from the shared pool.
+    """
+    client = wandb_public_api().client
+    from . import wandb_api
+
+    wandb_api.mount_pooled_connections(client._client.transport.session)
+    return client
+
+
 def query_with_retry(
     query_str: str,
     variables: dict[str, typing.Any] = {},
@@ -41,7 +55,7 @@ def query_with_retry(
         raise ValueError("num_timeout_retries must be >= 0")
     for attempt_no in range(num_timeout_retries + 1):
         try:
-            return wandb_public_api().client.execute(
+            return wandb_gql_client().execute(
                 gql(query_str),
                 variable_values=variables,
             )
@@ -20,6 +20,7 @@ from . import weave_http
 from . import wandb_api
 from . import environment as weave_env
 from . import cache
+from . import request_coalescing
 
 
 from urllib import parse
@@ -71,6 +72,22 @@ def _local_path_and_download_url(
         )
 
 
+def _manifest_entry_md5_hex(
+    manifest: artifact_wandb.WandbArtifactManifest, path: str
+) -> typing.Optional[str]:
+    # The digest of reference entries is not necessarily the md5 of the file.
+    manifest_entry = manifest.get_entry_by_path(path)
+    if manifest_entry is None or manifest_entry.get("ref") is not None:
+        return None
+    return hashutil.b64_to_hex_id(hashutil.B64MD5(manifest_entry["digest"]))
+
+
+# Downloads in progress in this process, by local path.
+_downloads: request_coalescing.SingleFlight[None] = request_coalescing.SingleFlight(
+    name="wandb_file_manager.download"
+)
+
+
 class WandbFileManagerAsync:
     def __init__(
         self,
@@ -323,18 +340,7 @@ class WandbFileManager:
             file_path = f"wandb_file_manager/{path}"
             if self.fs.exists(file_path):
                 return file_path
-            wandb_api_context = wandb_api.get_wandb_api_context()
-            headers = None
-            cookies = None
-            auth = None
-            if wandb_api_context is not None:
-                headers = wandb_api_context.headers
-                cookies = wandb_api_context.cookies
-                if wandb_api_context.api_key is not None:
-                    auth = HTTPBasicAuth("api", wandb_api_context.api_key)
-            self.http.download_file(
-                download_url, file_path, headers=headers, cookies=cookies, auth=auth
-            )
+            self._download(download_url, file_path)
             return file_path
 
     def ensure_file(
@@ -353,6 +359,20 @@ class WandbFileManager:
             file_path, download_url = res
             if self.fs.exists(file_path):
                 return file_path
+            manifest = self.manifest(art_uri)
+            md5_hex = None
+            if manifest is not None:
+                md5_hex = _manifest_entry_md5_hex(manifest, path)
+            self._download(download_url, file_path, md5_hex)
+            return file_path
+
+    def _download(
+        self, download_url: str, file_path: str, md5_hex: typing.Optional[str] = None
+    ) -> None:
+        def download() -> None:
+            # Another thread may have finished downloading it meanwhile.
+            if self.fs.exists(file_path):
+                return
             wandb_api_context = wandb_api.get_wandb_api_context()
             headers = None
             cookies = None
@@ -363,9 +383,17 @@ class WandbFileManager:
                 if wandb_api_context.api_key is not None:
                     auth = HTTPBasicAuth("api", wandb_api_context.api_key)
             self.http.download_file(
-                download_url, file_path, headers=headers, cookies=cookies, auth=auth
+                download_url,
+                file_path,
+                headers=headers,
+                cookies=cookies,
+                auth=auth,
+                md5_hex=md5_hex,
+                range_workers=weave_env.download_range_workers(),
             )
-            return file_path
+
+        # Threads asking for the same file share one download.
+        _downloads.do(self.fs.path(file_path), download)
 
     def direct_url(
         self, art_uri: artifact_wandb.WeaveWBArtifactURI
@@ -166,6 +166,10 @@ class Call:
         )
 
 
+CALLS_ITER_MIN_PAGE_SIZE = 10
+CALLS_ITER_MAX_PAGE_SIZE = 1000
+
+
 class CallsIter:
     server: TraceServerInterface
     filter: _CallsFilter
@@ -186,15 +190,21 @@ class CallsIter:
         raise IndexError(f"Index {key} out of range")
 
     def __iter__(self) -> typing.Iterator[TraceObject]:
-        page_index = 0
-        page_size = 10
+        # Pages start small so the first calls come back quickly, then grow
+        # so long iterations make few round trips. Servers return a cursor
+        # to continue from, which keeps every page as cheap as the first;
+        # offsets are only used if the server doesn't support cursors.
+        page_size = CALLS_ITER_MIN_PAGE_SIZE
+        offset = 0
+        cursor = None
         entity, project = self.project_id.split("/")
         while True:
             response = self.server.calls_query(
                 CallsQueryReq(
                     project_id=self.project_id,
                     filter=self.filter,
-                    offset=page_index * page_size,
+                    cursor=cursor,
+                    offset=None if cursor else offset,
                     limit=page_size,
                 )
             )
@@ -206,7 +216,9 @@ class CallsIter:
                 # yield make_trace_obj(call, ValRef(call.id), self.server, None)
             if len(page_data) < page_size:
                 break
-            page_index += 1
+            offset += len(page_data)
+            cursor = response.next_cursor
+            page_size = min(page_size * 2, CALLS_ITER_MAX_PAGE_SIZE)
 
 
 def make_client_call(
@@ -268,6 +280,10 @@ class WeaveClient:
         if ensure_project_exists:
             self.server.ensure_project_exists(entity, project)
 
+    def flush(self) -> None:
+        """Blocks until the calls logged so far have been sent to the server."""
+        self.server.flush()
+
     def ref_is_own(self, ref: Ref) -> bool:
         return isinstance(ref, Ref)
 
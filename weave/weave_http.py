@@ -2,6 +2,9 @@
 # interactions with http servers should go through this interface.
 
 import asyncio
+import concurrent.futures
+import hashlib
+import threading
 import time
 import os
 import aiohttp
@@ -14,6 +17,7 @@ import requests.auth
 
 
 from . import engine_trace
+from . import errors
 from . import filesystem
 from . import server_error_handling
 
@@ -131,6 +135,12 @@ class HttpAsync:
                     )
 
 
+# Bytes read from a response at a time.
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Size of each ranged GET when downloading with more than one worker.
+DOWNLOAD_RANGE_SIZE = 16 * 1024 * 1024
+
+
 class Http:
     def __init__(self, fs: filesystem.Filesystem) -> None:
         self.fs = fs
@@ -142,6 +152,94 @@ class Http:
     def __exit__(self, *args: typing.Any) -> None:
         self.session.close()
 
+    def _get(
+        self,
+        url: str,
+        headers: typing.Optional[dict[str, str]],
+        cookies: typing.Optional[dict[str, str]],
+        auth: typing.Optional[requests.auth.HTTPBasicAuth],
+        ok_statuses: typing.Tuple[int, ...] = (200, 206),
+    ) -> requests.Response:
+        # yarl.URL encoded=True is very important! Otherwise aiohttp
+        # will encode the url again and we'll get a 404 for things like
+        # signed URLs
+        r = self.session.get(
+            str(yarl.URL(url, encoded=True)),
+            headers=headers,
+            cookies=cookies,
+            auth=auth,
+            stream=True,
+        )
+        if r.status_code not in ok_statuses:
+            r.close()
+            raise server_error_handling.WeaveInternalHttpException.from_code(
+                r.status_code, "Download failed"
+            )
+        return r
+
+    def _download_ranges(
+        self,
+        url: str,
+        f: typing.IO,
+        headers: typing.Optional[dict[str, str]],
+        cookies: typing.Optional[dict[str, str]],
+        auth: typing.Optional[requests.auth.HTTPBasicAuth],
+        workers: int,
+    ) -> None:
+        lock = threading.Lock()
+
+        def download_range(start: int, end: typing.Optional[int]) -> None:
+            range_headers = {
+                **(headers or {}),
+                "Range": f"bytes={start}-{'' if end is None else end}",
+            }
+            # The first range of an empty file can't be satisfied.
+            ok_statuses = (200, 206, 416) if start == 0 else (200, 206)
+            with self._get(url, range_headers, cookies, auth, ok_statuses) as r:
+                if r.status_code == 416:
+                    return
+                if start != 0 and r.status_code != 206:
+                    raise errors.WeaveInternalError(
+                        "Server ignored range request for %s" % url
+                    )
+                if start == 0 and r.status_code == 206:
+                    content_range = r.headers.get("Content-Range", "")
+                    total = content_range.rsplit("/", 1)[-1]
+                    if not total.isdigit():
+                        # Without a size the rest can't be split into ranges.
+                        size[0] = None
+                        return
+                    size[0] = int(total)
+                offset = start
+                for data in r.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    with lock:
+                        f.seek(offset)
+                        f.write(data)
+                    offset += len(data)
+
+        # The first range tells us the size. Servers that don't support
+        # ranges send the whole file.
+        size: list[typing.Optional[int]] = [0]
+        download_range(0, DOWNLOAD_RANGE_SIZE - 1)
+        if size[0] is None:
+            with self._get(url, headers, cookies, auth) as r:
+                for data in r.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    f.write(data)
+            return
+        total_size = size[0]
+        rest = range(DOWNLOAD_RANGE_SIZE, total_size, DOWNLOAD_RANGE_SIZE)
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            futures = [
+                executor.submit(
+                    download_range,
+                    start,
+                    min(start + DOWNLOAD_RANGE_SIZE, total_size) - 1,
+                )
+                for start in rest
+            ]
+            for future in futures:
+                future.result()
+
     def download_file(
         self,
         url: str,
@@ -149,24 +247,33 @@ class Http:
         headers: typing.Optional[dict[str, str]] = None,
         cookies: typing.Optional[dict[str, str]] = None,
         auth: typing.Optional[requests.auth.HTTPBasicAuth] = None,
+        md5_hex: typing.Optional[str] = None,
+        range_workers: int = 1,
     ) -> None:
+        """Downloads url to path, a chunk at a time.
+
+        The file only appears at path once it is complete, and, if md5_hex is
+        given, has the expected contents. With range_workers > 1, parts of
+        the file are downloaded in parallel with ranged GETs.
+        """
         self.fs.makedirs(os.path.dirname(path), exist_ok=True)
         with tracer.trace("download_file_task"):
             # TODO: Error handling when no file or manifest
-
-            # yarl.URL encoded=True is very important! Otherwise aiohttp
-            # will encode the url again and we'll get a 404 for things like
-            # signed URLs
-            with self.session.get(
-                str(yarl.URL(url, encoded=True)),
-                headers=headers,
-                cookies=cookies,
-                auth=auth,
-            ) as r:
-                if r.status_code == 200:  # type: ignore
-                    with self.fs.open_write(path, mode="wb") as f:
-                        f.write(r.content)  # type: ignore
+            md5 = hashlib.md5() if md5_hex is not None else None
+            with self.fs.open_write(path, mode="w+b") as f:
+                if range_workers > 1:
+                    self._download_ranges(url, f, headers, cookies, auth, range_workers)
+                    if md5 is not None:
+                        f.seek(0)
+                        for data in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+                            md5.update(data)
                 else:
-                    raise server_error_handling.WeaveInternalHttpException.from_code(
-                        r.status_code, "Download failed"  # type: ignore
+                    with self._get(url, headers, cookies, auth) as r:
+                        for data in r.iter_content(DOWNLOAD_CHUNK_SIZE):
+                            f.write(data)
+                            if md5 is not None:
+                                md5.update(data)
+                if md5 is not None and md5.hexdigest() != md5_hex:
+                    raise errors.WeaveInternalError(
+                        "Downloaded file %s does not match its md5" % url
                     )
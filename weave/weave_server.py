@@ -5,9 +5,7 @@ import pathlib
 import time
 import traceback
 import sys
-import base64
 import typing
-import zlib
 import urllib.parse
 import requests
 from flask import json
@@ -30,6 +28,8 @@ from weave import engine_trace
 from weave import environment
 from weave import logs
 from weave import filesystem
+from weave import request_capture
+from weave import arrow_stream
 from weave.server_error_handling import client_safe_http_exceptions_as_werkzeug
 from weave import storage
 from weave import wandb_api
@@ -305,18 +305,15 @@ def execute():
     """Execute endpoint used by WeaveJS."""
     with tracer.trace("read_request"):
         req_bytes = request.data
-    req_compressed = zlib.compress(req_bytes)
-    req_b64 = base64.b64encode(req_compressed).decode("ascii")
-    logging.info(
-        "Execute request (zlib): %s",
-        req_b64,
-    )
 
     if not request.json:
         abort(400, "Request body must be JSON.")
     if "graphs" not in request.json:
         abort(400, "Request body must contain a 'graphs' key.")
 
+    if request_capture.should_capture(request.headers):
+        request_capture.capture_request(req_bytes)
+
     # Simulate browser/server latency
     # import time
     # time.sleep(0.1)
@@ -324,10 +321,13 @@ def execute():
     # use a single memartifact to serialize the entire response.
     # fixes https://weights-biases.sentry.io/issues/4022569419
 
+    stream_arrow = arrow_stream.accepts(request.accept_mimetypes)
     execute_args = {
         "request": request.json,
         "deref": True,
-        "serialize_fn": storage.make_js_serializer(),
+        "serialize_fn": arrow_stream.make_serializer()
+        if stream_arrow
+        else storage.make_js_serializer(),
     }
     root_span = tracer.current_root_span()
     tag_store.record_current_tag_store_size()
@@ -359,8 +359,12 @@ def execute():
                     + urllib.parse.quote(profile_filename),
                 )
 
-    fixed_response = response.results.safe_map(weavejs_fixes.fixup_data)
-    response_payload = _value_or_errors_to_response(fixed_response)
+    if stream_arrow:
+        # Fixed up while streaming, arrow results don't need it.
+        response_payload = _value_or_errors_to_response(response.results)
+    else:
+        fixed_response = response.results.safe_map(weavejs_fixes.fixup_data)
+        response_payload = _value_or_errors_to_response(fixed_response)
 
     if root_span is not None:
         root_span.set_metric("request_size", len(req_bytes), True)
@@ -376,6 +380,11 @@ def execute():
     if request.headers.get("x-weave-include-execution-time"):
         response_payload["execution_time"] = (elapsed) * 1000
 
+    if stream_arrow:
+        return Response(
+            arrow_stream.encode_response(response_payload, weavejs_fixes.fixup_data),
+            mimetype=arrow_stream.MIMETYPE,
+        )
     return response_payload
 
 
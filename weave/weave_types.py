@@ -1,3 +1,5 @@
+import collections
+import contextlib
 import dataclasses
 import datetime
 import typing
@@ -7,6 +9,7 @@ import keyword
 import contextvars
 import json
 import pydantic
+import threading
 from collections.abc import Iterable
 
 
@@ -170,6 +173,17 @@ class TypeRegistry:
         if is_relocatable_object_type(d):
             d = typing.cast(dict, d)
             return deserialize_relocatable_object_type(d)
+        if _parsing_type_dict.get():
+            # Inner types are cached as part of the outer one.
+            return TypeRegistry._type_from_dict(d)
+        try:
+            key = d if isinstance(d, str) else json.dumps(d)
+        except TypeError:
+            return TypeRegistry._type_from_dict(d)
+        return _type_dict_cache.get(key, d)
+
+    @staticmethod
+    def _type_from_dict(d: typing.Union[str, dict]) -> "Type":
         # The javascript code sends simple types as just strings
         # instead of {'type': 'string'} for example
         type_name = d["type"] if isinstance(d, dict) else d
@@ -184,10 +198,229 @@ class TypeRegistry:
         return type_.from_dict(d)
 
 
+class _TypeDictCache:
+    """Parsed types by the json encoding of their type dicts.
+
+    Types are immutable, so every caller shares the same instance. Board
+    requests repeat the same large types on hundreds of nodes. Least recently
+    used types are evicted first once over max_size.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._types: collections.OrderedDict[str, "Type"] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._types)
+
+    def get(self, key: str, d: typing.Union[str, dict]) -> "Type":
+        with self._lock:
+            t = self._types.get(key)
+            if t is not None:
+                self._types.move_to_end(key)
+                return t
+        token = _parsing_type_dict.set(True)
+        try:
+            t = TypeRegistry._type_from_dict(d)
+        finally:
+            _parsing_type_dict.reset(token)
+        with self._lock:
+            self._types[key] = t
+            if len(self._types) > self.max_size:
+                self._types.popitem(last=False)
+        return t
+
+    def clear(self) -> None:
+        with self._lock:
+            self._types.clear()
+
+
+TYPE_DICT_CACHE_SIZE = 10000
+_type_dict_cache = _TypeDictCache(TYPE_DICT_CACHE_SIZE)
+_parsing_type_dict: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "_parsing_type_dict", default=False
+)
+
+
+# Per class, since dataclasses.fields is slow. These are cleared with the
+# other caches whenever a Type is subclassed.
+_type_class_fields: dict[type, typing.Optional[tuple[str, ...]]] = {}
+_type_class_attrs: dict[type, tuple[str, ...]] = {}
+
+
+def _type_fields(cls: type) -> typing.Optional[tuple[str, ...]]:
+    """The fields of a Type class, or None if its instances are initialized
+    by their own __init__ rather than by a dataclass."""
+    try:
+        return _type_class_fields[cls]
+    except KeyError:
+        pass
+    init_class = next(c for c in cls.__mro__ if "__init__" in c.__dict__)
+    fields: typing.Optional[tuple[str, ...]] = None
+    if "__dataclass_fields__" in init_class.__dict__:
+        fields = tuple(f.name for f in dataclasses.fields(cls))
+    _type_class_fields[cls] = fields
+    return fields
+
+
+def _public_attrs(t: "Type") -> dict[str, typing.Any]:
+    return {k: v for k, v in t.__dict__.items() if not k.startswith("_")}
+
+
+_STRICT_EQ_SCALAR_TYPES = (str, int, float, bool, bytes, type(None))
+
+
+def _strictly_equal(a: typing.Any, b: typing.Any) -> bool:
+    """Structural type equality that, unlike Type.__eq__, is sensitive to
+    union member and dict key order, and compares the classes of types
+    (ObjectType classes created during deserialization compare equal by
+    name). Values inside types that aren't plain data only match
+    themselves."""
+    if a is b:
+        return True
+    a_class = a.__class__
+    if a_class is not b.__class__:
+        return False
+    if isinstance(a, Type):
+        if hash(a) != hash(b):
+            return False
+        fields = _type_fields(a_class)
+        if fields is None:
+            return _strictly_equal(_public_attrs(a), _public_attrs(b))
+        return all(
+            _strictly_equal(getattr(a, name), getattr(b, name)) for name in fields
+        )
+    if a_class is dict:
+        return len(a) == len(b) and all(
+            _strictly_equal(a_k, b_k) and _strictly_equal(a_v, b_v)
+            for (a_k, a_v), (b_k, b_v) in zip(a.items(), b.items())
+        )
+    if a_class is list or a_class is tuple:
+        return len(a) == len(b) and all(_strictly_equal(x, y) for x, y in zip(a, b))
+    if a_class is set or a_class is frozenset:
+        return a == b and all(x.__class__ in _STRICT_EQ_SCALAR_TYPES for x in a)
+    if a_class in _STRICT_EQ_SCALAR_TYPES:
+        return a == b
+    return False
+
+
+class _TypePairKey:
+    __slots__ = ("a", "b", "_hash")
+
+    def __init__(self, a: "Type", b: "Type") -> None:
+        self.a = a
+        self.b = b
+        self._hash = hash((a, b))
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, other: typing.Any) -> bool:
+        return _strictly_equal(self.a, other.a) and _strictly_equal(self.b, other.b)
+
+
+@dataclasses.dataclass
+class TypePairCacheStats:
+    hits: int = 0
+    misses: int = 0
+
+
+_MISSING = object()
+
+
+class _TypePairCacheLocal(threading.local):
+    computing = False
+
+
+class _TypePairCache:
+    """Results of a pure function of two types, like assign_type and
+    merge_types.
+
+    Dispatch and refinement ask the same questions about the same types over
+    and over, across requests. Keys are compared with _strictly_equal, so a
+    cached result is only reused for inputs that can't produce a different
+    one. Only the outermost call is cached: a hit skips the whole recursion,
+    while caching every nested call costs more in lookups than it saves.
+    Pairs of types without attributes (Int, String...) are cheaper to compute
+    than to look up and aren't cached. The oldest results are evicted first
+    once over max_size.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        # Reads don't take the lock, only writes.
+        self._results: dict[_TypePairKey, typing.Any] = {}
+        self._lock = threading.Lock()
+        self._local = _TypePairCacheLocal()
+        self._stats = TypePairCacheStats()
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def get(
+        self,
+        a: "Type",
+        b: "Type",
+        fn: typing.Callable[["Type", "Type"], typing.Any],
+    ) -> typing.Any:
+        local = self._local
+        if local.computing or not (
+            _type_fields(a.__class__) or _type_fields(b.__class__)
+        ):
+            return fn(a, b)
+        try:
+            key = _TypePairKey(a, b)
+        except TypeError:
+            return fn(a, b)
+        result = self._results.get(key, _MISSING)
+        if result is not _MISSING:
+            self._stats.hits += 1
+            return result
+        self._stats.misses += 1
+        with self.uncached():
+            result = fn(a, b)
+        with self._lock:
+            self._results[key] = result
+            if len(self._results) > self.max_size:
+                del self._results[next(iter(self._results))]
+        return result
+
+    @contextlib.contextmanager
+    def uncached(self) -> typing.Iterator[None]:
+        local = self._local
+        computing = local.computing
+        local.computing = True
+        try:
+            yield
+        finally:
+            local.computing = computing
+
+    def stats(self) -> TypePairCacheStats:
+        # Counts may be slightly off, they're updated without the lock.
+        return dataclasses.replace(self._stats)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+
+TYPE_PAIR_CACHE_SIZE = 50000
+_assign_type_cache = _TypePairCache(TYPE_PAIR_CACHE_SIZE)
+_merge_types_cache = _TypePairCache(TYPE_PAIR_CACHE_SIZE)
+
+
 def _clear_global_type_class_cache():
     instance_class_to_potential_type.cache_clear()
     type_name_to_type_map.cache_clear()
     type_name_to_type.cache_clear()
+    # Types that were unknown may be defined now.
+    _type_dict_cache.clear()
+    # Results may depend on the bases of classes, which are looked up by name.
+    _assign_type_cache.clear()
+    _merge_types_cache.clear()
+    _type_class_fields.clear()
+    _type_class_attrs.clear()
 
 
 def _cached_hash(self):
@@ -264,21 +497,24 @@ class Type(metaclass=_TypeSubclassWatcher):
 
     @classmethod
     def type_attrs(cls):
-        type_attrs = []
-        for field in dataclasses.fields(cls):
-            if (inspect.isclass(field.type) and issubclass(field.type, Type)) or (
-                field.type.__origin__ == typing.Union
-                and any(issubclass(a, Type) for a in field.type.__args__)
-            ):
-                type_attrs.append(field.name)
-        return type_attrs
+        type_attrs = _type_class_attrs.get(cls)
+        if type_attrs is None:
+            type_attrs = []
+            for field in dataclasses.fields(cls):
+                if (inspect.isclass(field.type) and issubclass(field.type, Type)) or (
+                    field.type.__origin__ == typing.Union
+                    and any(issubclass(a, Type) for a in field.type.__args__)
+                ):
+                    type_attrs.append(field.name)
+            type_attrs = _type_class_attrs[cls] = tuple(type_attrs)
+        return list(type_attrs)
 
     @property
     def type_vars_tuple(self):
-        type_vars = []
-        for field in self.type_attrs():
-            type_vars.append((field, getattr(self, field)))
-        return tuple(type_vars)
+        return tuple(
+            (field, getattr(self, field))
+            for field in _type_class_attrs.get(self.__class__) or self.type_attrs()
+        )
 
     @property
     def type_vars(self) -> dict[str, "Type"]:
@@ -326,6 +562,9 @@ class Type(metaclass=_TypeSubclassWatcher):
         return self._instance_classes()[-1]
 
     def assign_type(self, next_type: "Type") -> bool:
+        return _assign_type_cache.get(self, next_type, Type._assign_type_uncached)
+
+    def _assign_type_uncached(self, next_type: "Type") -> bool:
         # assign_type needs to be as fast as possible, so there are optimizations
         # throughout this code path, like checking for class equality instead of using isinstance
 
@@ -855,11 +1094,14 @@ class List(Type):
         if not obj:
             return cls(UnknownType())
         list_obj_type = TypeRegistry.type_of(obj[0])
-        for item in obj[1:]:
-            obj_type = TypeRegistry.type_of(item)
-            if obj_type is None:
-                raise Exception("can't detect type for object: %s" % item)
-            list_obj_type = merge_types(list_obj_type, obj_type)
+        # Item types are new instances, that aren't worth hashing to look up
+        # in the cache.
+        with _merge_types_cache.uncached():
+            for item in obj[1:]:
+                obj_type = TypeRegistry.type_of(item)
+                if obj_type is None:
+                    raise Exception("can't detect type for object: %s" % item)
+                list_obj_type = merge_types(list_obj_type, obj_type)
         return cls(list_obj_type)
 
     def _assign_type_inner(self, next_type):
@@ -1571,6 +1813,12 @@ def merge_types(a: Type, b: Type) -> Type:
     This implementation must match list.concat implementations (which is the only
     way to extend a list in Weave). Ie list.concat(list[a], [b]) -> list[merge_types(a, b)]
     """
+    if a == b:
+        return a
+    return _merge_types_cache.get(a, b, _merge_types)
+
+
+def _merge_types(a: Type, b: Type) -> Type:
     from .language_features.tagging import tagged_value_type
 
     if a == b:
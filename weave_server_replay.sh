@@ -1,3 +1,3 @@
 #!/bin/sh
 
-WEAVE_SERVER_DEBUG=true WEAVE_SERVER_ENABLE_LOGGING=true FLASK_APP=weave.weave_server flask run --port 9994
+WEAVE_SERVER_DEBUG=true WEAVE_SERVER_ENABLE_LOGGING=true WEAVE_REQUEST_CAPTURE_SAMPLE_RATE=1 FLASK_APP=weave.weave_server flask run --port 9994